@@ -0,0 +1,51 @@
+# Sequential vs parallel loading of the investors of a user (load_all_investors prints the time taken)
+# The investors are loaded from a temp copy of the user's data with each investor file copied <copies> times
+# Run from the project folder: python -m benchmarks.investors_load [user_id] [copies]
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import model.user as user_module
+
+
+def _ready(_):
+    return os.getpid()
+
+def pool_startup_seconds(workers):
+    # Starting the loader processes (each imports the model) - paid on every parallel load
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        list(pool.map(_ready, range(workers)))
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    user_id = sys.argv[1] if len(sys.argv) > 1 else "Hemant"
+    copies = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    data_folder = Path("data").resolve()
+    with tempfile.TemporaryDirectory() as work_folder:
+        user_folder = Path(work_folder) / "data" / user_id
+        user_folder.mkdir(parents=True)
+        shutil.copytree(data_folder / "common", Path(work_folder) / "data" / "common")
+        # NAVs as saved - not refreshed from AMFI during the benchmark
+        (Path(work_folder) / "data" / "common" / "nav.refresh.json").write_text(json.dumps({"checked_at": time.time()}))
+        shutil.copy(data_folder / user_id / "mf_master.json", user_folder)
+        for investor_file in (data_folder / user_id).glob("*_investments.json"):
+            for copy in range(copies):
+                name = investor_file.name.replace("_investments.json", f"_{copy}_investments.json" if copy else
+                                                  "_investments.json")
+                shutil.copy(investor_file, user_folder / name)
+        os.chdir(work_folder)
+
+        print(f"Loader process pool startup: {pool_startup_seconds(1):.3f}s")
+        user = user_module.User(user_id)
+        txns = sum(len(investor.txn_store.txns) for investor in user)
+        print(f"{len(user.investors)} investors, {txns} txns, {os.cpu_count()} CPUs")
+        for parallel in (False, True):
+            user.load_all_investors(parallel)
@@ -0,0 +1,58 @@
+# FIFO matching of lots: the earlier step by step matcher vs the vectorized match_fifo
+# Run from the project folder: python -m benchmarks.lot_matching
+import timeit
+from datetime import date
+
+import numpy as np
+
+from model.txn_store import match_fifo
+
+
+def match_fifo_by_step(buy_units, buy_dates, sell_units, sell_dates):
+    # Earlier step by step matcher of one investment
+    unmatched_buys, unmatched_sells = list(buy_units), list(sell_units)
+    lots = []
+    i_sell, i_buy = 0, 0
+    while i_sell < len(unmatched_sells):
+        if i_buy >= len(unmatched_buys) or sell_dates[i_sell] < buy_dates[i_buy]:
+            break
+        matched_units = min(unmatched_sells[i_sell], unmatched_buys[i_buy])
+        lots.append((i_buy, i_sell, matched_units))
+        unmatched_sells[i_sell] = round(unmatched_sells[i_sell] - matched_units, 4)
+        unmatched_buys[i_buy] = round(unmatched_buys[i_buy] - matched_units, 4)
+        if unmatched_sells[i_sell] <= 0:
+            i_sell += 1
+        if unmatched_buys[i_buy] <= 0:
+            i_buy += 1
+    return lots
+
+
+if __name__ == '__main__':
+    # Synthetic folios of 10k txns (60% buys)
+    rng = np.random.default_rng(0)
+    folios = 10
+    is_buy = rng.random((folios, 10_000)) < 0.6
+    is_buy[:, 0] = True
+    units = np.round(rng.uniform(1, 500, is_buy.shape), 3)
+    dates = np.cumsum(rng.integers(0, 3, is_buy.shape), axis=1) + date(2010, 1, 1).toordinal()
+    # Sell at most what is held (so that every folio is matched to the end)
+    held = np.cumsum(np.where(is_buy, units, 0), axis=1)
+    units = np.where(is_buy, units, np.round(np.minimum(units, held * 0.05), 3))
+    folio_txns = [(units[f][is_buy[f]], dates[f][is_buy[f]], units[f][~is_buy[f]], dates[f][~is_buy[f]])
+                  for f in range(folios)]
+    buys = [np.full(len(b), f) for f, (b, _, _, _) in enumerate(folio_txns)]
+    sells = [np.full(len(s), f) for f, (_, _, s, _) in enumerate(folio_txns)]
+    args = (np.concatenate(buys), np.concatenate([b for b, _, _, _ in folio_txns]),
+            np.concatenate([d for _, d, _, _ in folio_txns]),
+            np.concatenate(sells), np.concatenate([s for _, _, s, _ in folio_txns]),
+            np.concatenate([d for _, _, _, d in folio_txns]), folios)
+
+    def by_step():
+        return [match_fifo_by_step(b.tolist(), d.tolist(), s.tolist(), sd.tolist()) for b, d, s, sd in folio_txns]
+
+    lots_by_step = sum(len(lots) for lots in by_step())
+    lots_vectorized = len(match_fifo(*args)[2])
+    for label, matcher, lots in (("step by step", by_step, lots_by_step),
+                                 ("vectorized", lambda: match_fifo(*args), lots_vectorized)):
+        seconds = min(timeit.repeat(matcher, number=1, repeat=5))
+        print(f"{label:>13}: {folios} folios x 10k txns, {lots} lots in {seconds * 1000:.1f} ms")
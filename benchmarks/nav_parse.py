@@ -0,0 +1,49 @@
+# Parsing of AMFI NAV text: the earlier per-line regex parser vs the vectorized parse_nav_text
+# Both parse the same NAVOpen.txt format text - made from the NAVAll archive by dropping its Repurchase and Sale
+# Price columns (on the archive itself the regex takes the Sale Price as NAV and drops rows without one)
+# Run from the project folder: python -m benchmarks.nav_parse
+import re
+import timeit
+from pathlib import Path
+
+import pandas as pd
+
+import utils.utils as utils
+from model.nav import parse_nav_text
+
+
+def parse_nav_text_by_line(nav_file_text, min_year=2024):
+    # Earlier per-line regex parser
+    pattern = re.compile(r'^([0-9]{6});(.*?);.*?;.*?;([0-9.]+);([0-9]{2}-[a-zA-Z]{3}-(20[0-9][0-9]))$')
+    nav_rows = []
+    for line in nav_file_text.splitlines():
+        match = pattern.match(line)
+        if match:
+            amfi_code, isin, nav, nav_date, nav_year = match.groups()
+            if int(nav_year) >= min_year:
+                nav_rows.append({'isin': isin, 'nav': float(nav), 'nav_date': nav_date})
+    nav_df = pd.DataFrame(nav_rows)
+    nav_df["nav_date"] = nav_df["nav_date"].apply(utils.normalize_date)
+    return nav_df
+
+
+def nav_open_text(nav_all_text):
+    # NAVAll archive lines (8 columns) without the Repurchase Price and Sale Price columns (as in NAVOpen.txt)
+    lines = []
+    for line in nav_all_text.splitlines():
+        fields = line.split(";")
+        lines.append(";".join(fields[:5] + fields[7:]) if len(fields) == 8 else line)
+    return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    nav_text = nav_open_text((Path("data") / "NAVAll_31Jan2018.txt").read_text(encoding="utf-8"))
+    results = {}
+    for label, parser in (("regex per line", parse_nav_text_by_line), ("vectorized", parse_nav_text)):
+        results[label] = parser(nav_text, min_year=2018)
+        seconds = min(timeit.repeat(lambda: parser(nav_text, min_year=2018), number=1, repeat=5))
+        print(f"{label:>15}: {len(results[label])} rows in {seconds * 1000:.1f} ms")
+    by_line, vectorized = results.values()
+    same = (len(by_line) == len(vectorized) and (by_line["isin"].to_numpy() == vectorized["isin"].to_numpy()).all()
+            and (by_line["nav"].to_numpy() == vectorized["nav"].to_numpy()).all())
+    print("Same NAVs" if same else "NAVs differ")
@@ -0,0 +1,121 @@
+# Memory of the txn and matched txn objects of a synthetic portfolio (10 folios x 2k txns) - the earlier
+# dict based classes vs the slotted views on the txn store
+# Run from the project folder: python -m benchmarks.txn_views_memory
+import random
+import tracemalloc
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+import utils.utils as utils
+from model.investment import BuyTxn, SellTxn, MatchedTxn
+from model.investment_file import Investment as InvestmentRecord, Transaction
+from model.txn_store import TxnStore, BUY
+
+
+# Earlier classes (instance attributes as set in their __init__ - properties take no memory per instance)
+class DictTxn:
+    def __init__(self, investment, txn_rec):
+        self.investment = investment
+        self.txn_date = utils.normalize_date(txn_rec.date)
+        self.units = round(float(txn_rec.quantity), 4)
+        self.price = round(float(txn_rec.price), 4)
+        self.tax = round(float(txn_rec.tax), 4)
+        self.type = None
+        self.matched_txns = []
+        self.cumm_balance = 0
+        self.unmatched_units = abs(self.units)
+        self.value = self.units * self.price + self.tax
+
+class DictBuyTxn(DictTxn):
+    def __init__(self, investment, txn_rec):
+        super().__init__(investment, txn_rec)
+        self.type = 'buy'
+        self.stamp_duty = self.tax
+        self._sold_units = 0.0
+        self._unrealized_pnl = 0.0
+        self._unrealized_pnl_days = 0
+        self._unsold_units = 0.0
+
+class DictSellTxn(DictTxn):
+    def __init__(self, investment, txn_rec):
+        super().__init__(investment, txn_rec)
+        self.type = 'sell'
+        self.amount = abs((self.price * self.units) + self.tax)
+        self._fy = None
+        self.stt = self.tax
+        self._realized_pnl = 0.0
+
+class DictMatchedTxn:
+    def __init__(self, investment, units, sell_txn, buy_txn):
+        self.investment = investment
+        self.units = units
+        self.buy_txn = buy_txn
+        self.sell_txn = sell_txn
+        self._fy = None
+
+
+def synthetic_records():
+    rng = random.Random(0)
+    records = []
+    for folio in range(10):
+        txn_date, held, transactions = date(2015, 1, 1), 0.0, []
+        for _ in range(2_000):
+            txn_date += timedelta(days=rng.randint(0, 2))
+            units = round(rng.uniform(1, 500), 3)
+            if held > 0 and rng.random() < 0.4:
+                units = round(min(units, held * 0.05), 3)
+                transactions.append(Transaction(str(txn_date), "sell", -units, 100.0, 0.01, "synthetic"))
+                held -= units
+            else:
+                transactions.append(Transaction(str(txn_date), "buy", units, 100.0, 0.05, "synthetic"))
+                held += units
+        records.append(InvestmentRecord(f"INF{folio:09d}", str(folio), "Synthetic", transactions))
+    return records
+
+def dict_txns(records, store):
+    # Same txns and matched lots (as matched by the store) as objects of the earlier classes
+    views = []
+    for store_id, record in enumerate(records):
+        investment = SimpleNamespace()
+        rows = store.txn_rows(store_id).tolist()
+        txns = {row: (DictBuyTxn if txn_rec.type == "buy" else DictSellTxn)(investment, txn_rec)
+                for row, txn_rec in zip(rows, record.Transactions)}
+        for row in store.lot_rows(store_id).tolist():
+            sell_txn, buy_txn = txns[store.lots["sell"][row]], txns[store.lots["buy"][row]]
+            matched_txn = DictMatchedTxn(investment, float(store.lots["units"][row]), sell_txn, buy_txn)
+            buy_txn.matched_txns.append(matched_txn)
+            sell_txn.matched_txns.append(matched_txn)
+        views.append(txns)
+    return views
+
+def slotted_txns(records, store):
+    views = []
+    for store_id in range(len(store)):
+        investment = SimpleNamespace(txn_store=store, store_id=store_id)    # Stand-in (views only need the store)
+        txns = {row: (BuyTxn if store.txns["type"][row] == BUY else SellTxn)(investment, row)
+                for row in store.txn_rows(store_id).tolist()}
+        for row in store.lot_rows(store_id).tolist():
+            sell_txn, buy_txn = txns[store.lots["sell"][row]], txns[store.lots["buy"][row]]
+            matched_txn = MatchedTxn(investment, row, sell_txn, buy_txn)
+            buy_txn.matched_txns.append(matched_txn)
+            sell_txn.matched_txns.append(matched_txn)
+        views.append(txns)
+    return views
+
+def traced_memory(build, *args):
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    views = build(*args)
+    used = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    del views
+    return used
+
+
+if __name__ == '__main__':
+    records = synthetic_records()
+    store = TxnStore(records)
+    print(f"{len(store.txns)} txns, {len(store.lots)} matched lots:")
+    for label, build in (("dict classes", dict_txns), ("slotted views", slotted_txns)):
+        used = traced_memory(build, records, store)
+        print(f"{label:>14}: {used / 1024 / 1024:.2f} MB ({used / len(store.txns):.0f} bytes per txn)")
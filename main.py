@@ -34,7 +34,7 @@ if not st.session_state.get("user_id"):
     pages = st.navigation([st.Page("view/login.py", title="Login", icon=":material/chart_data:")])
 elif "user" not in st.session_state:
     with (st.spinner(text='Loading data...')):
-        user = User(st.session_state.user_id)
+        user = user_model.load_user(st.session_state.user_id)
         st.session_state.user = user
         st.session_state.options = Options(user.datafolder)
 
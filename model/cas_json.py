@@ -8,7 +8,7 @@ import os
 from datetime import datetime, date
 
 import utils.utils as utils
-from model.investment_file import InvestmentFileManager
+import model.investment_file as investment_file
 
 start_time = time.time()
 
@@ -258,6 +258,7 @@ def pdf2json(user_id, pdf_file, pw):
     """
     Use 'text' string if passed, else use the text_file to get text string.
     parse cas text line by line and create Python data structure
+    Returns the investment file manager (its changes are the txns added from this CAS)
     """
     # Read pdf and covert to text
     cas_text = pdf2txt(pdf_file, pw)
@@ -270,19 +271,21 @@ def pdf2json(user_id, pdf_file, pw):
     # Parse the CAS Text for first investment
     isin, folio, scheme_name, investor_name, pan = get_next_investment(cas_text_lines)
     investor_name = re.sub(r'\s+', ' ', investor_name).title() # Multiple spaces to single space
-    investment_file_manager = InvestmentFileManager(user_id, investor_name)
-
-    while isin:  # For the current found investment (isin is None, is not found)
-        # Parse the CAS Text for transactions in the current found investment
-        txns = parse_for_investment_txns(cas_text_lines, isin, folio)
-        investment_file_manager.add_investment({
-            "ISIN": isin,
-            "Folio": folio,
-            "SchemeName": scheme_name,
-            "Transactions": txns,
-        })
-        # Parse the CAS Text for next investment
-        isin, folio, scheme_name, investor_name, pan = get_next_investment(cas_text_lines)
-
-    return 0
+    investment_file_manager = investment_file.get_one(user_id, investor_name)
+
+    # All investments of the CAS are saved together at the end - nothing is saved if parsing fails midway
+    with investment_file_manager.batch():
+        while isin:  # For the current found investment (isin is None, is not found)
+            # Parse the CAS Text for transactions in the current found investment
+            txns = parse_for_investment_txns(cas_text_lines, isin, folio)
+            investment_file_manager.add_investment({
+                "ISIN": isin,
+                "Folio": folio,
+                "SchemeName": scheme_name,
+                "Transactions": txns,
+            })
+            # Parse the CAS Text for next investment
+            isin, folio, scheme_name, investor_name, pan = get_next_investment(cas_text_lines)
+
+    return investment_file_manager
 
@@ -1,12 +1,17 @@
+from bisect import bisect_left, bisect_right
 from datetime import timedelta, date, datetime
+import itertools
 
 from model.xirr import xirr, cagr
+from model.txn_store import TxnStore, BUY, SLAB_RATE, STCG, LTCG, to_date
 import model.nav as nav
 import utils.utils as utils
 
 class Investment:
+    _txns_versions = itertools.count(1)    # Unique across all investments (used as key for cached results)
+
     # def __init__(self, investor, isin, folio, scheme_name, transactions):
-    def __init__(self, investor, investment_data_class):
+    def __init__(self, investor, investment_data_class, txn_store=None, store_id=0):
         # investment_rec = asdict(investment_data_class)
         investment_rec = investment_data_class
         self.investor = investor
@@ -17,35 +22,28 @@ class Investment:
         self.folio = investment_rec.Folio
         self.scheme_name = investment_rec.SchemeName
 
-        # transactions = sorted(investment_rec.Transactions, key=lambda txn: txn.date)
-        self.holding = round(sum([txn.quantity for txn in investment_rec.Transactions]), 4)
-
-        self.buy_txns  = [BuyTxn(self, txn_rec) for txn_rec in investment_rec.Transactions if txn_rec.type == "buy"]
-        self.sell_txns = [SellTxn(self, txn_rec) for txn_rec in investment_rec.Transactions if txn_rec.type == "sell"]
+        # Transactions are rows of the (investor's) columnar txn store - txn objects are views on them
+        self.txn_store = txn_store if txn_store is not None else TxnStore([investment_rec])
+        self.store_id = store_id
+        self.holding = float(self.txn_store.holdings[store_id])
 
-        self.txns = sorted(self.buy_txns + self.sell_txns, key=lambda txn: txn.txn_date,)
-        # if len(self.buy_txns) > 0:
-        self.last_txn = self.txns[-1]
+        txns = self._bind_txns()
+        self.txns_version = next(Investment._txns_versions)     # To be renewed whenever txns change
 
-        # Compute cumulative balance
-        self._compute_txns_cumulative_balance()
+        # Cumulative balance is computed by the txn store
+        self._check_txns_cumulative_balance()
         # self.matched_txns = []  # Split txns after matching sold units with bought units
-        self.matched_txns = self._match_txns()
+        self.matched_txns = self._match_txns(txns, self.txn_store.lot_rows(store_id))
 
         # Check data validity....
-        unsold_units = round(sum(txn.unsold_units for txn in self.buy_txns))
-        if unsold_units != round(self.holding):
-            self.is_defective_data = True
-            self.defect_desc = (f'Unmatched holding found for {self.scheme_name} ({self.isin}, '
-                                f'{self.folio}) of {investor.name}\n '
-                                f'Holding = {round(self.holding)}, Unsold units = {unsold_units}'
-                                )
-
-        # Fetch current NAV
-        self.nav = nav.nav(self.isin) or self.txns[-1].price
-        self.nav_date = nav.nav_date(self.isin) or self.txns[-1].txn_date
+        self._check_holding()
+        self._sell_date_index = None    # Built on first FY/date window query (see SellDateIndex)
+        self._redemption_timeline = None    # Built on first as on date query (see RedemptionTimeline)
 
-        self.value = self.holding * self.nav
+        # Current NAV is fetched lazily (see nav property) and re-fetched whenever the NAV store is refreshed
+        self._nav = None
+        self._nav_date = None
+        self._nav_version = None
 
         # Fetch Master Data
         mf_master = self.investor.user.mf_master
@@ -69,64 +67,130 @@ class Investment:
         self.is_equity   = self.is_under_stcg
         self.is_hybrid   = self.is_under_asr and self.is_under_ltcg
         self.taxation = "Equity" if self.is_equity else "Hybrid" if self.is_hybrid else "Debt"
+        self.txn_store.set_tax_flags(store_id, self.is_under_asr, self.is_under_stcg, self.is_under_ltcg,
+                                     self.ltcg_days)
 
         self._realized_pnl = 0.0
         self._unrealized_pnl = 0.0
 
-    def _compute_txns_cumulative_balance(self):
-        balance = 0
-        for txn in self.txns:
-            balance += round(balance + txn.units, 4)
-            txn.cumm_balance = balance
-            if txn.cumm_balance < 0: # This should not happen
-                self.is_defective_data = True
-                self.defect_desc = f'Cumulative balance is negative for {self.scheme_name} ({self.isin}, '\
-                                f'{self.folio}) of {self.investor.name} on {txn.txn_date} '
-                break
-
-    def _match_txns(self):
-        i_sell = 0     # Loop counter for sell_txns list
-        i_buy = 0      # Loop counter for sell_txns list
+    def _bind_txns(self):
+        # Txn views on the store rows of this investment; returns them by row
+        txns = {row: (BuyTxn if self.txn_store.txns["type"][row] == BUY else SellTxn)(self, row)
+                for row in self.txn_store.txn_rows(self.store_id).tolist()}
+        self.buy_txns  = [txn for txn in txns.values() if txn.type == "buy"]
+        self.sell_txns = [txn for txn in txns.values() if txn.type == "sell"]
+
+        self.txns = [txns[row] for row in self.txn_store.date_ordered_rows(self.store_id)]
+        # if len(self.buy_txns) > 0:
+        self.last_txn = self.txns[-1]
+        return txns
+
+    def __getstate__(self):
+        # Pickled (see user snapshot) without the txn views - they are rebuilt from the txn store rows
+        state = self.__dict__.copy()
+        for name in ("buy_txns", "sell_txns", "txns", "last_txn", "matched_txns"):
+            del state[name]
+        state["_sell_date_index"] = None
+        state["_redemption_timeline"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.matched_txns = self._match_txns(self._bind_txns(), self.txn_store.lot_rows(self.store_id))
+        # Versions are per process - renew them (cached results are keyed on them) and re-bind current NAV
+        self.txns_version = next(Investment._txns_versions)
+        self._nav_version = None
+
+    def append_txns(self, txn_recs):
+        # New txns (dated after the last txn - see TxnStore.can_append); FIFO matching resumes from the open lots
+        new_rows, new_lot_rows = self.txn_store.append_txns(self.store_id, txn_recs)
+        txns = {txn.row: txn for txn in self.txns}
+        for row in new_rows.tolist():
+            txn = (BuyTxn if self.txn_store.txns["type"][row] == BUY else SellTxn)(self, row)
+            (self.buy_txns if txn.type == "buy" else self.sell_txns).append(txn)
+            txns[row] = txn
+        self.txns = [txns[row] for row in self.txn_store.date_ordered_rows(self.store_id)]
+        self.txns_version = next(Investment._txns_versions)
+        self.last_txn = self.txns[-1]
+        self.holding = float(self.txn_store.holdings[self.store_id])
+
+        self.is_defective_data = False
+        self.defect_desc = ''
+        self._check_txns_cumulative_balance()
+        self.matched_txns += self._match_txns(txns, new_lot_rows)
+        self._check_holding()
+        self._sell_date_index = None
+        self._redemption_timeline = None
+        self._nav_version = None    # Re-bind current NAV (it falls back to the last txn price)
+
+    def _check_holding(self):
+        unsold_units = round(sum(txn.unsold_units for txn in self.buy_txns))
+        if unsold_units != round(self.holding):
+            self.is_defective_data = True
+            self.defect_desc = (f'Unmatched holding found for {self.scheme_name} ({self.isin}, '
+                                f'{self.folio}) of {self.investor.name}\n '
+                                f'Holding = {round(self.holding)}, Unsold units = {unsold_units}'
+                                )
+
+    def _check_txns_cumulative_balance(self):
+        row = self.txn_store.balance_errors.get(self.store_id)
+        if row is not None: # This should not happen
+            self.is_defective_data = True
+            self.defect_desc = f'Cumulative balance is negative for {self.scheme_name} ({self.isin}, '\
+                            f'{self.folio}) of {self.investor.name} on {to_date(self.txn_store.txns["txn_date"][row])} '
+
+    def _match_txns(self, txns, lot_rows):
+        # FIFO matching is done by the txn store - matched lots are wrapped here (and linked to their txns)
         matched_txns = []
-        if len(self.buy_txns) == 0:
+        lots = self.txn_store.lots
+        for row in lot_rows.tolist():
+            sell_txn, buy_txn = txns[lots["sell"][row]], txns[lots["buy"][row]]
+            matched_txn = MatchedTxn(self, row, sell_txn, buy_txn)
+            # The list for matched_txns is populated here
+            matched_txns.append(matched_txn)
+            buy_txn.matched_txns.append(matched_txn)
+            sell_txn.matched_txns.append(matched_txn)
+
+        # Check for error conditions (These can happen is the data is corrupted)
+        error, sell_row, buy_row = self.txn_store.match_errors.get(self.store_id, (None, None, None))
+        if error == "no_buy":
             self.is_defective_data = True
             self.defect_desc = (f'Error: No buy transactions for {self.scheme_name} '
                                 f'(isin: {self.isin}, folio: {self.folio}) of {self.investor.name}')
-            return self
-        while i_sell < len(self.sell_txns):
-            sell_txn = self.sell_txns[i_sell]
-            # Check for error conditions (These can happen is the data is corrupted)
-            if i_buy >= len(self.buy_txns):
-                self.is_defective_data = True
-                self.defect_desc = (f'Still have unmatched Sold units but Buy txn list overflow while matching txns for'
-                                    f' {self.scheme_name} (isin: {self.isin}, folio: {self.folio}) of '
-                                    f'{self.investor.name}')
-                return self
-            buy_txn = self.buy_txns[i_buy]
-            if sell_txn.txn_date < buy_txn.txn_date:
-                self.is_defective_data = True
-                self.defect_desc = (f'Improper ordering or missed txns - Found selling date '
-                                    f'{sell_txn.txn_date} to be less than buying date {buy_txn.txn_date} for '
-                                    f' {self.scheme_name} (isin: {self.isin}, folio: {self.folio}) of '
-                                    f'{self.investor.name}')
-                return self
-
-            # Now create next matched_txn
-            matched_units = min(sell_txn.unmatched_units, buy_txn.unmatched_units)
-            matched_txn = MatchedTxn(self, matched_units, sell_txn, buy_txn)
-            # The list for matched_txns is populated here
-            matched_txns.append(matched_txn)
-            self.buy_txns[i_buy].matched_txns.append(matched_txn)
-            self.sell_txns[i_sell].matched_txns.append(matched_txn)
+        elif error == "overflow":
+            self.is_defective_data = True
+            self.defect_desc = (f'Still have unmatched Sold units but Buy txn list overflow while matching txns for'
+                                f' {self.scheme_name} (isin: {self.isin}, folio: {self.folio}) of '
+                                f'{self.investor.name}')
+        elif error == "order":
+            self.is_defective_data = True
+            self.defect_desc = (f'Improper ordering or missed txns - Found selling date '
+                                f'{txns[sell_row].txn_date} to be less than buying date {txns[buy_row].txn_date} for '
+                                f' {self.scheme_name} (isin: {self.isin}, folio: {self.folio}) of '
+                                f'{self.investor.name}')
+        return matched_txns
 
-            sell_txn.unmatched_units = round(sell_txn.unmatched_units - matched_units, 4)
-            buy_txn.unmatched_units  = round(buy_txn.unmatched_units - matched_units, 4)
+    def _bind_nav(self):
+        version = nav.nav_version()
+        if version != self._nav_version:
+            navs, nav_dates = self.txn_store.current_navs()
+            self._nav = float(navs[self.store_id])
+            self._nav_date = to_date(nav_dates[self.store_id])
+            self._nav_version = version
 
-            if sell_txn.unmatched_units <= 0: #If all units of this sell txn matched. Move to the next sell txn
-                i_sell += 1
-            if buy_txn.unmatched_units <= 0: #If all units of this sell txn matched. Move to the next sell txn
-                i_buy += 1
-        return matched_txns
+    @property
+    def nav(self):
+        self._bind_nav()
+        return self._nav
+
+    @property
+    def nav_date(self):
+        self._bind_nav()
+        return self._nav_date
+
+    @property
+    def value(self):
+        return self.holding * self.nav
 
     def filter(self, hide_before_date=date.today(), selected_cats=None, selected_subs=None):
         c1 = not hide_before_date or (self.holding > 0 or self.last_txn.txn_date > hide_before_date)
@@ -143,26 +207,46 @@ class Investment:
         c2 = (c2_1 or c2_2) if (selected_cats and selected_subs) else (c2_1 and c2_2)
         return c1 and c2
 
+    @property
+    def sell_date_index(self):
+        if self._sell_date_index is None:
+            self._sell_date_index = SellDateIndex(self.matched_txns, self.sell_txns)
+        return self._sell_date_index
+
+    def matched_txns_in_fy(self, fy):
+        # Matched txns (sold units) with sell date in the FY, in sell date order
+        return self.sell_date_index.matched_txns_in_fy(fy)
+
+    def matched_txns_between(self, from_date, to_date):
+        # Matched txns with sell date from from_date to to_date (both inclusive), in sell date order
+        return self.sell_date_index.matched_txns_between(from_date, to_date)
+
+    def sell_txns_in_fy(self, fy):
+        return self.sell_date_index.sell_txns_in_fy(fy)
+
     def is_sold_in_fy(self, fy):
-        for txn in self.sell_txns:
-            if utils.is_date_in_fy(txn.txn_date, fy):
-                return True
-        return False
+        return len(self.sell_txns_in_fy(fy)) > 0
+
+    @property
+    def redemption_timeline(self):
+        if self._redemption_timeline is None:
+            self._redemption_timeline = RedemptionTimeline(self.buy_txns, self.exit_load_days, self.ltcg_days)
+        return self._redemption_timeline
+
+    def redeemable_on(self, on_date):
+        # (units, value, unrealized gain) of unsold units that are load free and not yet LTCG (for slab rate/STCG
+        # gains) and of those that have crossed LTCG date, if sold on on_date (at current NAV)
+        nav = self.nav
+        return tuple((units, units * nav, units * nav - cost)
+                     for units, cost in self.redemption_timeline.as_on(on_date))
 
     def get_realized_pnl(self, fy=None, period=None):
         # get realized return (ASR+STCG+LTCG) for a FY or between 2 dates
         if fy is not None:
             period = utils.get_timeframe(fy=fy) # returns tuple
 
-        if isinstance(period, tuple):   # if period is not None:
-            txns = [txn for txn in self.matched_txns if (period[0] <= txn.sell_txn.txn_date <= period[1])]
-        else:
-            txns = self.matched_txns
-
-        pnl = sum(txn.pnl for txn in txns)
-        self.stt = sum(txn.stt for txn in txns)
-        self.stamp_duty = sum(txn.stamp_duty for txn in txns)
-        return pnl - self.stt - self.stamp_duty
+        # Net of STT and stamp duty - computed for all investments of the txn store at once
+        return float(self.txn_store.realized_pnl(period=period if isinstance(period, tuple) else None)[self.store_id])
 
     @property
     def scheme_short_name(self):
@@ -186,19 +270,18 @@ class Investment:
 
     @property
     def unrealized_pnl(self):   # This should always be for the current date/FY ??
-        # Any property dependent directly or indirectly on NAV is dynamically computed every time
-        return sum(txn.unrealized_pnl for txn in self.buy_txns)
+        return self.get_unrealized_pnl()
 
     def get_unrealized_pnl(self):   # This should always be for the current date/FY ??
-        # Any property dependent directly or indirectly on NAV is dynamically computed every time
-        return sum(txn.unrealized_pnl for txn in self.buy_txns)
+        # Any property dependent directly or indirectly on NAV is recomputed whenever NAVs are refreshed
+        return float(self.txn_store.unrealized_pnl()[self.store_id])
 
     def get_total_pnl(self):
         return self.get_realized_pnl() + self.get_unrealized_pnl()
 
     @property
     def unrealized_tax(self):
-        return sum(txn.stamp_duty for txn in self.buy_txns)
+        return float(self.txn_store.stamp_duty()[self.store_id])
 
     @property
     def total_returns(self):
@@ -249,7 +332,7 @@ class Investment:
 
     @property
     def total_taxes_paid(self):
-        return sum(txn.tax for txn in self.txns)
+        return float(self.txn_store.taxes_paid()[self.store_id])
 
     @property
     def tax_treatment(self):
@@ -271,32 +354,116 @@ class Investment:
 
 
 
+class SellDateIndex:
+    """
+    Matched txns and sell txns of an investment sorted by sell date (stable - same date keeps matching order),
+    so that FY and date window queries are bisect slices instead of scans. FY slices are kept by FY.
+    """
+    def __init__(self, matched_txns, sell_txns):
+        self.matched_txns = sorted(matched_txns, key=lambda txn: txn.sell_txn.txn_date)
+        self.matched_dates = [txn.sell_txn.txn_date for txn in self.matched_txns]
+        self.sell_txns = sorted(sell_txns, key=lambda txn: txn.txn_date)
+        self.sell_dates = [txn.txn_date for txn in self.sell_txns]
+        self.fy_slices = {}     # {fy: (slice of matched txns, slice of sell txns)}
+
+    def _fy_slices(self, fy):
+        slices = self.fy_slices.get(fy)
+        if slices is None:
+            from_date, to_date = utils.get_timeframe(fy=fy)
+            slices = self.fy_slices[fy] = (_date_slice(self.matched_dates, from_date, to_date),
+                                           _date_slice(self.sell_dates, from_date, to_date))
+        return slices
+
+    def matched_txns_in_fy(self, fy):
+        return self.matched_txns[self._fy_slices(fy)[0]]
+
+    def matched_txns_between(self, from_date, to_date):
+        return self.matched_txns[_date_slice(self.matched_dates, from_date, to_date)]
+
+    def sell_txns_in_fy(self, fy):
+        return self.sell_txns[self._fy_slices(fy)[1]]
+
+def _date_slice(dates, from_date, to_date):
+    return slice(bisect_left(dates, from_date), bisect_right(dates, to_date))
+
+class RedemptionTimeline:
+    """
+    Unsold units of the buy txns of an investment as two sorted event lists - the day they can be sold for slab
+    rate/STCG gains (the day after they are load free) and the day they cross LTCG date - with prefix sums of units
+    and cost, so that the units sellable for slab rate/STCG or LTCG gains as on any date are a bisect.
+    """
+    def __init__(self, buy_txns, exit_load_days, ltcg_days):
+        lots = [(txn.txn_date + timedelta(days=ltcg_days), txn.txn_date + timedelta(days=exit_load_days + 1),
+                 txn.unsold_units, txn.unsold_amount) for txn in buy_txns if txn.unsold_units > 0]
+        # Units load free only after LTCG date go straight to LTCG (never sellable for slab rate/STCG gains)
+        self.sellable = _prefix_sums([(min(sellable_date, ltcg_date), units, cost)
+                                      for ltcg_date, sellable_date, units, cost in lots])
+        self.ltcg = _prefix_sums([(ltcg_date, units, cost) for ltcg_date, _, units, cost in lots])
+
+    def as_on(self, on_date):
+        # ((units, cost) sellable for slab rate/STCG gains, (units, cost) sellable for LTCG gains) on on_date
+        sellable_units, sellable_cost = _sums_till(self.sellable, on_date)
+        ltcg_units, ltcg_cost = _sums_till(self.ltcg, on_date)
+        return (sellable_units - ltcg_units, sellable_cost - ltcg_cost), (ltcg_units, ltcg_cost)
+
+def _prefix_sums(events):
+    events.sort(key=lambda event: event[0])
+    return ([event[0] for event in events],
+            [0.0] + list(itertools.accumulate(event[1] for event in events)),
+            [0.0] + list(itertools.accumulate(event[2] for event in events)))
+
+def _sums_till(prefix_sums, on_date):
+    dates, units, costs = prefix_sums
+    i = bisect_right(dates, on_date)
+    return units[i], costs[i]
+
 class Txn:
-    def __init__(self, investment, txn_rec):
+    # View on a row of the investor's txn store (slots - there is one per txn of every investment)
+    __slots__ = ("investment", "row", "txn_date", "matched_txns")
+    type = None
+
+    def __init__(self, investment, row):
         self.investment = investment
-        # self.txn_date = datetime.strptime(txn_date, "%Y-%m-%d").date()
-        self.txn_date = utils.normalize_date(txn_rec.date)
-        self.units = round(float(txn_rec.quantity), 4)
-        self.price = round(float(txn_rec.price), 4)
-        self.tax = round(float(txn_rec.tax), 4)
-        self.type = None
+        self.row = row
+        self.txn_date = to_date(self.txns["txn_date"][row])
         self.matched_txns = []
-        self.cumm_balance = 0
-        self.unmatched_units = abs(self.units)  # For the purpose of using in match_txns logic
-        self.value = self.units * self.price + self.tax
 
-class BuyTxn (Txn):
-    def __init__(self, investment, txn_rec):
-        super().__init__(investment, txn_rec)
-        self.type = 'buy'
-        self.stamp_duty = self.tax
+    @property
+    def txns(self):
+        # Store arrays are replaced when txns are appended, so always read them from the store
+        return self.investment.txn_store.txns
 
-        # These values can Not be computed when the object is created.
-        self._sold_units = 0.0
-        self._unrealized_pnl = 0.0
-        self._unrealized_pnl_days = 0
-        self._unsold_units = 0.0
+    @property
+    def units(self):
+        return float(self.txns["units"][self.row])
+
+    @property
+    def price(self):
+        return float(self.txns["price"][self.row])
+
+    @property
+    def tax(self):
+        return float(self.txns["tax"][self.row])
+
+    @property
+    def amount(self):
+        return float(self.txns["amount"][self.row])
+
+    @property
+    def cumm_balance(self):
+        return float(self.txns["cumm_balance"][self.row])
+
+    @property
+    def unmatched_units(self):
+        return float(self.txns["unmatched_units"][self.row])
+
+    @property
+    def value(self):
+        return self.units * self.price + self.tax
 
+class BuyTxn (Txn):
+    __slots__ = ()
+    type = 'buy'
 
     @property
     def sold_units(self):
@@ -310,8 +477,8 @@ class BuyTxn (Txn):
         return self.unmatched_units
 
     @property
-    def amount(self):
-        return (self.price * self.units) + self.tax
+    def stamp_duty(self):
+        return self.tax
 
     @property
     def sold_amount(self):
@@ -385,22 +552,22 @@ class BuyTxn (Txn):
 
 
 class SellTxn (Txn):
-    def __init__(self, investment, txn_rec):
-        super().__init__(investment, txn_rec)
-        self.type = 'sell'
-        self.amount = abs((self.price * self.units) + self.tax)
+    __slots__ = ("_fy",)
+    type = 'sell'
+
+    def __init__(self, investment, row):
+        super().__init__(investment, row)
         self._fy = None    # Financial Year
-        self.stt = self.tax
 
-        # These values can Not be computed when the object is created.
-        self._realized_pnl = 0.0
+    @property
+    def stt(self):
+        return self.tax
 
     # This realized pnl may be a combination of STCG and LTCG
     # For taxation purposes, refer to pnl and tax_type of matched_txns
     @property
     def realized_pnl(self):
-        self._realized_pnl = self._realized_pnl or sum(pnl for pnl in self.matched_txns)
-        return self._realized_pnl
+        return sum(txn.pnl for txn in self.matched_txns)
 
     @property
     def fy(self):
@@ -410,26 +577,34 @@ class SellTxn (Txn):
 
 
 class MatchedTxn:
-    def __init__(self, investment, units, sell_txn, buy_txn):
-        self.investment = investment
-        self.units = units
+    # View on a row of matched lots of the investor's txn store (slots - there is one per lot)
+    __slots__ = ("row", "buy_txn", "sell_txn", "_fy")
+
+    def __init__(self, investment, row, sell_txn, buy_txn):
+        self.row = row
         self.buy_txn = buy_txn
         self.sell_txn = sell_txn
         self._fy = None
-        # self.stamp_duty = 0.0
-        # self.stt = 0.0
-        # Compute taxes
-        # self.stamp_duty = round((self.buy_txn.stamp_duty / self.buy_txn.units) * self.units, 2)
-        # self.stt        = round((self.sell_txn.stt / self.sell_txn.units) * self.units, 2)
-        # self._tax_type = None
+
+    @property
+    def investment(self):
+        return self.sell_txn.investment
+
+    @property
+    def lots(self):
+        return self.investment.txn_store.lots
+
+    @property
+    def units(self):
+        return float(self.lots["units"][self.row])
 
     @property
     def stt(self):
-        return self.sell_txn.stt * (self.units / self.sell_txn.units)
+        return float(self.lots["stt"][self.row])
 
     @property
     def stamp_duty(self):
-        return self.buy_txn.stamp_duty * (self.units / self.buy_txn.units)
+        return float(self.lots["stamp_duty"][self.row])
 
     @property
     def tax_amount(self):
@@ -437,29 +612,35 @@ class MatchedTxn:
 
     @property
     def buy_amount(self):
-        return self.buy_txn.amount * (self.units / self.buy_txn.units)
+        return float(self.lots["buy_amount"][self.row])
 
     @property
     def sell_amount(self):
-        return abs(self.sell_txn.amount * (self.units / self.sell_txn.units))
+        return float(self.lots["sell_amount"][self.row])
 
     @property
     def pnl(self):
         # This value matches with VRO report
         # return self.units * (self.sell_txn.price - self.buy_txn.price) # - self.stt - self.stamp_duty
-        return self.sell_amount - self.buy_amount
+        return float(self.lots["pnl"][self.row])
+
+    @property
+    def taxes(self):
+        # Taxation of all lots of the store (see TxnStore.lot_taxes)
+        return self.investment.txn_store.lot_taxes()
 
     @property
     def ltcg(self):
-        investment = self.sell_txn.investment
-        _ltcg = self.pnl
-        if investment.is_under_stcg and investment.is_under_ltcg:   # Equity investment for Grand fathering LTCG
-            gf_date = datetime.strptime("2018-01-31", "%Y-%m-%d").date()
-            if self.buy_txn.txn_date <= gf_date and self.is_taxable_at_ltcg:
-                fmv_31_01_2018 = nav.nav_on_31012018(investment.isin)
-                deemed_coa = max(self.buy_txn.price, min(self.sell_txn.price, fmv_31_01_2018))
-                _ltcg = (self.sell_txn.price - deemed_coa) * self.units
-        return _ltcg
+        # Grandfathered (as on 31-Jan-2018) for equity units bought by then and sold from 1-Apr-2018
+        return float(self.taxes["ltcg"][self.row])
+
+    @property
+    def fmv_31_01_2018(self):
+        return float(self.taxes["fmv"][self.row])
+
+    @property
+    def deemed_coa(self):
+        return float(self.taxes["deemed_coa"][self.row])
 
     @property
     def cagr(self):
@@ -475,7 +656,7 @@ class MatchedTxn:
 
     @property
     def holding_period(self):
-        return (self.sell_txn.txn_date - self.buy_txn.txn_date).days
+        return int(self.lots["holding_days"][self.row])
 
     @property
     def fy(self):
@@ -500,22 +681,15 @@ class MatchedTxn:
     @property
     def is_taxable_at_slab_rate(self):
         # If tax_treatment on investment is Slab-Rate and units held for less than LTCG applicable days (for Hybrid)
-        if self.investment.is_under_asr:
-            if self.investment.is_under_ltcg:
-                return self.holding_period < self.investment.ltcg_days
-            else:
-                return True
-        else:
-            return False
-        # return self.investment.is_under_asr and (self.holding_period < self.sell_txn.investment.ltcg_days)
+        return bool(self.taxes["tax_class"][self.row] & SLAB_RATE)
 
     @property
     def is_taxable_at_stcg(self):
-        return self.investment.is_under_stcg and (self.holding_period < self.investment.ltcg_days)
+        return bool(self.taxes["tax_class"][self.row] & STCG)
 
     @property
     def is_taxable_at_ltcg(self):
-        return self.investment.is_under_ltcg and (self.holding_period >= self.investment.ltcg_days)
+        return bool(self.taxes["tax_class"][self.row] & LTCG)
 
     @property
     def applicable_tax_treatment(self):
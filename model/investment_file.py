@@ -1,10 +1,17 @@
+import hashlib
 import json
 import os
-from dataclasses import dataclass, asdict, field
-from datetime import datetime
+import time
+from contextlib import closing, contextmanager
+from dataclasses import dataclass, asdict, field, replace
 from typing import Any, List, Optional
 from pathlib import Path
 
+import model.sqlite_db as sqlite_db
+import utils.utils as utils
+
+JOURNAL_COMPACT_ENTRIES = 100   # Journal is compacted into the investor file once it has these many entries
+
 
 @dataclass
 class Transaction:
@@ -19,7 +26,7 @@ class Transaction:
     def __post_init__(self):
         """Validate transaction fields after initialization."""
         try:
-            datetime.strptime(self.date, "%Y-%m-%d")
+            utils.iso_date_ordinal(self.date)
         except ValueError:
             raise ValueError(f"Invalid date format: {self.date}, expected YYYY-MM-DD")
         if self.type not in {"buy", "sell"}:
@@ -29,6 +36,11 @@ class Transaction:
         if self.price <= 0:
             raise ValueError("Price must be a positive number")
 
+    @property
+    def ordinal(self) -> int:
+        """Date ordinal (the date string is parsed once - see utils.iso_date_ordinal)."""
+        return utils.iso_date_ordinal(self.date)
+
 
 @dataclass
 class Investment:
@@ -43,6 +55,11 @@ class InvestmentFileManager:
     """
     Manages investment records stored in a JSON file.
     Supports CRUD operations, summary calculations, and transaction management.
+
+    Changes are appended to a journal next to the JSON file (one JSON line per change) instead of rewriting the
+    file on every change. The journal is replayed on load and compacted into the JSON file by save().
+    A journal is never overwritten: one that does not apply to the JSON file (its content changed since the
+    journal was started) is set aside with a warning, and a torn last line is cut off before appending.
     """
 
     def __init__(self, user_id: str, investor_name: str):
@@ -57,44 +74,198 @@ class InvestmentFileManager:
         self.filepath = Path("data") / user_id / f"{investor_name.lower().replace(' ', '_')}_investments.json"
         self.filepath.parent.mkdir(parents=True, exist_ok=True)
 
+        self.journal_path = self.filepath.with_suffix(".journal")
+        self._journal_entries = 0
+        self._journal_end: Optional[int] = None     # Size of the journal up to its last complete line (if torn)
+        self._base_hash: Optional[str] = None       # Content hash of the JSON file - journals are keyed on it
+        self._batch: Optional[list[dict[str, Any]]] = None   # Journal entries of the open batch (see batch())
+
         self.investments: list[Investment] = []
+        # Index of the investments by (ISIN, Folio) and the txn dates of each (see _reindex)
+        self._index: dict[tuple[str, str], Investment] = {}
+        self._txn_dates: dict[tuple[str, str], set[str]] = {}
         self.investor_name = investor_name
+        # Txns added since load, by (ISIN, Folio) - lets a loaded investor refresh only the changed investments
+        self.changes: dict[tuple[str, str], list[Transaction]] = {}
         self._load()
 
     def _load(self) -> None:
         """Load investment data from JSON file if it exists, else initialize empty list."""
         if os.path.exists(self.filepath):
-            with open(self.filepath, "r", encoding="utf-8") as f:
-                try:
-                    raw = json.load(f)
-                    self.investments = [
-                        Investment(
-                            ISIN=rec["ISIN"],
-                            Folio=rec["Folio"],
-                            SchemeName=rec["SchemeName"],
-                            Transactions=[Transaction(**txn) for txn in rec["Transactions"]],
-                        )
-                        for rec in raw
-                    ]
-
-                except json.JSONDecodeError:
-                    self.investments = []
+            data = self.filepath.read_bytes()
+            self._base_hash = hashlib.sha256(data).hexdigest()
+            try:
+                raw = json.loads(data)
+                self.investments = [
+                    Investment(
+                        ISIN=rec["ISIN"],
+                        Folio=rec["Folio"],
+                        SchemeName=rec["SchemeName"],
+                        Transactions=[Transaction(**txn) for txn in rec["Transactions"]],
+                    )
+                    for rec in raw
+                ]
+
+            except json.JSONDecodeError:
+                self.investments = []
         else:
             self.investments = []
+        self._reindex()
+        self._replay_journal()
+
+    def _reindex(self) -> None:
+        """(Re)build the (ISIN, Folio) index of the investments and the set of txn dates of each."""
+        self._index, self._txn_dates = {}, {}
+        for inv in self.investments:
+            key = (inv.ISIN, inv.Folio)
+            if key not in self._index:  # First one wins, as with a scan
+                self._index[key] = inv
+                self._txn_dates[key] = {txn.date for txn in inv.Transactions}
+
+    def _append_investment(self, inv: Investment) -> None:
+        self.investments.append(inv)
+        self._index[(inv.ISIN, inv.Folio)] = inv
+        self._txn_dates[(inv.ISIN, inv.Folio)] = {txn.date for txn in inv.Transactions}
+
+    def _add_transactions(self, inv: Investment, transactions: list[Transaction]) -> None:
+        inv.Transactions.extend(transactions)
+        inv.Transactions.sort(key=lambda t: t.date)
+        self._txn_dates[(inv.ISIN, inv.Folio)].update(txn.date for txn in transactions)
+
+    def _remove_investment(self, inv: Investment) -> None:
+        self.investments.remove(inv)
+        self._reindex()     # A duplicate (ISIN, Folio) record, if any, takes its place
+
+    def _replay_journal(self) -> None:
+        """Apply the changes journaled since the JSON file was last written."""
+        self._journal_entries, self._journal_end = 0, None
+        compacted = self._compacted_journal_path()
+        if compacted.exists():
+            # Left by an interrupted save() - its changes are in the JSON file, unless that was not replaced yet
+            if _journal_base(compacted) != self._base_hash:
+                compacted.unlink()
+            elif not self.journal_path.exists():
+                compacted.replace(self.journal_path)
+            else:
+                self._set_aside_journal(compacted)
+        if not self.journal_path.exists():
+            return
+        data = self.journal_path.read_bytes()
+        lines = data.split(b"\n")     # Last item is empty, unless the last line is torn (interrupted append)
+        header = _json_line(lines[0]) if len(lines) > 1 else None
+        entries = [_json_line(line) for line in lines[1:-1]]
+        if not isinstance(header, dict) or header.get("base") != self._base_hash or None in entries:
+            self._set_aside_journal(self.journal_path)
+            return
+        for entry in entries:
+            self._apply(entry)
+        self._journal_entries = len(entries)
+        if lines[-1]:
+            self._journal_end = len(data) - len(lines[-1])  # Torn tail is cut off before the next append
+
+    def _compacted_journal_path(self) -> Path:
+        return self.journal_path.with_name(self.journal_path.name + ".compacted")
+
+    def _set_aside_journal(self, journal_path: Path) -> None:
+        # A journal that does not apply to the JSON file is never overwritten - it is kept for manual recovery
+        aside = self.journal_path.with_name(f"{self.journal_path.name}.unapplied-{time.time_ns()}")
+        journal_path.replace(aside)
+        print(f"WARNING: Journal {journal_path} does not apply to {self.filepath} (changed since the journal was "
+              f"started, or the journal is damaged) - its changes are NOT loaded. It is kept as {aside}.")
+
+    def _apply(self, entry: dict[str, Any]) -> None:
+        """Apply a journal entry (an add/delete/rename change already validated when it was journaled)."""
+        isin, folio = entry["ISIN"], entry["Folio"]
+        inv = self._find_investment(isin, folio)
+        if entry["op"] == "add":
+            transactions = [Transaction(**txn) for txn in entry["Transactions"]]
+            if inv:
+                self._add_transactions(inv, transactions)
+            else:
+                self._append_investment(Investment(ISIN=isin, Folio=folio, SchemeName=entry["SchemeName"],
+                                                   Transactions=transactions))
+        elif entry["op"] == "delete":
+            if inv:
+                self._remove_investment(inv)
+        elif entry["op"] == "rename":
+            if inv:
+                inv.SchemeName = entry["SchemeName"]
 
 
     def save(self) -> None:
         """
-        Save the current investment data to the JSON file.
+        Save the current investment data to the JSON file (and drop the journal that is now part of it).
         Can be used to manually persist changes.
         """
-        with open(self.filepath, "w", encoding="utf-8") as f:
-            json.dump([asdict(inv) for inv in self.investments], f, indent=4)
+        # Written to a temp file and renamed, so that a reader never sees a half written file. The journal is
+        # renamed out of the way first - if this is interrupted, the next load finds out whether it is applied
+        data = json.dumps([asdict(inv) for inv in self.investments], indent=4).encode("utf-8")
+        tmp_path = self.filepath.with_name(self.filepath.name + ".tmp")
+        tmp_path.write_bytes(data)
+        if self.journal_path.exists() and _journal_base(self.journal_path) != self._base_hash:
+            self._set_aside_journal(self.journal_path)     # Not on the JSON file this was loaded from
+        compacted = self._compacted_journal_path()
+        if self.journal_path.exists():
+            self.journal_path.replace(compacted)
+        tmp_path.replace(self.filepath)
+        compacted.unlink(missing_ok=True)
+        self._base_hash = hashlib.sha256(data).hexdigest()
+        self._journal_entries, self._journal_end = 0, None
         # print(self.filepath, "saved")
 
-    def _save(self) -> None:
-        """Auto-save wrapper called internally after every change."""
-        self.save()
+    def _save(self, entry: dict[str, Any]) -> None:
+        """Auto-save wrapper called internally after every change - journals the change (at the end of a batch)."""
+        if self._batch is not None:
+            self._batch.append(entry)
+        else:
+            self._journal(entry)
+
+    def _journal(self, *entries: dict[str, Any]) -> None:
+        if not self.filepath.exists() or self._journal_entries + len(entries) > JOURNAL_COMPACT_ENTRIES:
+            self.save()
+            return
+        if self.journal_path.exists() and _journal_base(self.journal_path) != self._base_hash:
+            self._set_aside_journal(self.journal_path)     # E.g. the JSON file was saved by another manager since
+            self._journal_entries = 0
+        lines = [json.dumps(entry) for entry in entries]
+        if not self.journal_path.exists():
+            lines.insert(0, json.dumps({"base": self._base_hash}))
+        elif self._journal_end is not None:
+            with open(self.journal_path, "r+b") as f:
+                f.truncate(self._journal_end)
+        self._journal_end = None
+        # Single write - an interrupted append leaves at most a torn last line (cut off by the next append)
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        self._journal_entries += len(entries)
+
+    @contextmanager
+    def batch(self):
+        """
+        Collect the changes made in the with block in memory and persist them with one write at the end.
+        If the block raises, the changes are rolled back and nothing is written.
+
+        Usage:
+            with manager.batch():
+                manager.add_investment(...)
+        """
+        if self._batch is not None:     # Nested batch is part of the outer one
+            yield self
+            return
+        investments = [replace(inv, Transactions=list(inv.Transactions)) for inv in self.investments]
+        changes = {key: list(txns) for key, txns in self.changes.items()}
+        self._batch = []
+        try:
+            yield self
+        except BaseException:
+            self.investments, self.changes = investments, changes
+            self._reindex()
+            raise
+        else:
+            if self._batch:
+                self._journal(*self._batch)
+        finally:
+            self._batch = None
 
     def _find_investment(self, isin: str, folio: str) -> Optional[Investment]:
         """
@@ -107,10 +278,7 @@ class InvestmentFileManager:
         Returns:
             Investment object if found, else None.
         """
-        for inv in self.investments:
-            if inv.ISIN == isin and inv.Folio == folio:
-                return inv
-        return None
+        return self._index.get((isin, folio))
 
     def add_investment(self, record: dict[str, Any], allow_same_date=False) -> None:
         """
@@ -140,9 +308,10 @@ class InvestmentFileManager:
         transactions.sort(key=lambda t: t.date)
 
         existing_investment = self._find_investment(isin, folio)
+        new_txns = transactions
         if existing_investment:
             # Add only transactions with new dates
-            existing_dates = {txn.date for txn in existing_investment.Transactions}
+            existing_dates = self._txn_dates[(isin, folio)]
             if allow_same_date:
                 # All given transactions to be considered as new txns
                 new_txns = transactions
@@ -151,13 +320,16 @@ class InvestmentFileManager:
                 new_txns = [txn for txn in transactions if txn.date not in existing_dates]
             if new_txns:
                 # existing_investment.Transactions.extend(transactions)
-                existing_investment.Transactions.extend(new_txns)
-                existing_investment.Transactions.sort(key=lambda t: t.date)
+                self._add_transactions(existing_investment, new_txns)
+                self.changes.setdefault((isin, folio), []).extend(new_txns)
         else:
             new_inv = Investment(ISIN=isin, Folio=folio, SchemeName=scheme_name, Transactions=transactions)
-            self.investments.append(new_inv)
+            self._append_investment(new_inv)
+            self.changes.setdefault((isin, folio), []).extend(transactions)
 
-        self._save()
+        if new_txns or not existing_investment:
+            self._save({"op": "add", "ISIN": isin, "Folio": folio, "SchemeName": scheme_name,
+                        "Transactions": [asdict(txn) for txn in new_txns]})
 
     def get_investment(self, isin: str, folio: str) -> Optional[Investment]:
         """
@@ -183,11 +355,11 @@ class InvestmentFileManager:
         Returns:
             True if deleted successfully, False if not found.
         """
-        for i, inv in enumerate(self.investments):
-            if inv.ISIN == isin and inv.Folio == folio:
-                del self.investments[i]
-                self._save()
-                return True
+        inv = self._find_investment(isin, folio)
+        if inv:
+            self._remove_investment(inv)
+            self._save({"op": "delete", "ISIN": isin, "Folio": folio})
+            return True
         return False
 
     def update_scheme_name(self, isin: str, folio: str, new_name: str) -> bool:
@@ -205,7 +377,7 @@ class InvestmentFileManager:
         inv = self._find_investment(isin, folio)
         if inv:
             inv.SchemeName = new_name
-            self._save()
+            self._save({"op": "rename", "ISIN": isin, "Folio": folio, "SchemeName": new_name})
             return True
         return False
 
@@ -279,20 +451,69 @@ class InvestmentFileManager:
         """
         inv = self._find_investment(isin, folio)
 
+
+def _json_line(line: bytes) -> Optional[dict[str, Any]]:
+    try:
+        return json.loads(line)
+    except ValueError:  # Also UnicodeDecodeError
+        return None
+
+def _journal_base(journal_path: Path) -> Optional[str]:
+    # Hash of the JSON file the journal was started on (None if its header is unreadable)
+    with open(journal_path, "rb") as f:
+        header = _json_line(f.readline())
+    return header.get("base") if isinstance(header, dict) else None
+
+
+class SQLiteInvestmentManager(InvestmentFileManager):
+    """
+    InvestmentFileManager on the user's SQLite database (see model/sqlite_db.py) instead of the JSON file.
+    Changes are written to the database as they are made - those of a batch in one database transaction.
+    """
+
+    def _load(self) -> None:
+        """Load the investor's investments from the database."""
+        with closing(sqlite_db.connect(self.user_id)) as db:
+            raw = sqlite_db.read_investments(db, sqlite_db.investor_key(self.investor_name))
+        self.investments = [
+            Investment(
+                ISIN=isin,
+                Folio=folio,
+                SchemeName=scheme_name,
+                Transactions=[Transaction(*txn) for txn in txns],
+            )
+            for isin, folio, scheme_name, txns in raw
+        ]
+        self._reindex()
+
+    def save(self) -> None:
+        """Changes are saved to the database as they are made - nothing to save."""
+
+    def _journal(self, *entries: dict[str, Any]) -> None:
+        with closing(sqlite_db.connect(self.user_id)) as db:
+            sqlite_db.write_changes(db, sqlite_db.investor_key(self.investor_name), entries)
+
+
 import streamlit as st
 def get_all_investor_names(user_id: str) -> list[str]:
     # st.write("CWD:", os.getcwd())
     # st.write("Error reading here:", os.listdir("."))
     # BASE_DIR = Path(__file__).parent
+    if sqlite_db.is_enabled(user_id):
+        with closing(sqlite_db.connect(user_id)) as db:
+            return sqlite_db.get_investor_names(db)
     datafolder = Path("data") / user_id
     filenames = [filename for filename in os.listdir(datafolder) if filename.endswith("_investments.json")]
     return [filename.replace("_investments.json", "").replace("_", " ").title() for filename in filenames]
 
 def get_all(user_id: str) -> list[InvestmentFileManager]:
     investor_names = get_all_investor_names(user_id)
-    return [InvestmentFileManager(user_id, investor_name) for investor_name in investor_names]
+    return [get_one(user_id, investor_name) for investor_name in investor_names]
 
 def get_one(user_id: str, investor_name: str) -> InvestmentFileManager:
+    # On the user's database once the JSON files are migrated to it (see sqlite_db.migrate_from_json)
+    if sqlite_db.is_enabled(user_id):
+        return SQLiteInvestmentManager(user_id, investor_name)
     return InvestmentFileManager(user_id, investor_name)
 
 if __name__ == "__main__":
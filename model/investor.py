@@ -2,24 +2,60 @@ from datetime import datetime, date
 
 import pandas as pd
 from model.investment import Investment
-from model.investment_file import InvestmentFileManager
+import model.investment_file as investment_file
+from model.txn_store import TxnStore
 
 class Investor:
     def __init__(self, user, investor_name):
         self.user = user
         self.name = investor_name
-        investor_file = InvestmentFileManager(user.user_id, investor_name)
-        self.investments = []
-        for investment_rec in investor_file.investments:
-            buy_txns_count = sum(1 for txn in investment_rec.Transactions if txn.type == "buy")
-            if buy_txns_count > 0:
-                self.investments.append(Investment(self, investment_rec))
+        investor_file = investment_file.get_one(user.user_id, investor_name)
+        self.folios = {(investment_rec.ISIN, investment_rec.Folio) for investment_rec in investor_file.investments}
+        investment_recs = [investment_rec for investment_rec in investor_file.investments
+                           if any(txn.type == "buy" for txn in investment_rec.Transactions)]
+        # Transactions of all investments in one columnar store (investments are views on its rows)
+        self.txn_store = TxnStore(investment_recs)
+        self.investments = [Investment(self, investment_rec, self.txn_store, store_id)
+                            for store_id, investment_rec in enumerate(investment_recs)]
 
         defective_investments = [investment for investment in self.investments if investment.is_defective_data]
         for investment in defective_investments:
             print(investment.defect_desc)
         self.investments = [investment for investment in self.investments if not investment.is_defective_data]
 
+    def append_changes(self, investor_file):
+        """
+        Applies txns added to the investor file since this investor was loaded (investor_file.changes) - new
+        txns are appended to their investments (FIFO matching resumes from their open lots) and new investments
+        are added. Returns False if changes can't be applied incrementally (back dated txns, or changes to an
+        investment dropped as defective); the investor has to be reloaded then.
+        """
+        investments = {(investment.isin, investment.folio): investment for investment in self.investments}
+        for key, txn_recs in investor_file.changes.items():
+            investment = investments.get(key)
+            if investment is None and key in self.folios or (
+                    investment is not None and not self.txn_store.can_append(investment.store_id, txn_recs)):
+                return False
+
+        for key, txn_recs in investor_file.changes.items():
+            if key in investments:
+                investments[key].append_txns(txn_recs)
+                continue
+            self.folios.add(key)
+            investment_rec = investor_file.get_investment(*key)
+            if not any(txn.type == "buy" for txn in investment_rec.Transactions):
+                continue
+            store_id = self.txn_store.add_investment(investment_rec)
+            investments[key] = Investment(self, investment_rec, self.txn_store, store_id)
+            self.investments.append(investments[key])
+
+        for investment in [investments[key] for key in investor_file.changes if key in investments]:
+            if investment.is_defective_data:
+                print(investment.defect_desc)
+        self.investments = [investment for investment in self.investments if not investment.is_defective_data]
+        investor_file.changes = {}
+        return True
+
     def get_filtered_investments(self, tax_treatments=None, mf_categories=None, hide_zero_balance_before=None,
                                  sold_in_fy=None, ):
         filtered_investments = []
@@ -29,7 +65,7 @@ class Investor:
             c2 = (not mf_categories    or
                   investment.mf_category is not None and investment.mf_category   in mf_categories)
             c3 = not hide_zero_balance_before or (investment.last_txn.txn_date >= hide_zero_balance_before or investment.holding > 0)
-            c4 = not sold_in_fy or any([txn for txn in investment.sell_txns if txn.fy==sold_in_fy])
+            c4 = not sold_in_fy or investment.is_sold_in_fy(sold_in_fy)
             if c1 and c2 and c3 and c4:
                 filtered_investments.append(investment)
         return filtered_investments
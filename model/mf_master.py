@@ -1,10 +1,13 @@
 import json
+from contextlib import closing
 from dataclasses import dataclass, asdict, field
 from pathlib import Path
 from typing import Optional, Dict, List
 from datetime import datetime
 import pandas as pd
 
+import model.sqlite_db as sqlite_db
+
 @dataclass
 class MFScheme:
     """Dataclass representing a Mutual Fund Scheme record."""
@@ -44,22 +47,41 @@ class MFSchemeMaster:
         self.user_id = user_id
         self.filepath = Path("data") / user_id / "mf_master.json"
         self.filepath.parent.mkdir(parents=True, exist_ok=True)
+        # On the user's database once the JSON files are migrated to it (see sqlite_db.migrate_from_json)
+        self.use_db = sqlite_db.is_enabled(user_id)
 
-        if not self.filepath.exists():
+        if not self.use_db and not self.filepath.exists():
             self.filepath.write_text("{}", encoding="utf-8")
 
         self.schemes: Dict[str, MFScheme] = self._load()
+        # Off in investor loader processes - schemes they add are saved by the parent. Kept when the singleton is
+        # initialized again (e.g. by an Investor in the loader process)
+        self.autosave = getattr(self, "autosave", True)
+
 
     # ---------- Core File Operations ----------
 
     def _load(self) -> Dict[str, MFScheme]:
         """Load data from JSON and return dictionary of MFScheme objects."""
+        if self.use_db:
+            with closing(sqlite_db.connect(self.user_id)) as db:
+                return {isin: MFScheme(**record) for isin, record in sqlite_db.read_schemes(db).items()}
         with open(self.filepath, "r", encoding="utf-8") as f:
             data = json.load(f)
         return {isin: MFScheme(**record) for isin, record in data.items()}
 
-    def _save(self):
-        """Persist all scheme records to JSON file."""
+    def _save(self, isin=None):
+        """Persist all scheme records to JSON file (only the scheme of the ISIN, if given, to the database)."""
+        if not self.autosave:
+            return
+        if self.use_db:
+            with closing(sqlite_db.connect(self.user_id)) as db:
+                if isin is None:
+                    sqlite_db.write_schemes(db, [asdict(self._set_derived_data(scheme))
+                                                 for scheme in self.schemes.values()])
+                else:
+                    sqlite_db.write_scheme(db, asdict(self._set_derived_data(self.schemes[isin])))
+            return
         data = {isin: asdict(self._set_derived_data(scheme)) for isin, scheme in self.schemes.items()}
         with open(self.filepath, "w", encoding="utf-8") as f:
             json.dump(data, f, indent=2, ensure_ascii=False)
@@ -117,7 +139,7 @@ class MFSchemeMaster:
         self._set_derived_data(new_scheme)
         self.schemes[isin] = new_scheme
 
-        self._save()
+        self._save(isin)
         return self
 
     def save_from_df(self, df: pd.DataFrame):
@@ -173,7 +195,7 @@ class MFSchemeMaster:
                 raise ValueError(f"Invalid field: {field_name}")
 
         self._validate(scheme)
-        self._save()
+        self._save(isin)
 
     def get_scheme(self, isin: str) -> Optional[MFScheme]:
         """
@@ -1,118 +1,599 @@
 import requests
-import re
+import csv
+import io
+import json
+import numpy as np
 import pandas as pd
+import os
 import time
+import threading
+from datetime import date
+from pathlib import Path
 
 # from model.user import User
-import utils.utils as utils
 
 
-class NAV:
-    _instance = None
+REFRESH_TTL_SECONDS = 60 * 60
 
-    def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super().__new__(cls)
-        return cls._instance
 
-    def __init__(self):
-        # self.nav_df = pd.DataFrame([], columns=['isin', 'nav', 'nav_date'])
-        self.nav_pattern = re.compile(r'^([0-9]{6});(.*?);.*?;.*?;([0-9.]+);([0-9]{2}-[a-zA-Z]{3}-(20[2-4][0-9]))$')
+class NAV:
+    """
+    Latest NAV per ISIN.
+    Nothing is fetched when the object is created. load() serves the last saved snapshot straight away and
+    refreshes from AMFI in a background thread; the refreshed table is swapped in as a whole.
+    The snapshot is a fixed-width binary record file (see write_nav_snapshot) that is memory mapped on startup;
+    nav.csv is only written as an export (and read once if no snapshot exists yet).
+    Refreshes are conditional (ETag/If-Modified-Since) and skipped within refresh_ttl seconds of the last check.
+    """
+    def __init__(self, nav_url=None, nav_csv_file=None, nav_snapshot_file=None, nav_history=None,
+                 refresh_ttl=REFRESH_TTL_SECONDS):
+        # url and files can be overridden (e.g. to point to a local http server and a temp folder)
+        self.nav_url = nav_url or r'https://www.amfiindia.com/spages/NAVOpen.txt'
+        self.nav_csv_file = Path(nav_csv_file) if nav_csv_file else Path("data") / "common" / "nav.csv"
+        self.nav_snapshot_file = (Path(nav_snapshot_file) if nav_snapshot_file
+                                  else self.nav_csv_file.with_suffix(".snapshot"))
+        # HTTP validators (ETag/Last-Modified) of the saved snapshot and time of last check with AMFI
+        self.refresh_state_file = self.nav_snapshot_file.with_suffix(".refresh.json")
+        self.download_part_file = self.nav_snapshot_file.with_suffix(".part")
+        self.refresh_ttl = refresh_ttl  # AMFI is not checked again within these many seconds of the last check
+        self.refresh_state = self._load_refresh_state()
+        self.pending_validators = {}
+        self.nav_records = np.empty(0, dtype=SNAPSHOT_RECORD_DTYPE)
+        self.nav_lookup = {}        # {isin: (nav, nav_date ordinal)} - built once per NAV table
+        self.saved_at = None        # Time (epoch seconds) when the current NAV table was saved
+        self.version = 0            # Incremented every time a new NAV table is swapped in
+        self.nav_history = nav_history  # NAVHistory fed with every successful download (optional)
+        self._session = None
+        self._refresh_lock = threading.Lock()
+        self._refresh_thread = None
 
-        self.nav_url = r'https://www.amfiindia.com/spages/NAVOpen.txt'
-        self.nav_csv_file = r'data\common\nav.csv'
-        self.nav_df = pd.DataFrame()
-        self.load()
+    @property
+    def session(self):
+        # One session per NAV store => connection reuse across refreshes
+        if self._session is None:
+            self._session = requests.Session()
+            self._session.headers.update({
+                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+                              "AppleWebKit/537.36 (KHTML, like Gecko) "
+                              "Chrome/120.0.0.0 Safari/537.36",
+                "Accept-Encoding": "gzip, deflate",
+            })
+        return self._session
 
     def download_from_amfi(self):
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                          "AppleWebKit/537.36 (KHTML, like Gecko) "
-                          "Chrome/120.0.0.0 Safari/537.36"
-        }
-        response = requests.get(self.nav_url, headers=headers, timeout=20)
-        if response.status_code != 200:
-            # response.raise_for_status()
-            ts = int(time.time())
-            response = requests.get(f"{self.nav_url}?t={ts}", headers=headers, timeout=20)
-            # response = requests.get(self.nav_url)
-            if response.status_code != 200:
+        """
+        Conditional download of the NAV text. Returns the parsed NAV table, or an empty DataFrame if the download
+        failed or AMFI has nothing new (304 Not Modified, or same ETag/Last-Modified as the saved snapshot).
+        The body is streamed to a .part file; an interrupted download is resumed with a Range request next time.
+        Validators of a successful download are kept in self.pending_validators till the new table is saved.
+        """
+        state = self.refresh_state
+        # Validators are of the saved table - of no use if we do not have a table loaded
+        validators = state if self.nav_lookup else {}
+        headers = {}
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+        resume_from = self.download_part_file.stat().st_size if self.download_part_file.exists() else 0
+        if resume_from and state.get("part_validator"):
+            # Byte offsets are of the un-encoded body, so resume without gzip
+            headers.update({"Range": f"bytes={resume_from}-", "If-Range": state["part_validator"],
+                            "Accept-Encoding": "identity"})
+        try:
+            response = self.session.get(self.nav_url, headers=headers, timeout=20, stream=True)
+            if response.status_code not in (200, 206, 304):
+                # response.raise_for_status()
+                # Retried in full (e.g. 416 for a .part file the server can't resume), bypassing any cache
+                response.close()
+                headers = {name: value for name, value in headers.items()
+                           if name not in ("Range", "If-Range", "Accept-Encoding")}
+                ts = int(time.time())
+                response = self.session.get(f"{self.nav_url}?t={ts}", headers=headers, timeout=20, stream=True)
+
+            if response.status_code == 304:
+                response.close()
+                print("NAVs not modified at AMFI since last download.")
+                self._save_refresh_state(checked_at=time.time())
+                return pd.DataFrame()
+            if response.status_code not in (200, 206):
                 # raise Exception(f"Failed to fetch NAVAll.txt, status {response.status_code}")
+                response.close()
                 print("Not able to download NAV.")
-                self.nav_df = pd.DataFrame()    # empty
+                return pd.DataFrame()    # empty
+
+            etag, last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+            if ((etag and etag == validators.get("etag")) or
+                    (not etag and last_modified and last_modified == validators.get("last_modified"))):
+                # Server ignored the conditional headers, but the upstream timestamp has not changed
+                response.close()
+                print("NAVs not modified at AMFI since last download.")
+                self._save_refresh_state(checked_at=time.time())
+                return pd.DataFrame()
+
+            self._save_refresh_state(part_validator=etag or last_modified)
+            with open(self.download_part_file, "ab" if response.status_code == 206 else "wb") as f:
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    f.write(chunk)
+        except (requests.RequestException, OSError) as e:
+            print(f"Not able to download NAV. ({e.__class__.__name__})")
+            return pd.DataFrame()
+
+        nav_text = self.download_part_file.read_bytes().decode("utf-8", errors="replace")
+        self.download_part_file.unlink()
+        self._save_refresh_state(part_validator=None)
+        self.pending_validators = {"etag": etag, "last_modified": last_modified}
+        return parse_nav_text(nav_text)
+
+    def _load_refresh_state(self):
+        try:
+            with open(self.refresh_state_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save_refresh_state(self, **updates):
+        self.refresh_state = {**self.refresh_state, **updates}
+        self.refresh_state_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.refresh_state_file.with_name(self.refresh_state_file.name + ".tmp")
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(self.refresh_state, f, indent=2)
+        tmp_file.replace(self.refresh_state_file)
+
+    def is_fresh(self):
+        checked_at = self.refresh_state.get("checked_at")
+        return checked_at is not None and time.time() - checked_at < self.refresh_ttl
 
-        if response.status_code == 200:
-            self.nav_df = parse_nav_text(response.text, self.nav_pattern)
+    @property
+    def nav_df(self):
+        # NAV table as DataFrame (isin as index) - for export and inspection only, lookups use nav_lookup
+        records = self.nav_records
+        return pd.DataFrame({
+            'isin': records["isin"].astype(str),
+            'nav': records["nav"],
+            'nav_date': from_ordinals(records["nav_date"]),
+        }).set_index('isin')
+
+    def read_saved(self):
+        # Memory map the saved snapshot. Falls back to the csv file (earlier storage format) if there is no
+        # snapshot yet; the snapshot is then written so that the csv is read only once.
+        snapshot = read_nav_snapshot(self.nav_snapshot_file)
+        if snapshot is not None:
+            print(f'Reading previous values from saved snapshot file.')
+            return snapshot
+        try:
+            nav_df = pd.read_csv(self.nav_csv_file)
+        except (FileNotFoundError, pd.errors.EmptyDataError):
+            return None
+        print(f'Reading previous values from saved csv file.')
+        records = records_from_df(nav_df)
+        saved_at = self.nav_csv_file.stat().st_mtime
+        write_nav_snapshot(self.nav_snapshot_file, records, saved_at)
+        return records, saved_at
+
+    def save(self, records, saved_at):
+        write_nav_snapshot(self.nav_snapshot_file, records, saved_at)
+        self.export_csv()
+
+    def export_csv(self, csv_file=None):
+        # Write to a temp file and rename, so that a reader never sees a half written file
+        csv_file = Path(csv_file) if csv_file else self.nav_csv_file
+        csv_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = csv_file.with_name(csv_file.name + ".tmp")
+        self.nav_df.to_csv(tmp_file, date_format="%d-%b-%Y")
+        tmp_file.replace(csv_file)
+
+    def load(self, background=True):
+        if not self.nav_lookup:
+            saved = self.read_saved()
+            if saved is not None:
+                self._swap(*saved)
+
+        if not self.nav_lookup:   # Nothing saved yet - we have to wait for the download
+            self.refresh(force=True)
+            if not self.nav_lookup:
+                raise FileNotFoundError(f'{self.nav_snapshot_file} not found for reading.')
+        elif background:
+            self.refresh_in_background()
+        else:
+            self.refresh()
         return self
 
-    def load(self):
-        # Uncomment
-        self.download_from_amfi()
-        if not self.nav_df.empty:  # Download successful - save csv for future possible use
-            print(f'Downloaded NAVs from {self.nav_url}')
-            self.nav_df.to_csv(self.nav_csv_file, index=False)
-
-        if self.nav_df.empty:  # If Download unsuccessful...
-            print (f'Reading previous values from saved csv file.')
-            try:    # Read previously saved NAV csv file
-                self.nav_df = pd.read_csv(self.nav_csv_file)
-            except Exception as e:
-                raise FileNotFoundError(f'{self.nav_csv_file} not found for reading.')
-
-        # We have isin, nav and nav_date in the DF with isin as index
-        self.nav_df["nav_date"] = self.nav_df["nav_date"].apply(utils.normalize_date)
-        self.nav_df.set_index('isin', inplace=True)
+    def refresh(self, force=False):
+        # Download from AMFI and swap in the new table (current table is retained if the download fails or if
+        # AMFI has nothing new). Skipped within refresh_ttl of the last check, unless forced.
+        with self._refresh_lock:
+            if not force and self.nav_lookup and self.is_fresh():
+                return self
+            nav_df = self.download_from_amfi()
+            if not nav_df.empty:    # Download successful - save snapshot (and csv) for future possible use
+                print(f'Downloaded NAVs from {self.nav_url}')
+                records, saved_at = records_from_df(nav_df), time.time()
+                self._swap(records, saved_at)
+                self.save(records, saved_at)
+                self._save_refresh_state(checked_at=saved_at, **self.pending_validators)
+                if self.nav_history is not None:
+                    self.nav_history.append(records_from_df(nav_df, include_reinvest=True))
+        return self
+
+    def refresh_in_background(self):
+        if self._refresh_thread is None or not self._refresh_thread.is_alive():
+            self._refresh_thread = threading.Thread(target=self.refresh, name="nav-refresh", daemon=True)
+            self._refresh_thread.start()
+        return self._refresh_thread
+
+    def wait_for_refresh(self, timeout=None):
+        if self._refresh_thread is not None:
+            self._refresh_thread.join(timeout)
         return self
 
+    def _swap(self, records, saved_at):
+        # The new table is fully prepared before it replaces the current one (single reference assignment)
+        nav_lookup = dict(zip(records["isin"].astype(str).tolist(),
+                              zip(records["nav"].tolist(), records["nav_date"].tolist())))
+        self.nav_lookup, self.nav_records, self.saved_at = nav_lookup, records, saved_at
+        self.version += 1
+
+    def nav_and_date(self, isin):
+        # Returns (nav, nav_date) or (None, None) if isin is not known
+        nav_rec = self.nav_lookup.get(isin)
+        return (nav_rec[0], date.fromordinal(nav_rec[1])) if nav_rec else (None, None)
+
+    def lookup_many(self, isins):
+        nav_lookup = self.nav_lookup
+        return [(nav_rec[0], date.fromordinal(nav_rec[1])) if nav_rec else (None, None)
+                for nav_rec in (nav_lookup.get(isin) for isin in isins)]
+
+
+def parse_nav_text(nav_file_text, min_year=2024):
+    """
+    Parse AMFI NAV text (NAVOpen.txt or NAVAll archive files) into a DataFrame with columns isin (str),
+    nav (float) and nav_date (datetime64), keeping only NAVs dated in or after min_year.
+    The semicolon delimited payload is split in bulk by the csv reader; scheme section headers, blank lines and
+    rows that are not of a 6 digit AMFI scheme code are dropped by column-wise checks instead of matching a regex
+    on every line. Columns are found by the header line (NAVAll archives have Repurchase and Sale Price too).
+    """
+    header, _, payload = nav_file_text.partition("\n")
+    columns = [column.strip() for column in header.split(";")]
+    positions = [_column_position(columns, name, default) for name, default in NAV_TEXT_COLUMNS]
 
-def parse_nav_text(nav_file_text, pattern):
-    lines = nav_file_text.splitlines()
-    nav_rows = []
-    for line in lines:
-        match = pattern.match(line)
-        if match:
-            amfi_code, isin, nav, nav_date, nav_year = match.groups()
-            # nav_date = datetime.strptime(nav_date, '%d-%b-%Y').date()
-            # nav_date = utils.normalize_date(nav_date)
-            if int(nav_year) >= 2024:
-                nav_rows.append({
-                    'isin': isin,
-                    'nav': float(nav),
-                    'nav_date': nav_date,
-                })
-    nav_df = pd.DataFrame(nav_rows)
+    rows = pd.read_csv(io.StringIO(payload), sep=";", header=None, names=range(len(columns)), usecols=positions,
+                       dtype=str, quoting=csv.QUOTE_NONE, skip_blank_lines=True, on_bad_lines="skip",
+                       engine="c")
+    amfi_code, isin, isin_reinvest, nav, nav_date = (rows[position] for position in positions)
+
+    nav = pd.to_numeric(nav, errors="coerce")
+    nav_date = pd.to_datetime(nav_date, format="%d-%b-%Y", errors="coerce")
+    keep = amfi_code.str.fullmatch(r"[0-9]{6}", na=False) & nav.notna() & (nav_date.dt.year >= min_year)
+
+    nav_df = pd.DataFrame({
+        'isin': isin[keep].str.strip().to_numpy(),
+        'isin_reinvest': isin_reinvest[keep].str.strip().to_numpy(),
+        'nav': nav[keep].to_numpy(dtype=np.float64),
+        'nav_date': nav_date[keep].to_numpy(),
+    })
     return nav_df
 
+# (Column name in AMFI header line, default position if the header is not as expected)
+NAV_TEXT_COLUMNS = [
+    ("Scheme Code", 0),
+    ("ISIN Div Payout/ ISIN Growth", 1),
+    ("ISIN Div Reinvestment", 2),
+    ("Net Asset Value", 4),
+    ("Date", -1),
+]
+
+def _column_position(columns, name, default):
+    return columns.index(name) if name in columns else default % len(columns)
+
+def parse_nav_dates(nav_dates):
+    # Vectorized parsing of saved NAV dates: AMFI format (11-Dec-2025) or ISO format (2025-12-11)
+    parsed = pd.to_datetime(nav_dates, format="%d-%b-%Y", errors="coerce")
+    return parsed.fillna(pd.to_datetime(nav_dates, format="%Y-%m-%d", errors="coerce"))
+
+def to_ordinals(nav_dates):
+    # datetime64 values to date.toordinal() numbers (days since 01-01-0001)
+    return nav_dates.to_numpy(dtype="datetime64[D]").astype(np.int64) + EPOCH_ORDINAL
+
+def from_ordinals(ordinals):
+    return (np.asarray(ordinals, dtype=np.int64) - EPOCH_ORDINAL).astype("datetime64[D]")
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+# ---------- Binary NAV snapshot ----------
+# Layout: one header record followed by count fixed-width NAV records (little endian).
+SNAPSHOT_MAGIC = b"NAVSNAP"
+SNAPSHOT_FORMAT_VERSION = 1
+SNAPSHOT_HEADER_DTYPE = np.dtype([("magic", "S8"), ("format_version", "<u4"), ("count", "<u4"),
+                                  ("saved_at", "<f8")])
+SNAPSHOT_RECORD_DTYPE = np.dtype([("isin", "S12"), ("nav", "<f8"), ("nav_date", "<i4")])
+
+def records_from_df(nav_df, include_reinvest=False):
+    # NAV DataFrame (isin, nav, nav_date columns) to snapshot records
+    # include_reinvest => Also add a record for the Div Reinvestment ISIN (same NAV) where there is one
+    # Rows without an ISIN are dropped (they would all be saved as isin "nan")
+    nav_df = nav_df[nav_df["isin"].notna()]
+    nav_date = nav_df["nav_date"]
+    if not pd.api.types.is_datetime64_any_dtype(nav_date):
+        nav_date = parse_nav_dates(nav_date)
+    records = np.empty(len(nav_df), dtype=SNAPSHOT_RECORD_DTYPE)
+    records["isin"] = nav_df["isin"].to_numpy(dtype=object)
+    records["nav"] = nav_df["nav"].to_numpy(dtype=np.float64)
+    records["nav_date"] = to_ordinals(nav_date)
+    if include_reinvest and "isin_reinvest" in nav_df:
+        reinvest_records = records.copy()
+        reinvest_records["isin"] = nav_df["isin_reinvest"].fillna("-").to_numpy(dtype=object)
+        records = np.concatenate([records, reinvest_records[reinvest_records["isin"] != b"-"]])
+    return records
+
+def write_nav_snapshot(snapshot_file, records, saved_at):
+    # Written to a temp file and renamed, so that a reader never sees a half written snapshot
+    snapshot_file = Path(snapshot_file)
+    snapshot_file.parent.mkdir(parents=True, exist_ok=True)
+    header = np.array([(SNAPSHOT_MAGIC, SNAPSHOT_FORMAT_VERSION, len(records), saved_at)],
+                      dtype=SNAPSHOT_HEADER_DTYPE)
+    tmp_file = snapshot_file.with_name(snapshot_file.name + ".tmp")
+    with open(tmp_file, "wb") as f:
+        f.write(header.tobytes())
+        f.write(np.ascontiguousarray(records, dtype=SNAPSHOT_RECORD_DTYPE).tobytes())
+    tmp_file.replace(snapshot_file)
+
+def read_nav_snapshot(snapshot_file):
+    # Returns (memory mapped records, saved_at) or None if the file is missing or not a valid snapshot
+    try:
+        header = np.fromfile(snapshot_file, dtype=SNAPSHOT_HEADER_DTYPE, count=1)
+    except FileNotFoundError:
+        return None
+    if (len(header) == 0 or header["magic"][0] != SNAPSHOT_MAGIC
+            or header["format_version"][0] != SNAPSHOT_FORMAT_VERSION):
+        print(f'Ignoring {snapshot_file} - not a NAV snapshot of format version {SNAPSHOT_FORMAT_VERSION}.')
+        return None
+    count = int(header["count"][0])
+    if count == 0:
+        return np.empty(0, dtype=SNAPSHOT_RECORD_DTYPE), float(header["saved_at"][0])
+    records = np.memmap(snapshot_file, dtype=SNAPSHOT_RECORD_DTYPE, mode="r",
+                        offset=SNAPSHOT_HEADER_DTYPE.itemsize, shape=(count,))
+    return records, float(header["saved_at"][0])
 
 
-nav_object = NAV()
+class NAVHistory:
+    """
+    Append-only NAV history of all ISINs with as-of lookups.
+    Records (same layout as the snapshot records) are appended to a binary file; on load they are sorted by
+    (isin, date) into flat arrays so that the NAV series of an ISIN is one contiguous, date sorted slice.
+    The history is fed from every AMFI download and from NAVAll archive files (data/NAVAll_*.txt are ingested
+    when the history file is first created). Nothing is read until the first lookup or append.
+    """
+    def __init__(self, history_file=None, archive_folder=None):
+        self.history_file = Path(history_file) if history_file else Path("data") / "common" / "nav_history.bin"
+        self.archive_folder = Path(archive_folder) if archive_folder else Path("data")
+        self._series = None         # (records sorted by isin/date, int64 sort keys, {isin: code}) - swapped as one
+        self._lock = threading.Lock()
+
+    @property
+    def series(self):
+        if self._series is None:
+            self.load()
+        return self._series
+
+    def load(self):
+        with self._lock:
+            if self._series is None:
+                is_new = not self.history_file.exists()
+                try:
+                    records = read_nav_history(self.history_file)
+                except ValueError as e:
+                    # Damaged or not a history file - set aside (not overwritten) and started again
+                    set_aside = self.history_file.with_name(f"{self.history_file.name}.unreadable-{time.time_ns()}")
+                    self.history_file.replace(set_aside)
+                    print(f"WARNING: {e} Set aside as {set_aside} - NAV history is built again.")
+                    records, is_new = np.empty(0, dtype=SNAPSHOT_RECORD_DTYPE), True
+                self._rebuild(records)
+                if is_new:
+                    write_nav_history_header(self.history_file)
+                    for archive_file in sorted(self.archive_folder.glob("NAVAll_*.txt")):
+                        self._append(records_from_archive(archive_file))
+        return self
+
+    def add_archive_file(self, archive_file):
+        # Ingest an AMFI NAVAll archive file (e.g. data/NAVAll_31Jan2018.txt); returns the number of new records
+        return self.append(records_from_archive(archive_file))
+
+    def append(self, records):
+        # Appends records for (isin, date) not already in the history; returns the number of records appended
+        self.series     # Ensure loaded
+        with self._lock:
+            return self._append(records)
+
+    def _append(self, records):
+        records = records[records["isin"] != b"-"]
+        records = records[~self._contains(records)]
+        if len(records) > 0:
+            append_nav_history(self.history_file, records)
+            self._rebuild(np.concatenate([self._series[0], records]))
+        return len(records)
+
+    def _contains(self, records):
+        existing = self._series[0] if self._series is not None else np.empty(0, dtype=SNAPSHOT_RECORD_DTYPE)
+        if len(existing) == 0 or len(records) == 0:
+            return np.zeros(len(records), dtype=bool)
+        combined = np.concatenate([existing, records])
+        keys = _series_keys(np.unique(combined["isin"], return_inverse=True)[1], combined["nav_date"])
+        return np.isin(keys[len(existing):], keys[:len(existing)])
+
+    def _rebuild(self, records):
+        # Sort by (isin, date), keeping the last appended record for a repeated (isin, date)
+        order = np.lexsort((records["nav_date"], records["isin"]))
+        records = records[order]
+        if len(records) > 1:
+            is_last = np.append((records["isin"][1:] != records["isin"][:-1]) |
+                                (records["nav_date"][1:] != records["nav_date"][:-1]), True)
+            records = records[is_last]
+        isins, isin_codes = np.unique(records["isin"], return_inverse=True)
+        codes = {isin.decode(): code for code, isin in enumerate(isins.tolist())}
+        self._series = (records, _series_keys(isin_codes, records["nav_date"]), codes)
+
+    def isins(self):
+        return list(self.series[2])
+
+    def nav_series(self, isin):
+        # (nav_date ordinals, navs) of the isin in date order
+        records, keys, codes = self.series
+        code = codes.get(isin, -1)
+        start, end = np.searchsorted(keys, _series_keys(code, [0, SERIES_MAX_ORDINAL]))
+        return records["nav_date"][start:end], records["nav"][start:end]
+
+    def nav_as_of(self, isin, on_date):
+        # Last known (nav, nav_date) on or before on_date, or (None, None)
+        navs = self.nav_matrix([isin], [on_date], with_dates=True)
+        nav_ordinal = navs[1][0, 0]
+        return (float(navs[0][0, 0]), date.fromordinal(int(nav_ordinal))) if nav_ordinal > 0 else (None, None)
+
+    def nav_matrix(self, isins, dates, with_dates=False):
+        """
+        NAVs as of each of the dates (columns) for each of the isins (rows) - NaN where no NAV is known on or
+        before the date. with_dates => also return the matching matrix of NAV date ordinals (0 where unknown).
+        """
+        records, keys, codes = self.series
+        if len(keys) == 0:      # Nothing in the history yet
+            navs = np.full((len(isins), len(dates)), np.nan)
+            return (navs, np.zeros(navs.shape, dtype=np.int64)) if with_dates else navs
+        isin_codes = np.array([codes.get(isin, -1) for isin in isins], dtype=np.int64)
+        ordinals = np.array([_ordinal(a_date) for a_date in dates], dtype=np.int64)
+        query_keys = _series_keys(isin_codes[:, None], ordinals[None, :])
+        positions = np.searchsorted(keys, query_keys, side="right") - 1
+        found = (positions >= 0) & (isin_codes[:, None] >= 0)
+        found &= (keys[np.maximum(positions, 0)] >> 32) == isin_codes[:, None]
+        navs = np.where(found, records["nav"][np.maximum(positions, 0)], np.nan)
+        if not with_dates:
+            return navs
+        nav_dates = np.where(found, records["nav_date"][np.maximum(positions, 0)], 0)
+        return navs, nav_dates
+
+
+SERIES_MAX_ORDINAL = date.max.toordinal()
+
+def _series_keys(isin_codes, ordinals):
+    # Single sortable int64 key per (isin code, date ordinal)
+    return (np.asarray(isin_codes, dtype=np.int64) << 32) | np.asarray(ordinals, dtype=np.int64)
+
+def _ordinal(a_date):
+    return a_date if isinstance(a_date, (int, np.integer)) else a_date.toordinal()
+
+def records_from_archive(archive_file):
+    nav_text = Path(archive_file).read_text(encoding="utf-8")
+    return records_from_df(parse_nav_text(nav_text, min_year=0), include_reinvest=True)
+
+# History file: snapshot header (count unused - records are only ever appended) followed by snapshot records
+HISTORY_MAGIC = b"NAVHIST"
+
+def write_nav_history_header(history_file):
+    history_file = Path(history_file)
+    history_file.parent.mkdir(parents=True, exist_ok=True)
+    header = np.array([(HISTORY_MAGIC, SNAPSHOT_FORMAT_VERSION, 0, time.time())], dtype=SNAPSHOT_HEADER_DTYPE)
+    tmp_file = history_file.with_name(history_file.name + ".tmp")
+    tmp_file.write_bytes(header.tobytes())
+    tmp_file.replace(history_file)
+
+def append_nav_history(history_file, records):
+    with open(history_file, "ab") as f:
+        f.write(np.ascontiguousarray(records, dtype=SNAPSHOT_RECORD_DTYPE).tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+
+def read_nav_history(history_file):
+    try:
+        header = np.fromfile(history_file, dtype=SNAPSHOT_HEADER_DTYPE, count=1)
+    except FileNotFoundError:
+        return np.empty(0, dtype=SNAPSHOT_RECORD_DTYPE)
+    if (len(header) == 0 or header["magic"][0] != HISTORY_MAGIC
+            or header["format_version"][0] != SNAPSHOT_FORMAT_VERSION):
+        raise ValueError(f'{history_file} is not a NAV history file of format version {SNAPSHOT_FORMAT_VERSION}.')
+    # A partly written last record (interrupted append) is ignored
+    count = (Path(history_file).stat().st_size - SNAPSHOT_HEADER_DTYPE.itemsize) // SNAPSHOT_RECORD_DTYPE.itemsize
+    return np.fromfile(history_file, dtype=SNAPSHOT_RECORD_DTYPE, count=count,
+                       offset=SNAPSHOT_HEADER_DTYPE.itemsize)
+
+
+_nav_object = None
+_nav_history = None
+_nav_object_lock = threading.Lock()
+
+def get_nav_object():
+    # NAV store is created and loaded on first use (not at import time)
+    global _nav_object
+    if _nav_object is None:
+        with _nav_object_lock:
+            if _nav_object is None:
+                _nav_object = NAV(nav_history=get_nav_history()).load()
+    return _nav_object
+
+def get_nav_history():
+    # NAV history is created on first use and loaded on its first lookup
+    global _nav_history
+    if _nav_history is None:
+        _nav_history = NAVHistory()
+    return _nav_history
+
+def nav_as_of(isin, on_date):
+    return get_nav_history().nav_as_of(isin, on_date)
+
+def nav_matrix(isins, dates, with_dates=False):
+    return get_nav_history().nav_matrix(isins, dates, with_dates)
+
+def nav_version():
+    return get_nav_object().version
 
 def nav_and_date(isin):
-    # print(nav_object.nav_df.head())
-    # print(nav_object.nav_df.tail())
-    # print (nav_object.nav_df["nav"].get(isin, None), nav_object.nav_df["nav_date"].get(isin, None))
-    # # return nav_object.nav_df["nav"].get(isin, None), nav_object.nav_df["nav_date"].get(isin, None)
-    # print(isin, nav_object.nav_df.index)
-    return (nav_object.nav_df.loc[isin, 'nav'],
-            nav_object.nav_df.loc[isin, 'nav_date'],
-            ) if isin in nav_object.nav_df.index else (None, None)
+    return get_nav_object().nav_and_date(isin)
+
+def lookup_many(isins):
+    # [(nav, nav_date), ...] in the same order as isins
+    return get_nav_object().lookup_many(isins)
 
 def nav(isin):
-    return nav_object.nav_df.loc[isin, 'nav'] if isin in nav_object.nav_df.index else None
+    return nav_and_date(isin)[0]
 def nav_date(isin):
-    return nav_object.nav_df.loc[isin, 'nav_date'] if isin in nav_object.nav_df.index else None
+    return nav_and_date(isin)[1]
 
 def nav_download():
-    nav_object.load()
+    # Explicit download request - ignores the TTL (still conditional, so cheap if AMFI has nothing new)
+    get_nav_object().refresh(force=True)
 
 def nav_on_31012018(isin):
-    return {
-        "INF769K01BI1": 54.687,  # Mirae Asset Large and Midcap Fund - Dir Growth
-        "INF769K01AX2": 51.799,  # Mirae Asset Large Cap Fund - Dir Growth
-        "INF760K01EI4": 101.1400,  # Canara Robeco Large and Mid Cap Fund - Dir Growth
-        "INF109K015K4": 277.8452,  # ICICI Prudential Multi-Asset Fund - Dir Growth
-        "INF109K016E5": 21.8368,  # ICICI Prudential All Seasons Bond Fund - Dir Growth
-    }.get(isin, 0)
+    # Fair market value (NAV on 31-Jan-2018) for grandfathering of LTCG - 0 if the isin is not known
+    return get_fmv_31012018().get(isin, 0)
+
+def get_fmv_31012018():
+    # {isin: FMV} for growth, payout and reinvestment isins - built once from the NAVAll archive of 31-Jan-2018
+    global _fmv_31012018
+    if _fmv_31012018 is None:
+        _fmv_31012018 = load_fmv_index(Path("data") / "NAVAll_31Jan2018.txt",
+                                       Path("data") / "common" / "fmv_31jan2018.snapshot",
+                                       GRANDFATHERING_DATE)
+    return _fmv_31012018
+
+GRANDFATHERING_DATE = date(2018, 1, 31)
+GRANDFATHERED_SALES_FROM = date(2018, 4, 1)     # s.112A - LTCG of units sold from this date are grandfathered
+_fmv_31012018 = None
+
+def load_fmv_index(archive_file, fmv_file, on_date):
+    """
+    {isin: NAV as on on_date (or last NAV before it)} from an AMFI NAVAll archive file.
+    The archive is parsed only once; the index is saved as a NAV snapshot file (fmv_file) and read from there after.
+    """
+    snapshot = read_nav_snapshot(fmv_file)
+    if snapshot is not None:
+        records = snapshot[0]
+    else:
+        records = records_from_archive(archive_file)
+        records = records[(records["nav_date"] <= on_date.toordinal()) & (records["isin"] != b"-")]
+        records = records[np.lexsort((records["nav_date"], records["isin"]))]
+        if len(records) > 1:    # Last NAV (on or before on_date) of each isin
+            records = records[np.append(records["isin"][1:] != records["isin"][:-1], True)]
+        write_nav_snapshot(fmv_file, records, time.time())
+    return dict(zip(records["isin"].astype(str).tolist(), records["nav"].tolist()))
 
 
 def download_mfapi(isin_set):
@@ -124,4 +605,4 @@ def download_mfapi(isin_set):
 if __name__ == '__main__':
     print(nav_and_date('INF209KA12Z1'))
     print(nav_and_date('INF209K01LR8'))
-    print(nav_and_date('INF209K01LV0'))
\ No newline at end of file
+    print(nav_and_date('INF209K01LV0'))
@@ -0,0 +1,196 @@
+# Optional SQLite storage of a user's investor transactions and MF master (instead of the JSON files)
+# It is used once the JSON files of the user are migrated to it - python -m model.sqlite_db <user_id>
+import json
+import sqlite3
+import sys
+from pathlib import Path
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS investments (
+    id          INTEGER PRIMARY KEY,
+    investor    TEXT NOT NULL,
+    isin        TEXT NOT NULL,
+    folio       TEXT NOT NULL,
+    scheme_name TEXT NOT NULL,
+    UNIQUE (investor, isin, folio)
+);
+CREATE INDEX IF NOT EXISTS investments_isin ON investments (isin, folio);
+
+CREATE TABLE IF NOT EXISTS transactions (
+    id            INTEGER PRIMARY KEY,
+    investment_id INTEGER NOT NULL REFERENCES investments (id) ON DELETE CASCADE,
+    date          TEXT NOT NULL,
+    type          TEXT NOT NULL,
+    quantity      REAL NOT NULL,
+    price         REAL NOT NULL,
+    tax           REAL NOT NULL,
+    source        TEXT
+);
+CREATE INDEX IF NOT EXISTS transactions_investment ON transactions (investment_id, date);
+
+CREATE TABLE IF NOT EXISTS schemes (
+    isin           TEXT PRIMARY KEY,
+    scheme_name    TEXT NOT NULL,
+    last_txn_date  TEXT,
+    is_under_ltcg  INTEGER,
+    is_under_stcg  INTEGER,
+    is_under_asr   INTEGER,
+    exit_load_days INTEGER,
+    ltcg_days      INTEGER,
+    tags           TEXT NOT NULL
+);
+
+-- Changes counter - bumped by every write (see data_version)
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('data_version', 0);
+"""
+
+SCHEME_FIELDS = ("isin", "scheme_name", "last_txn_date", "is_under_ltcg", "is_under_stcg", "is_under_asr",
+                 "exit_load_days", "ltcg_days", "tags")
+
+
+def db_file(user_id):
+    return Path("data") / user_id / "investments.db"
+
+def is_enabled(user_id):
+    return db_file(user_id).exists()
+
+def connect(user_id):
+    # Opened per operation (and closed after it) - Streamlit reruns a script on other threads
+    # Schema and WAL mode are set up once, by the migration (see create_schema)
+    db = sqlite3.connect(db_file(user_id), timeout=30)
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.execute("PRAGMA foreign_keys=ON")
+    return db
+
+def create_schema(db):
+    # WAL (kept by the database file) - readers (e.g. investor loader processes) don't block the writer and see
+    # only committed changes
+    db.execute("PRAGMA journal_mode=WAL")
+    db.executescript(SCHEMA)
+
+def investor_key(investor_name):
+    # Same as the investor's JSON file name, so that names are matched as they were with the files
+    return investor_name.lower().replace(' ', '_')
+
+def data_version(user_id):
+    # Changes count of the database (the user snapshot is keyed on it - the file itself changes on checkpoints)
+    db = connect(user_id)
+    try:
+        return db.execute("SELECT value FROM meta WHERE key = 'data_version'").fetchone()[0]
+    finally:
+        db.close()
+
+def _bump_data_version(db):
+    db.execute("UPDATE meta SET value = value + 1 WHERE key = 'data_version'")
+
+def get_investor_names(db):
+    # In the order investors were added (as migrated, the order of their JSON files)
+    rows = db.execute("SELECT investor FROM investments GROUP BY investor ORDER BY MIN(id)").fetchall()
+    return [investor.replace("_", " ").title() for investor, in rows]
+
+# ---------- Investor transactions ----------
+
+def read_investments(db, investor):
+    """
+    Investments of an investor in the order they were added, as (isin, folio, scheme_name, txns) with txns as
+    (date, type, quantity, price, tax, source) in date order (same date in the order they were added).
+    """
+    investments = {}
+    for investment_id, isin, folio, scheme_name in db.execute(
+            "SELECT id, isin, folio, scheme_name FROM investments WHERE investor = ? ORDER BY id", (investor,)):
+        investments[investment_id] = (isin, folio, scheme_name, [])
+    for investment_id, *txn in db.execute(
+            "SELECT t.investment_id, t.date, t.type, t.quantity, t.price, t.tax, t.source "
+            "FROM transactions t JOIN investments i ON i.id = t.investment_id "
+            "WHERE i.investor = ? ORDER BY t.investment_id, t.date, t.id", (investor,)):
+        investments[investment_id][3].append(tuple(txn))
+    return list(investments.values())
+
+def write_changes(db, investor, entries):
+    """Apply add/delete/rename changes (see InvestmentFileManager._save) of an investor in one transaction."""
+    with db:
+        _bump_data_version(db)
+        for entry in entries:
+            key = (investor, entry["ISIN"], entry["Folio"])
+            if entry["op"] == "add":
+                db.execute("INSERT OR IGNORE INTO investments (investor, isin, folio, scheme_name) VALUES (?, ?, ?, ?)",
+                           key + (entry["SchemeName"],))
+                investment_id, = db.execute("SELECT id FROM investments WHERE investor = ? AND isin = ? AND folio = ?",
+                                            key).fetchone()
+                db.executemany("INSERT INTO transactions (investment_id, date, type, quantity, price, tax, source) "
+                               "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                               [(investment_id, txn["date"], txn["type"], txn["quantity"], txn["price"], txn["tax"],
+                                 txn["source"]) for txn in entry["Transactions"]])
+            elif entry["op"] == "delete":
+                db.execute("DELETE FROM investments WHERE investor = ? AND isin = ? AND folio = ?", key)
+            elif entry["op"] == "rename":
+                db.execute("UPDATE investments SET scheme_name = ? WHERE investor = ? AND isin = ? AND folio = ?",
+                           (entry["SchemeName"],) + key)
+
+# ---------- MF master ----------
+
+def read_schemes(db):
+    # {isin: scheme record} - record has the MFScheme fields
+    schemes = {}
+    for row in db.execute(f"SELECT {', '.join(SCHEME_FIELDS)} FROM schemes ORDER BY rowid"):
+        record = dict(zip(SCHEME_FIELDS, row))
+        for name in ("is_under_ltcg", "is_under_stcg", "is_under_asr"):
+            record[name] = None if record[name] is None else bool(record[name])
+        record["tags"] = json.loads(record["tags"])
+        schemes[record["isin"]] = record
+    return schemes
+
+def _scheme_row(record):
+    return tuple(json.dumps(record[name]) if name == "tags" else record[name] for name in SCHEME_FIELDS)
+
+def write_schemes(db, records):
+    # Replaces all schemes with the given scheme records
+    with db:
+        _bump_data_version(db)
+        db.execute("DELETE FROM schemes")
+        db.executemany(f"INSERT INTO schemes ({', '.join(SCHEME_FIELDS)}) VALUES ({', '.join('?' * len(SCHEME_FIELDS))})",
+                       [_scheme_row(record) for record in records])
+
+def write_scheme(db, record):
+    # Adds the scheme record or updates the scheme of its ISIN (the other schemes are not rewritten)
+    updates = ", ".join(f"{name} = excluded.{name}" for name in SCHEME_FIELDS[1:])
+    with db:
+        _bump_data_version(db)
+        db.execute(f"INSERT INTO schemes ({', '.join(SCHEME_FIELDS)}) VALUES ({', '.join('?' * len(SCHEME_FIELDS))}) "
+                   f"ON CONFLICT (isin) DO UPDATE SET {updates}", _scheme_row(record))
+
+# ---------- Migration ----------
+
+def migrate_from_json(user_id):
+    """
+    Copies the investor files (with their journals) and the MF master of the user from the JSON files to a new
+    database - from then on the database is used instead of the JSON files (which are left as they were).
+    """
+    from dataclasses import asdict
+    import model.investment_file as investment_file
+    from model.mf_master import MFSchemeMaster
+
+    if is_enabled(user_id):
+        raise FileExistsError(f"{db_file(user_id)} already exists.")
+    investor_files = investment_file.get_all(user_id)
+    mf_master = MFSchemeMaster(user_id)
+    tmp_file = db_file(user_id).with_name(db_file(user_id).name + ".tmp")
+    tmp_file.unlink(missing_ok=True)
+    db = sqlite3.connect(tmp_file)
+    create_schema(db)
+    for investor_file in investor_files:
+        write_changes(db, investor_key(investor_file.investor_name),
+                      [{"op": "add", **asdict(inv)} for inv in investor_file.investments])
+    write_schemes(db, [asdict(scheme) for scheme in mf_master.get_all_schemes()])
+    db.close()
+    # Renamed when complete - a failed migration leaves the user on the JSON files
+    tmp_file.replace(db_file(user_id))
+    print(f"Migrated {len(investor_files)} investor(s), {len(mf_master.schemes)} scheme(s) to {db_file(user_id)}")
+
+
+if __name__ == "__main__":
+    migrate_from_json(sys.argv[1] if len(sys.argv) > 1 else "Hemant")
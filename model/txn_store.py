@@ -0,0 +1,416 @@
+import numpy as np
+from datetime import date
+from functools import lru_cache
+
+import model.nav as nav
+import utils.utils as utils
+
+BUY, SELL = 1, -1
+
+# One row per transaction - rows of an investment are in the order of its records (appended txns at the end)
+TXN_DTYPE = np.dtype([
+    ("investment", "i4"),       # Position of the investment in the store
+    ("txn_date", "i4"),         # Date ordinal
+    ("type", "i1"),             # BUY or SELL
+    ("units", "f8"),            # Negative for SELL
+    ("price", "f8"),
+    ("tax", "f8"),              # Stamp duty (BUY) or STT (SELL)
+    ("amount", "f8"),           # Amount paid (BUY) or received (SELL)
+    ("unmatched_units", "f8"),  # Units not (yet) matched by FIFO
+    ("cumm_balance", "f8"),
+])
+
+# One row per matched lot (units of a sell txn matched with units of a buy txn) - in FIFO order per investment
+LOT_DTYPE = np.dtype([
+    ("investment", "i4"),
+    ("buy", "i4"),              # Row of the buy txn
+    ("sell", "i4"),             # Row of the sell txn
+    ("units", "f8"),
+    ("buy_date", "i4"),
+    ("sell_date", "i4"),
+    ("holding_days", "i4"),
+    ("fy", "i2"),               # FY of the sale (as 4 digit year, e.g. 2026 for 2025-26)
+    ("buy_amount", "f8"),
+    ("sell_amount", "f8"),
+    ("stamp_duty", "f8"),
+    ("stt", "f8"),
+    ("pnl", "f8"),
+])
+
+# Tax treatment of an investment (from MF master) - one row per investment
+TAX_FLAGS_DTYPE = np.dtype([("asr", "?"), ("stcg", "?"), ("ltcg", "?"), ("ltcg_days", "i4")])
+
+# Taxation of a matched lot (as per tax flags of its investment) - one row per lot
+SLAB_RATE, STCG, LTCG = 1, 2, 4     # Bits of tax_class
+LOT_TAX_DTYPE = np.dtype([
+    ("tax_class", "u1"),
+    ("fmv", "f8"),                  # NAV on 31-Jan-2018 (for grandfathered lots, else 0)
+    ("deemed_coa", "f8"),           # Deemed cost of acquisition (per unit) - grandfathered for lots bought by
+                                    # 31-Jan-2018 and sold from 1-Apr-2018
+    ("ltcg", "f8"),                 # Gain for LTCG - grandfathered for equity, else same as pnl
+])
+GRANDFATHERING_ORDINAL = nav.GRANDFATHERING_DATE.toordinal()
+GRANDFATHERED_SALES_ORDINAL = nav.GRANDFATHERED_SALES_FROM.toordinal()
+
+class TxnStore:
+    """
+    Columnar store of the transactions of all investments of an investor (structured arrays of txns and of
+    FIFO matched lots). Investment, BuyTxn, SellTxn and MatchedTxn objects are views on its rows, and the
+    aggregates of all investments (holdings, realized and unrealized P&L, taxes) are computed at once with
+    vectorized reductions (cached until NAVs are refreshed, for those that depend on NAV).
+    Txns of an investment can be appended later (e.g. from a new CAS) - new rows go at the end of the arrays
+    and FIFO matching resumes from the first open lot of the investment.
+    """
+    def __init__(self, investment_recs):
+        self.isins = [rec.ISIN for rec in investment_recs]
+        self.txns = _txns_from_records([investment_rec.Transactions for investment_rec in investment_recs])
+        counts = np.bincount(self.txns["investment"], minlength=len(investment_recs))
+        offsets = np.cumsum(counts)[:-1]
+        # Holding is the sum of quantities as recorded (not of rounded units)
+        self.quantities = [sum(txn_rec.quantity for txn_rec in investment_rec.Transactions)
+                           for investment_rec in investment_recs]
+        self.holdings = np.round(np.array(self.quantities, dtype=np.float64), 4)
+        txns = self.txns
+        date_order = np.lexsort((np.arange(len(txns)), txns["type"] == SELL, txns["txn_date"], txns["investment"]))
+        self._txn_rows = np.split(np.arange(len(txns)), offsets)    # Rows of each investment in record order
+        self._date_orders = [rows.tolist() for rows in np.split(date_order, offsets)]
+        self.tax_flags = np.zeros(len(investment_recs), dtype=TAX_FLAGS_DTYPE)     # Set by investments
+        self._tax_flags_version = 0
+        self.balance_errors = {}    # {investment: row where cumulative balance goes negative}
+        self.match_errors = {}      # {investment: (error, sell row, buy row)}
+        self._compute_cumulative_balances()
+        self.lots = self._match_all()
+        self._lot_rows = np.split(np.arange(len(self.lots)),
+                                  np.cumsum(np.bincount(self.lots["investment"], minlength=len(self)))[:-1])
+        self.version = 0
+        self._reductions = {}
+
+    def __len__(self):
+        return len(self.isins)
+
+    def __getstate__(self):
+        # Pickled (see user snapshot) without the cached reductions - NAV versions they are keyed on are per process
+        state = self.__dict__.copy()
+        state["_reductions"] = {}
+        return state
+
+    def txn_rows(self, investment):
+        return self._txn_rows[investment]
+
+    def lot_rows(self, investment):
+        return self._lot_rows[investment]
+
+    def date_ordered_rows(self, investment):
+        # Rows in date order (buy txns before sell txns of the same date, else in record order)
+        return self._date_orders[investment]
+
+    def _compute_cumulative_balances(self):
+        units = self.txns["units"].tolist()
+        balances = [0.0] * len(units)
+        for investment in range(len(self)):
+            self._continue_cumulative_balance(investment, self.date_ordered_rows(investment), units, balances)
+        self.txns["cumm_balance"] = balances
+
+    def _continue_cumulative_balance(self, investment, rows, units, balances, balance=0):
+        for row in rows:
+            balance += round(balance + units[row], 4)
+            balances[row] = balance
+            if balance < 0:     # This should not happen
+                self.balance_errors[investment] = row
+                break
+
+    def _match_all(self):
+        # FIFO matching of all investments at once; returns the lots (by investment)
+        txns = self.txns
+        buys, sells = np.flatnonzero(txns["type"] == BUY), np.flatnonzero(txns["type"] == SELL)
+        buy_positions, sell_positions, units, unmatched_buys, unmatched_sells, errors = match_fifo(
+            txns["investment"][buys], txns["units"][buys], txns["txn_date"][buys],
+            txns["investment"][sells], -txns["units"][sells], txns["txn_date"][sells], len(self))
+        txns["unmatched_units"][buys] = unmatched_buys
+        txns["unmatched_units"][sells] = unmatched_sells
+        for investment, (error, sell_position, buy_position) in errors.items():
+            self.match_errors[investment] = (error, None if sell_position is None else sells[sell_position],
+                                             None if buy_position is None else buys[buy_position])
+        return _lots_from_matches(txns, buys[buy_positions], sells[sell_positions], units)
+
+    def add_investment(self, investment_rec):
+        # New investment (with its txns); returns its position in the store
+        investment = len(self)
+        self.isins.append(investment_rec.ISIN)
+        self.quantities.append(0)
+        self.holdings = np.append(self.holdings, 0.0)
+        self.tax_flags = np.append(self.tax_flags, np.zeros(1, dtype=TAX_FLAGS_DTYPE))
+        self._txn_rows.append(np.empty(0, dtype=np.int64))
+        self._date_orders.append([])
+        self._lot_rows.append(np.empty(0, dtype=np.int64))
+        self.append_txns(investment, investment_rec.Transactions)
+        return investment
+
+    def can_append(self, investment, txn_recs):
+        # Txns can only be appended after the last txn of the investment (else it has to be rebuilt)
+        rows = self.date_ordered_rows(investment)
+        last_date = self.txns["txn_date"][rows[-1]] if rows else 0
+        return (investment not in self.balance_errors and investment not in self.match_errors and
+                all(txn_rec.ordinal > last_date for txn_rec in txn_recs))
+
+    def append_txns(self, investment, txn_recs):
+        """
+        Appends txns (in date order, after the last txn of the investment - see can_append) and resumes FIFO
+        matching from the first open lot - only the new txns and the open lots of the investment are matched.
+        Returns (new txn rows, new lot rows).
+        """
+        first_row = len(self.txns)
+        new_txns = _txns_from_records([txn_recs])
+        new_txns["investment"] = investment
+        self.txns = np.concatenate([self.txns, new_txns])
+        new_rows = np.arange(first_row, len(self.txns))
+        self._txn_rows[investment] = np.concatenate([self._txn_rows[investment], new_rows])
+        for txn_rec in txn_recs:
+            self.quantities[investment] += txn_rec.quantity
+        self.holdings[investment] = round(self.quantities[investment], 4)
+
+        txns = self.txns
+        new_date_order = (first_row + np.lexsort((np.arange(len(new_txns)), new_txns["type"] == SELL,
+                                                  new_txns["txn_date"]))).tolist()
+        date_order = self._date_orders[investment]
+        balance = float(txns["cumm_balance"][date_order[-1]]) if date_order else 0
+        units, balances = dict(zip(new_date_order, txns["units"][new_date_order].tolist())), {}
+        self._continue_cumulative_balance(investment, new_date_order, units, balances, balance)
+        txns["cumm_balance"][list(balances)] = list(balances.values())
+        self._date_orders[investment] = date_order + new_date_order
+
+        # Open (not fully matched) buy and sell txns of the investment followed by the new ones
+        rows = self._txn_rows[investment]
+        open_rows = rows[txns["unmatched_units"][rows] > 0]
+        buys, sells = open_rows[txns["type"][open_rows] == BUY], open_rows[txns["type"][open_rows] == SELL]
+        buy_positions, sell_positions, units, unmatched_buys, unmatched_sells, errors = match_fifo(
+            np.zeros(len(buys), dtype=np.int64), txns["unmatched_units"][buys], txns["txn_date"][buys],
+            np.zeros(len(sells), dtype=np.int64), txns["unmatched_units"][sells], txns["txn_date"][sells], 1)
+        txns["unmatched_units"][buys] = unmatched_buys
+        txns["unmatched_units"][sells] = unmatched_sells
+        self.match_errors.pop(investment, None)
+        if 0 in errors and errors[0][0] == "no_buy" and (txns["type"][rows] == BUY).any():
+            # No open lots left - only new units sold are an error (more sold than bought), not the lack of buys
+            del errors[0]
+            if np.any(unmatched_sells > 0):
+                errors[0] = ("overflow", int(np.flatnonzero(unmatched_sells > 0)[0]), None)
+        if 0 in errors:
+            error, sell_position, buy_position = errors[0]
+            self.match_errors[investment] = (error, None if sell_position is None else sells[sell_position],
+                                             None if buy_position is None else buys[buy_position])
+
+        first_lot = len(self.lots)
+        self.lots = np.concatenate([self.lots, _lots_from_matches(txns, buys[buy_positions], sells[sell_positions],
+                                                                  units)])
+        new_lot_rows = np.arange(first_lot, len(self.lots))
+        self._lot_rows[investment] = np.concatenate([self._lot_rows[investment], new_lot_rows])
+        self.version += 1
+        self._reductions.clear()
+        return new_rows, new_lot_rows
+
+    def set_tax_flags(self, investment, is_under_asr, is_under_stcg, is_under_ltcg, ltcg_days):
+        # Lots are (re)classified only when tax flags of an investment change (see lot_taxes)
+        flags = (bool(is_under_asr), bool(is_under_stcg), bool(is_under_ltcg), ltcg_days)
+        if self.tax_flags[investment].item() != flags:
+            self.tax_flags[investment] = flags
+            self._tax_flags_version += 1
+
+    def lot_taxes(self):
+        # Tax class, grandfathered cost and LTCG of all lots - computed once per txns and tax flags
+        return self._reduce(("lot_taxes", self._tax_flags_version), self._classify_lots)
+
+    def _classify_lots(self):
+        lots, txns = self.lots, self.txns
+        flags = self.tax_flags[lots["investment"]]
+        short_term = lots["holding_days"] < flags["ltcg_days"]
+        taxes = np.zeros(len(lots), dtype=LOT_TAX_DTYPE)
+        taxes["tax_class"] = (np.where(flags["asr"] & (~flags["ltcg"] | short_term), SLAB_RATE, 0)
+                              | np.where(flags["stcg"] & short_term, STCG, 0)
+                              | np.where(flags["ltcg"] & ~short_term, LTCG, 0))
+
+        # Grandfathering of LTCG - deemed cost is max(buy price, min(sell price, FMV on 31-Jan-2018)), only for
+        # units sold from 1-Apr-2018 (s.112A) - deemed cost of units sold before is the buy price
+        buy_prices, sell_prices = txns["price"][lots["buy"]], txns["price"][lots["sell"]]
+        bought_by_gf_date = lots["buy_date"] <= GRANDFATHERING_ORDINAL
+        grandfathered = bought_by_gf_date & (lots["sell_date"] >= GRANDFATHERED_SALES_ORDINAL)
+        if grandfathered.any():     # FMV index is loaded only if needed
+            fmvs = np.array([nav.nav_on_31012018(isin) for isin in self.isins], dtype=np.float64)
+            taxes["fmv"] = np.where(grandfathered, fmvs[lots["investment"]], 0.0)
+        taxes["deemed_coa"] = np.where(grandfathered, np.maximum(buy_prices, np.minimum(sell_prices, taxes["fmv"])),
+                                       buy_prices)
+        equity_ltcg = bought_by_gf_date & flags["stcg"] & flags["ltcg"] & ~short_term
+        taxes["ltcg"] = np.where(equity_ltcg, (sell_prices - taxes["deemed_coa"]) * lots["units"], lots["pnl"])
+        return taxes
+
+    def _reduce(self, key, compute):
+        # Aggregates are cached per store version (and NAV version, where the key includes it)
+        key = (self.version,) + key
+        result = self._reductions.get(key)
+        if result is None:
+            result = self._reductions[key] = compute()
+        return result
+
+    def _per_investment(self, index, weights):
+        return np.bincount(index, weights=weights, minlength=len(self))
+
+    def realized_pnl(self, fy=None, period=None):
+        # Realized P&L (net of STT and stamp duty) of each investment - of lots sold in the FY or the period
+        def compute():
+            lots = self.lots
+            if fy is not None:
+                lots = lots[lots["fy"] == utils.str2fy(fy)]
+            elif isinstance(period, tuple):
+                sell_dates = lots["sell_date"]
+                lots = lots[(period[0].toordinal() <= sell_dates) & (sell_dates <= period[1].toordinal())]
+            return self._per_investment(lots["investment"], lots["pnl"] - lots["stt"] - lots["stamp_duty"])
+        return self._reduce(("realized_pnl", fy, period), compute)
+
+    def current_navs(self):
+        # (NAVs, NAV date ordinals) of each investment - price and date of its last txn where NAV is not known
+        def compute():
+            last_rows = np.array([rows[-1] for rows in self._date_orders], dtype=np.int64)
+            navs = self.txns["price"][last_rows].copy()
+            nav_dates = self.txns["txn_date"][last_rows].copy()
+            for i, (current_nav, current_nav_date) in enumerate(nav.lookup_many(self.isins)):
+                if current_nav:
+                    navs[i] = current_nav
+                if current_nav_date:
+                    nav_dates[i] = current_nav_date.toordinal()
+            return navs, nav_dates
+        return self._reduce(("current_navs", nav.nav_version()), compute)
+
+    def unrealized_pnl(self):
+        # Unrealized P&L (net of stamp duty) of the unsold units of each investment at current NAV
+        def compute():
+            txns = self.txns
+            unsold = np.where(txns["type"] == BUY, txns["unmatched_units"], 0.0)
+            navs = self.current_navs()[0][txns["investment"]]
+            pnl = unsold * (navs - txns["price"]) - (unsold / txns["units"] * txns["tax"])
+            return self._per_investment(txns["investment"], pnl)
+        return self._reduce(("unrealized_pnl", nav.nav_version()), compute)
+
+    def stamp_duty(self):
+        # Stamp duty paid on all buy txns of each investment
+        def compute():
+            txns = self.txns
+            return self._per_investment(txns["investment"], np.where(txns["type"] == BUY, txns["tax"], 0.0))
+        return self._reduce(("stamp_duty",), compute)
+
+    def taxes_paid(self):
+        # Stamp duty and STT paid on all txns of each investment
+        return self._reduce(("taxes_paid",), lambda: self._per_investment(self.txns["investment"],
+                                                                          self.txns["tax"]))
+
+
+def _txns_from_records(txn_rec_lists):
+    # Txn records (buys and sells) of each investment -> txn rows
+    rows = [(i, txn_rec.ordinal, BUY if txn_rec.type == "buy" else SELL,
+             round(float(txn_rec.quantity), 4), round(float(txn_rec.price), 4), round(float(txn_rec.tax), 4))
+            for i, txn_recs in enumerate(txn_rec_lists)
+            for txn_rec in txn_recs if txn_rec.type in ("buy", "sell")]
+    txns = np.zeros(len(rows), dtype=TXN_DTYPE)
+    if rows:
+        columns = list(zip(*rows))
+        for name, column in zip(("investment", "txn_date", "type", "units", "price", "tax"), columns):
+            txns[name] = column
+    amounts = txns["price"] * txns["units"] + txns["tax"]
+    txns["amount"] = np.where(txns["type"] == SELL, np.abs(amounts), amounts)
+    txns["unmatched_units"] = np.abs(txns["units"])
+    return txns
+
+def _lots_from_matches(txns, buys, sells, units):
+    lots = np.zeros(len(units), dtype=LOT_DTYPE)
+    lots["investment"] = txns["investment"][buys]
+    lots["buy"], lots["sell"], lots["units"] = buys, sells, units
+    lots["buy_date"] = txns["txn_date"][buys]
+    lots["sell_date"] = txns["txn_date"][sells]
+    lots["holding_days"] = lots["sell_date"] - lots["buy_date"]
+    lots["fy"] = fy_of(lots["sell_date"])
+    lots["buy_amount"] = txns["amount"][buys] * (units / txns["units"][buys])
+    lots["sell_amount"] = np.abs(txns["amount"][sells] * (units / txns["units"][sells]))
+    lots["stamp_duty"] = txns["tax"][buys] * (units / txns["units"][buys])
+    lots["stt"] = txns["tax"][sells] * (units / txns["units"][sells])
+    lots["pnl"] = lots["sell_amount"] - lots["buy_amount"]
+    return lots
+
+UNITS_SCALE = 10_000     # Units are recorded with (up to) 4 decimals
+
+def match_fifo(buy_investments, buy_units, buy_dates, sell_investments, sell_units, sell_dates, n):
+    """
+    FIFO matching of sold units with bought units of n investments at once. Buy and sell txns are given as
+    arrays (investment, units, date ordinal) sorted by investment, each investment in record order.
+    Cumulative bought and sold units of an investment are two step curves (in integer 1/10000 units, so there
+    is no rounding drift); every point where either curve steps ends a matched lot, and the buy and the sell
+    txn of each lot are found with searchsorted. Curves of the investments are laid one after the other on
+    one axis, so all lots of all investments come out of one pass.
+    Returns (buy positions, sell positions, units) of the lots (by investment, in FIFO order), unmatched units
+    of each buy and each sell txn and {investment: (error, sell position, buy position)} for defective data:
+    "no_buy", "order" (units sold before they were bought - lots are kept up to that one) and "overflow"
+    (more units sold than bought).
+    """
+    buy_investments, sell_investments = np.asarray(buy_investments), np.asarray(sell_investments)
+    buy_steps = np.round(np.asarray(buy_units) * UNITS_SCALE).astype(np.int64)
+    sell_steps = np.round(np.asarray(sell_units) * UNITS_SCALE).astype(np.int64)
+    total_bought = _sum_per_investment(buy_investments, buy_steps, n)
+    total_sold = _sum_per_investment(sell_investments, sell_steps, n)
+
+    # Investment i occupies (base[i], base[i] + max(total bought, total sold)] of the axis
+    base = np.concatenate([[0], np.cumsum(np.maximum(total_bought, total_sold) + 1)[:-1]])
+    bought = base[buy_investments] + _cumsum_per_investment(buy_investments, buy_steps, n)
+    sold = base[sell_investments] + _cumsum_per_investment(sell_investments, sell_steps, n)
+    matched = base + np.minimum(total_bought, total_sold)
+
+    ends = np.union1d(bought, sold)
+    investments = np.searchsorted(base, ends, side="right") - 1
+    is_matched = (ends > base[investments]) & (ends <= matched[investments])
+    ends, investments = ends[is_matched], investments[is_matched]
+    is_first = np.concatenate([[True], investments[1:] != investments[:-1]])
+    starts = np.where(is_first, base[investments], np.concatenate([[0], ends[:-1]]))
+    buy_positions = np.searchsorted(bought, starts, side="right")
+    sell_positions = np.searchsorted(sold, starts, side="right")
+
+    errors = {}
+    early_sales = np.flatnonzero(np.asarray(sell_dates)[sell_positions] < np.asarray(buy_dates)[buy_positions])
+    defective, first = np.unique(investments[early_sales], return_index=True)
+    cutoff = np.full(n, len(ends))
+    cutoff[defective] = early_sales[first]
+    for investment, lot in zip(defective.tolist(), early_sales[first].tolist()):
+        errors[investment] = ("order", sell_positions[lot], buy_positions[lot])
+        matched[investment] = starts[lot]
+    for investment in np.flatnonzero(total_sold > total_bought).tolist():
+        if investment not in errors:
+            errors[investment] = ("overflow", np.searchsorted(sold, matched[investment], side="right"), None)
+    for investment in np.flatnonzero(np.bincount(buy_investments, minlength=n) == 0).tolist():
+        errors[investment] = ("no_buy", None, None)
+    is_kept = np.arange(len(ends)) < cutoff[investments]
+    ends, starts = ends[is_kept], starts[is_kept]
+    buy_positions, sell_positions = buy_positions[is_kept], sell_positions[is_kept]
+
+    unmatched_buys = buy_steps - np.clip(matched[buy_investments] - (bought - buy_steps), 0, buy_steps)
+    unmatched_sells = sell_steps - np.clip(matched[sell_investments] - (sold - sell_steps), 0, sell_steps)
+    return (buy_positions, sell_positions, (ends - starts) / UNITS_SCALE,
+            unmatched_buys / UNITS_SCALE, unmatched_sells / UNITS_SCALE, errors)
+
+def _sum_per_investment(investments, steps, n):
+    totals = np.zeros(n, dtype=np.int64)
+    np.add.at(totals, investments, steps)
+    return totals
+
+def _cumsum_per_investment(investments, steps, n):
+    # Cumulative sum restarting at each investment (investments are sorted)
+    cumulative = np.cumsum(steps)
+    starts = np.searchsorted(investments, np.arange(n))
+    before = np.concatenate([[0], cumulative])[starts]
+    return cumulative - before[investments]
+
+def fy_of(ordinals):
+    # FY (as 4 digit year in which it ends) of each of the date ordinals
+    dates = (np.asarray(ordinals, dtype=np.int64) - nav.EPOCH_ORDINAL).astype("datetime64[D]")
+    years = dates.astype("datetime64[Y]").astype(np.int64) + 1970
+    months = dates.astype("datetime64[M]").astype(np.int64) % 12 + 1
+    return years + (months >= 4)
+
+@lru_cache(maxsize=None)
+def to_date(ordinal):
+    # Same date object for the same day (txn views of all investments share them)
+    return date.fromordinal(int(ordinal))
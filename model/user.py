@@ -1,10 +1,25 @@
+import hashlib
+import multiprocessing
+import os
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
 
 from model.investor import Investor
 from model.mf_master import MFSchemeMaster
 import model.investment_file as investment_files
+import model.sqlite_db as sqlite_db
 
 BASE_DIR = Path(__file__).parent
+SNAPSHOT_FORMAT_VERSION = 4     # Bump whenever the pickled model classes change
+# Loader processes take about 1.3s to start (each imports the model) and an investor costs more to load in one
+# (pickled back) than here (about 25ms for the sample investors) - see benchmarks/investors_load.py
+PARALLEL_MIN_INVESTORS = 128
+# Errors of a snapshot that can't be read back - damaged or truncated, or pickled by model classes since changed
+# without a format version bump (a class or module gone)
+SNAPSHOT_READ_ERRORS = (pickle.UnpicklingError, EOFError, AttributeError, ImportError, OSError)
 
 class User:
     def __init__(self, id, project_folder=""):
@@ -16,17 +31,67 @@ class User:
         self.investors = self.load_all_investors()
 
 
-    def load_all_investors(self):
+    def load_all_investors(self, parallel=None):
         # Fetch all available investors for this user from investments JSON files
-        investors = {}
         investor_names = investment_files.get_all_investor_names(self.user_id)
-        for investor_name in investor_names:
-            print(f"Loading started for investor: {investor_name}... ",)
-            investors[investor_name] = Investor(self, investor_name)
-            print(f"Done loading data for investor: {investor_name}!")
+        if parallel is None:
+            parallel = len(investor_names) >= PARALLEL_MIN_INVESTORS and (os.cpu_count() or 1) > 1
+        start = time.perf_counter()
+        investors = None
+        if parallel:
+            try:
+                investors = self._load_investors_in_parallel(investor_names)
+            except (OSError, BrokenProcessPool, pickle.PicklingError) as e:
+                print(f"Parallel loading of investors failed ({e}) - loading them one by one")
+                parallel = False
+        if investors is None:
+            investors = {}
+            for investor_name in investor_names:
+                print(f"Loading started for investor: {investor_name}... ",)
+                investors[investor_name] = Investor(self, investor_name)
+                print(f"Done loading data for investor: {investor_name}!")
+
+        print(f"Loaded {len(investors)} investors in {time.perf_counter() - start:.3f}s "
+              f"({'parallel' if parallel else 'sequential'})")
+        return investors
 
+    def _load_investors_in_parallel(self, investor_names):
+        # Investors are parsed and matched in loader processes (see load_investor). Schemes they add to the
+        # MF master are added here, one investor at a time, so mf_master.json is written by this process only
+        investors = {}
+        with ProcessPoolExecutor(max_workers=min(len(investor_names), os.cpu_count() or 1),
+                                 mp_context=multiprocessing.get_context("spawn")) as pool:
+            results = pool.map(load_investor, [self.user_id] * len(investor_names), investor_names)
+            for investor_name, (investor, added_schemes) in zip(investor_names, results):
+                for scheme in added_schemes:
+                    self.mf_master.add_scheme(scheme.isin, scheme.scheme_name, scheme.last_txn_date)
+                investor.user = self
+                investors[investor_name] = investor
         return investors
 
+    def __getstate__(self):
+        # MF master is a singleton per user (and saved on its own) - not part of the snapshot
+        state = self.__dict__.copy()
+        del state["mf_master"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.mf_master = MFSchemeMaster(self.user_id)
+
+    def save_snapshot(self):
+        save_snapshot(self)
+
+    def refresh_investor(self, investor_file):
+        # After txns are added to an investor's file - only the changed investments are updated if possible
+        investor_name = investor_file.investor_name
+        investor = self.investors.get(investor_name)
+        if investor is None or not investor.append_changes(investor_file):
+            print(f"Reloading investor: {investor_name}... ")
+            self.investors[investor_name] = Investor(self, investor_name)
+            investor_file.changes = {}
+        self.save_snapshot()
+
     def get_investor(self, investor_name):
         return self.investors[investor_name]
 
@@ -54,6 +119,77 @@ class User:
         return iter(self.investors.values())
 
 
+class _LoaderUser:
+    # Stand-in for the user in an investor loader process
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.mf_master = MFSchemeMaster(user_id)
+        self.mf_master.autosave = False
+
+def load_investor(user_id, investor_name):
+    # Runs in a loader process - returns the investor (detached from the user) and the schemes it added to the
+    # MF master (not saved here)
+    user = _LoaderUser(user_id)
+    known_isins = set(user.mf_master.schemes)
+    investor = Investor(user, investor_name)
+    investor.user = None
+    return investor, [scheme for isin, scheme in user.mf_master.schemes.items() if isin not in known_isins]
+
+def load_user(user_id):
+    """
+    User from the saved snapshot (pickled investors - matched lots, tax flags etc.) if the data files it was
+    built from are unchanged, else built from the data files (and the snapshot saved for the next start).
+    Only current NAVs are bound after loading - lazily, as for a built user.
+    """
+    user = read_snapshot(user_id)
+    if user is None:
+        user = User(user_id)
+        save_snapshot(user)
+    return user
+
+def snapshot_file(user_id):
+    return Path("data") / user_id / "user.snapshot"
+
+def data_fingerprint(user_id):
+    # (name, size, mtime, hash) of the investor files (and their journals) and the MF master the model is built from
+    datafolder = Path("data") / user_id
+    files = (sorted(datafolder.glob("*_investments.json")) + sorted(datafolder.glob("*_investments.journal")) +
+             [datafolder / "mf_master.json"])
+    fingerprint = []
+    for file in files:
+        if file.exists():
+            stat = file.stat()
+            fingerprint.append((file.name, stat.st_size, stat.st_mtime_ns,
+                                hashlib.sha256(file.read_bytes()).hexdigest()))
+    if sqlite_db.is_enabled(user_id):
+        fingerprint.append((sqlite_db.db_file(user_id).name, sqlite_db.data_version(user_id)))
+    return SNAPSHOT_FORMAT_VERSION, fingerprint
+
+def save_snapshot(user):
+    # Fingerprint is pickled ahead of the user - a stale snapshot is detected without unpickling the user.
+    # Written to a temp file and renamed, so that a reader never sees a half written snapshot
+    file = snapshot_file(user.user_id)
+    tmp_file = file.with_name(file.name + ".tmp")
+    with open(tmp_file, "wb") as f:
+        pickle.dump(data_fingerprint(user.user_id), f, protocol=pickle.HIGHEST_PROTOCOL)
+        pickle.dump(user, f, protocol=pickle.HIGHEST_PROTOCOL)
+    tmp_file.replace(file)
+
+def read_snapshot(user_id):
+    # Returns the snapshot user or None if there is no snapshot, or it is stale or unreadable
+    try:
+        with open(snapshot_file(user_id), "rb") as f:
+            if pickle.load(f) != data_fingerprint(user_id):
+                print(f"Ignoring {snapshot_file(user_id)} - data files have changed.")
+                return None
+            print(f"Loading user {user_id} from saved snapshot.")
+            return pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except SNAPSHOT_READ_ERRORS as e:
+        print(f"Ignoring {snapshot_file(user_id)} - {type(e).__name__}: {e}")
+        return None
+
 def get_all_user_ids():
     # All subfolder names in the "data" folder except "common" subfolder
     data_folder_path = Path("data")
@@ -62,6 +198,5 @@ def get_all_user_ids():
 
 
 if __name__ == '__main__':
-    for investor in User("hemant", ".."):
+    for investor in User("Hemant"):
         print(investor.name)
-
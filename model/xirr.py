@@ -1,39 +1,327 @@
 from pyxirr import xirr as pyxirr
-import pandas as pd
+from collections import OrderedDict
+from datetime import date, timedelta
+import threading
+import numpy as np
+
+import model.nav as nav
+from model.txn_store import BUY
+import utils.utils as utils
 
 def cagr(buy_value, sell_value, buy_date, sell_date):
     years_held = (sell_date - buy_date).days / 365
     return (sell_value / buy_value) ** (1 / years_held) - 1
 
 def xirr(investments, realized=False, unrealized=False, fy=None):
+    key = xirr_cache.key(investments, realized, unrealized, fy)
+    rate = xirr_cache.get(key)
+    if rate is _MISSING:
+        # Portfolio level => concatenate (cached) cashflow arrays of all investments and merge same date flows
+        investments = investments if isinstance(investments, list) else [investments]
+        ordinals, amounts = coalesce_cashflows(*_concatenate(
+            [get_cashflows(inv, realized, unrealized, fy) for inv in investments]))
+        rate = 0 if not amounts.any() else pyxirr(_to_dates(ordinals), amounts)    # 0 if no (non zero) flows
+        xirr_cache.put(key, rate)
+    return rate
+
+def batch_xirr(investments, realized=False, unrealized=False, fy=None):
+    # XIRR of each of the investments (same as xirr(investment, ...) for each one) solved together
+    keys = [xirr_cache.key(inv, realized, unrealized, fy) for inv in investments]
+    cached = [xirr_cache.get(key) for key in keys]
+    missing = [i for i, rate in enumerate(cached) if rate is _MISSING]
+    rates = np.array([np.nan if rate is _MISSING else rate for rate in cached], dtype=np.float64)  # None => nan
+    if len(missing) > 0:
+        rates[missing] = xirr_many([get_cashflows(investments[i], realized, unrealized, fy) for i in missing])
+        for i in missing:
+            xirr_cache.put(keys[i], float(rates[i]))
+    return rates
+
+def xirr_series(investments, dates=None, guess=0.1, tolerance=1e-10, max_iterations=100):
+    """
+    XIRR as of each of the dates (month ends from the first transaction up to today by default) for each of the
+    investments and for all of them together. Returns (dates, rates, portfolio_rates) - rates has a row per
+    investment and a column per date, NaN where there is nothing to solve yet (e.g. before the first purchase).
+    As of a date, cashflows are the transactions up to the date (purchases out, redemptions in) and the value
+    of the units then held, at the latest price known on the date (NAV history, current NAV or txn price). NAV
+    history has only 31-Jan-2018 and the NAVs downloaded since, so before that it is mostly the last txn price.
+    Transactions of all investments are kept in one date sorted array, so the cashflows as of a date are just
+    a longer prefix of it than for the previous date. Dates are solved in order and each solve starts from the
+    rates of the previous date, which are usually within a few Newton steps of the new ones.
+    """
     investments = investments if isinstance(investments, list) else [investments]
+    dates = month_end_dates(investments) if dates is None else list(dates)
+    key = ("series", tuple(inv.txns_version for inv in investments), tuple(dates), nav.nav_version())
+    rates = xirr_cache.get(key)
+    if rates is _MISSING:
+        rates = _xirr_series(investments, dates, guess, tolerance, max_iterations)
+        xirr_cache.put(key, rates)
+    return dates, rates[:-1], rates[-1]
+
+def month_end_dates(investments, to_date=None):
+    # Month ends from the month of the first transaction up to to_date (today)
+    to_date = to_date or date.today()
+    if not investments:
+        return []
+    first_date = min(inv.txns[0].txn_date for inv in investments)
+    months = (to_date.year - first_date.year) * 12 + to_date.month - first_date.month + 1
+    return [d for d in utils.compute_month_end_dates(first_date - timedelta(days=1), months) if d <= to_date]
+
+def _xirr_series(investments, dates, guess, tolerance, max_iterations):
+    n = len(investments)    # Row n is the portfolio
+    rates = np.full((n + 1, len(dates)), np.nan)
+    if n == 0 or len(dates) == 0:
+        return rates
+
+    cashflows = [_txn_cashflows(inv) for inv in investments]
+    date_ordinals = np.array([d.toordinal() for d in dates], dtype=np.int64)
+    values = _values_as_of(investments, cashflows, dates, date_ordinals)
+
+    rows = np.repeat(np.arange(n), [len(ordinals) for ordinals, *_ in cashflows])
+    ordinals, amounts = _concatenate([(ordinals, amounts) for ordinals, amounts, *_ in cashflows])
+    order = np.argsort(ordinals, kind="stable")
+    rows, ordinals, amounts = rows[order], ordinals[order], amounts[order]
+    prefix_ends = np.searchsorted(ordinals, date_ordinals, side="right")
+
+    guesses = np.full(n + 1, float(guess))
+    for column, (date_ordinal, end) in enumerate(zip(date_ordinals, prefix_ends)):
+        # Transactions up to the date (for each investment and again for the portfolio) + value of the holdings
+        held = np.flatnonzero(values[:, column] > 0)
+        held_values = values[held, column]
+        step_rows = np.concatenate([rows[:end], np.full(end, n), held, [n]])
+        step_ordinals = np.concatenate([ordinals[:end], ordinals[:end], np.full(len(held) + 1, date_ordinal)])
+        step_amounts = np.concatenate([amounts[:end], amounts[:end], held_values, [held_values.sum()]])
+        solvable = _is_solvable(step_rows, step_ordinals, step_amounts, n + 1)
+        rates[:, column] = _solve(step_rows, step_ordinals, step_amounts, n + 1, solvable, guesses, tolerance,
+                                  max_iterations)
+        # Warm start for the next date
+        guesses = np.where(np.isfinite(rates[:, column]), rates[:, column], guesses)
+    return rates
+
+def _txn_cashflows(investment):
+    # (date ordinals, amounts, units, prices) of the transactions in date order - cached per txns_version
+    key = ("txns", investment.txns_version)
+    cashflows = cashflow_cache.get(key)
+    if cashflows is _MISSING:
+        store = investment.txn_store
+        txns = store.txns[store.date_ordered_rows(investment.store_id)]
+        amounts = np.where(txns["type"] == BUY, -txns["amount"], txns["amount"])
+        cashflows = (txns["txn_date"].astype(np.int64), amounts, txns["units"], txns["price"])
+        cashflow_cache.put(key, cashflows)
+    return cashflows
+
+def _values_as_of(investments, cashflows, dates, date_ordinals):
+    # Value of the units held by each investment (rows) on each of the dates (columns) at the most recent of
+    # NAV history, current NAV and the price of the last transaction - known on the date
+    history_navs, history_ordinals = nav.nav_matrix([inv.isin for inv in investments], dates, with_dates=True)
+    values = np.zeros((len(investments), len(dates)))
+    for i, (investment, (ordinals, _, units, prices)) in enumerate(zip(investments, cashflows)):
+        if len(ordinals) == 0:
+            continue
+        last = np.searchsorted(ordinals, date_ordinals, side="right") - 1
+        known = last >= 0
+        last = np.maximum(last, 0)
+        held = np.where(known, np.round(np.cumsum(units)[last], 4), 0.0)
+        price, price_ordinal = prices[last], ordinals[last]
+
+        from_history = history_ordinals[i] > price_ordinal
+        price = np.where(from_history, history_navs[i], price)
+        price_ordinal = np.maximum(price_ordinal, history_ordinals[i])
+        nav_ordinal = investment.nav_date.toordinal()
+        from_nav = (nav_ordinal > price_ordinal) & (nav_ordinal <= date_ordinals)
+        price = np.where(from_nav, investment.nav, price)
+        values[i] = np.where(held > 0, held * price, 0.0)
+    return values
+
+def _is_solvable(rows, ordinals, amounts, n):
+    # A series needs money both out and in, on more than one date
+    money_out = np.bincount(rows, weights=amounts < 0, minlength=n) > 0
+    money_in = np.bincount(rows, weights=amounts > 0, minlength=n) > 0
+    first_ordinal = np.full(n, np.iinfo(np.int64).max)
+    last_ordinal = np.full(n, np.iinfo(np.int64).min)
+    np.minimum.at(first_ordinal, rows, ordinals)
+    np.maximum.at(last_ordinal, rows, ordinals)
+    return money_out & money_in & (last_ordinal > first_ordinal)
+
+def _has_unique_rate(rows, amounts, n):
+    # At most one sign change in the flows (Descartes' rule of signs) or in their running total (Norstrom's
+    # criterion) => at most one rate. Flows of each series must be in date order.
+    order = np.argsort(rows, kind="stable")
+    rows, amounts = rows[order], amounts[order]
+    running_totals = np.cumsum(amounts)
+    row_starts = np.searchsorted(rows, np.arange(n))
+    running_totals -= np.concatenate([[0.0], running_totals])[row_starts][rows]
+    return (_sign_changes(rows, amounts, n) <= 1) | (_sign_changes(rows, running_totals, n) <= 1)
+
+def _sign_changes(rows, values, n):
+    nonzero = values != 0
+    rows, signs = rows[nonzero], np.sign(values[nonzero])
+    changes = (rows[1:] == rows[:-1]) & (signs[1:] != signs[:-1])
+    return np.bincount(rows[1:][changes], minlength=n)
+
+def get_cashflows(investment, realized=False, unrealized=False, fy=None):
+    """
+    Cashflows of one investment as (date ordinals, amounts) arrays, sorted by date with same date flows merged.
+    Realized flows are cached per txns_version and FY, unrealized flows per txns_version and NAV version.
+    """
     total = not (realized or unrealized)
-    cashflows = []
-    for inv in investments:
-        if (realized or total): # and len(inv.mat) > 0:
-            # Compute Realized xirr or total_xirr only if there are any Sell txns (else we get error)
-            _add_realized_cashflows(inv, cashflows, fy)
-        if (unrealized or total) and inv.holding > 0:
-            # Compute UnRealized xirr or total_xirr only if there are any Unsold units available
-            _add_unrealized_cashflows(inv, cashflows)
-    cashflows_df = pd.DataFrame(data=cashflows, columns=["Date", "Value"])
-    return 0 if len(cashflows_df) == 0 else pyxirr(cashflows_df)
-
-def _add_realized_cashflows(investment, cashflows, fy=None):
-    # for txn in investment.buy_txns:
-    #     # Purchases are money out - so should be negative
-    #     cashflows.append((txn.txn_date, txn.price * -1 * txn.sold_units))
-    # for txn in investment.sell_txns:
-    #     # sales are money in - so should be positive (units in sell_txn are already negative, therefor (* -1)
-    #     if fy is None or fy == txn.fy:
-    #         cashflows.append((txn.txn_date, txn.price * txn.units * -1))
-    for txn in investment.matched_txns:
-        if fy is None or fy == txn.fy:
-            cashflows.append((txn.buy_txn.txn_date, txn.buy_amount * -1))
-            cashflows.append((txn.sell_txn.txn_date, txn.sell_amount))
-
-def _add_unrealized_cashflows(investment, cashflows):
-    for txn in investment.buy_txns:
-        cashflows.append((txn.txn_date, txn.price * -1 * txn.unsold_units))
-    cashflows.append((investment.nav_date, investment.nav * investment.holding))
+    parts = []
+    if realized or total:
+        # Compute Realized xirr or total_xirr only if there are any Sell txns (else we get error)
+        key = ("realized", investment.txns_version, fy)
+        parts.append(_cached_cashflows(key, lambda: _realized_cashflows(investment, fy)))
+    if (unrealized or total) and investment.holding > 0:
+        # Compute UnRealized xirr or total_xirr only if there are any Unsold units available
+        key = ("unrealized", investment.txns_version, nav.nav_version())
+        parts.append(_cached_cashflows(key, lambda: _unrealized_cashflows(investment)))
+    return parts[0] if len(parts) == 1 else coalesce_cashflows(*_concatenate(parts))
+
+def _cached_cashflows(key, build):
+    cashflows = cashflow_cache.get(key)
+    if cashflows is _MISSING:
+        cashflows = coalesce_cashflows(*build())
+        cashflow_cache.put(key, cashflows)
+    return cashflows
+
+def _realized_cashflows(investment, fy=None):
+    # Purchases are money out (negative) and sales are money in (positive) - for each matched (sold) lot
+    store = investment.txn_store
+    lots = store.lots[store.lot_rows(investment.store_id)]
+    if fy is not None:
+        lots = lots[lots["fy"] == utils.str2fy(fy)]
+    return (np.concatenate([lots["buy_date"], lots["sell_date"]]).astype(np.int64),
+            np.concatenate([-lots["buy_amount"], lots["sell_amount"]]))
+
+def _unrealized_cashflows(investment):
+    # Unsold units of each buy txn (money out) and the current value of the holding (money in) on NAV date
+    store = investment.txn_store
+    txns = store.txns[store.txn_rows(investment.store_id)]
+    txns = txns[txns["type"] == BUY]
+    return (np.append(txns["txn_date"].astype(np.int64), investment.nav_date.toordinal()),
+            np.append(txns["price"] * -1 * txns["unmatched_units"], investment.nav * investment.holding))
+
+def coalesce_cashflows(ordinals, amounts):
+    # Sort by date and merge flows of the same date
+    unique_ordinals, positions = np.unique(ordinals, return_inverse=True)
+    return unique_ordinals, np.bincount(positions, weights=amounts, minlength=len(unique_ordinals))
+
+def _concatenate(cashflow_arrays):
+    if not cashflow_arrays:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+    return (np.concatenate([ordinals for ordinals, _ in cashflow_arrays]),
+            np.concatenate([amounts for _, amounts in cashflow_arrays]))
+
+def _to_dates(ordinals):
+    return (np.asarray(ordinals, dtype=np.int64) - nav.EPOCH_ORDINAL).astype("datetime64[D]")
+
+
+class XirrCache:
+    """
+    LRU cache of XIRR results (also used for per investment cashflow arrays).
+    Key is the set of investments (their txns_version, which changes whenever the transactions of an investment
+    change), the mode (realized/unrealized/total), the FY and the NAV version (changes whenever NAVs are
+    refreshed) - so stale results are never returned and simply age out. hits/misses are counted to measure
+    the benefit. get() returns _MISSING for a key not in the cache (None is a cached result - XIRR that does
+    not converge).
+    """
+    def __init__(self, max_size=4096):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(investments, realized=False, unrealized=False, fy=None):
+        investments = investments if isinstance(investments, list) else [investments]
+        return (frozenset(inv.txns_version for inv in investments), bool(realized), bool(unrealized), fy,
+                nav.nav_version())
+
+    def get(self, key):
+        with self._lock:
+            rate = self._results.get(key, _MISSING)
+            if rate is _MISSING:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._results.move_to_end(key)
+            return rate
+
+    def put(self, key, rate):
+        with self._lock:
+            self._results[key] = rate
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_size:
+                self._results.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._results),
+                "hit_rate": self.hits / lookups if lookups else 0.0}
+
+_MISSING = object()
+xirr_cache = XirrCache()
+cashflow_cache = XirrCache()    # Per investment (date ordinals, amounts) arrays
+
+def xirr_many(cashflow_arrays, guess=0.1, tolerance=1e-10, max_iterations=100):
+    """
+    XIRR of many cashflow series in one go. cashflow_arrays is a list of (date ordinals, amounts) array pairs of
+    different lengths; returns an array with one rate per series (0 for an empty or all zero series, as xirr()
+    does).
+    All series are solved together by Newton iterations on flat NumPy arrays (NPV and its derivative are summed
+    per series with bincount). Series that do not converge, or may have more than one rate, are solved one by one
+    with pyxirr.
+    Same day count as pyxirr (actual/365 from the first cashflow date).
+    """
+    n = len(cashflow_arrays)
+    lengths = np.array([len(ordinals) for ordinals, _ in cashflow_arrays], dtype=np.int64)
+    if lengths.sum() == 0:
+        return np.zeros(n)
+
+    rows = np.repeat(np.arange(n), lengths)
+    ordinals, amounts = _concatenate(cashflow_arrays)
+    has_flows = np.bincount(rows, weights=amounts != 0, minlength=n) > 0
+    rates = _solve(rows, ordinals, amounts, n, has_flows, guess, tolerance, max_iterations)
+    rates[~has_flows] = 0.0
+    return rates
+
+def _solve(rows, ordinals, amounts, n, solvable, guess, tolerance, max_iterations):
+    # Rates of the solvable series (rows); guess is a scalar or one guess per series. Others are left as NaN.
+    # Each series must be in date order (for the pyxirr fallback).
+    first_ordinal = np.full(n, np.inf)
+    np.minimum.at(first_ordinal, rows, ordinals)
+    years = (ordinals - first_ordinal[rows]) / 365.0
+    # Scale each series to its largest cashflow, so that one NPV tolerance fits all series
+    scale = np.zeros(n)
+    np.maximum.at(scale, rows, np.abs(amounts))
+    scaled_amounts = amounts / np.where(scale > 0, scale, 1.0)[rows]
+
+    rates = np.broadcast_to(np.asarray(guess, dtype=np.float64), (n,)).copy()
+    rates[~solvable] = np.nan
+    # A series that may have more than one rate is left to pyxirr, so that the same one of them is returned
+    active = solvable & _has_unique_rate(rows, amounts, n)
+    converged = np.zeros(n, dtype=bool)
+    with np.errstate(all="ignore"):
+        for _ in range(max_iterations):
+            if not active.any():
+                break
+            log_growth = np.log1p(rates)[rows]
+            discounted = scaled_amounts * np.exp(-years * log_growth)
+            npv = np.bincount(rows, weights=discounted, minlength=n)
+            d_npv = np.bincount(rows, weights=-years * discounted, minlength=n) / (1.0 + rates)
+            step = np.where(active, npv / d_npv, 0.0)
+            rates = rates - step
+            diverged = active & (~np.isfinite(rates) | (rates <= -1.0))
+            done = active & ~diverged & (np.abs(step) < tolerance)
+            converged |= done
+            active &= ~(done | diverged)
 
+    for row in np.flatnonzero(solvable & ~converged):
+        # Fallback - solve this series on its own
+        in_row = rows == row
+        rate = pyxirr(_to_dates(ordinals[in_row]), amounts[in_row])
+        rates[row] = np.nan if rate is None else rate
+    return rates
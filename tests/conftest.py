@@ -0,0 +1,32 @@
+import sys
+from pathlib import Path
+
+# Tests import the app modules (model, utils) from the repo root
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import json
+import shutil
+import time
+
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+@pytest.fixture
+def sample_data(tmp_path, monkeypatch):
+    # Copy of the sample user (data/Hemant) and the saved NAVs to work on - NAVs are not refreshed from AMFI
+    import model.nav as nav
+    from model.mf_master import MFSchemeMaster
+
+    shutil.copytree(REPO_ROOT / "data" / "Hemant", tmp_path / "data" / "Hemant",
+                    ignore=shutil.ignore_patterns("user.snapshot*", "*.journal*"))
+    shutil.copytree(REPO_ROOT / "data" / "common", tmp_path / "data" / "common",
+                    ignore=shutil.ignore_patterns("*.refresh.json", "*.part", "*.tmp"))
+    (tmp_path / "data" / "common" / "nav.refresh.json").write_text(json.dumps({"checked_at": time.time()}))
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(nav, "_nav_object", None)
+    monkeypatch.setattr(nav, "_nav_history", None)
+    monkeypatch.setattr(nav, "_fmv_31012018", None)
+    monkeypatch.setattr(MFSchemeMaster, "_instances", {})
+    return tmp_path / "data"
@@ -0,0 +1,98 @@
+import math
+from datetime import timedelta
+
+import pytest
+
+import utils.utils as utils
+from model.user import User
+
+USER = "Hemant"
+DAY = timedelta(days=1)
+
+
+@pytest.fixture
+def all_investments(sample_data):
+    return [investment for investor in User(USER) for investment in investor.investments]
+
+
+@pytest.fixture
+def investments(all_investments):
+    # Investments with an exit load period (load free dates of the others can't be computed)
+    return [investment for investment in all_investments
+            if investment.exit_load_days is not None and not math.isnan(investment.exit_load_days)]
+
+
+def redeemable_by_lot(investment, as_on_date):
+    # Earlier per lot sums - (units, value, unrealized gain) sellable for slab rate/STCG gains and for LTCG gains
+    slab_rate = [txn for txn in investment.buy_txns if txn.load_free_from_date < as_on_date < txn.ltcg_from_date]
+    ltcg = [txn for txn in investment.buy_txns if as_on_date >= txn.ltcg_from_date]
+    return tuple((sum(txn.unsold_units for txn in txns), sum(txn.unsold_value for txn in txns),
+                  sum(txn.unrealized_pnl for txn in txns)) for txns in (slab_rate, ltcg))
+
+
+def test_redeemable_units_are_same_as_by_lot(investments):
+    checked = set()
+    for investment in investments:
+        buy_txns = [txn for txn in investment.buy_txns if txn.unsold_units > 0]
+        # On, a day before and a day after the load free and LTCG dates of (some of) the unsold lots
+        boundaries = {boundary for txn in buy_txns[::max(1, len(buy_txns) // 10)]
+                      for boundary in (txn.load_free_from_date, txn.ltcg_from_date)}
+        for as_on_date in sorted({boundary + delta * DAY for boundary in boundaries for delta in (-1, 0, 1)}):
+            redeemable, expected = investment.redeemable_on(as_on_date), redeemable_by_lot(investment, as_on_date)
+            for sums, expected_sums in zip(redeemable, expected):
+                assert sums == pytest.approx(expected_sums, rel=1e-9, abs=1e-6), (investment.isin, as_on_date)
+            checked.update(kind for kind, sums in zip(("slab_rate", "ltcg"), expected) if sums[0] > 0)
+        if buy_txns and investment.exit_load_days >= investment.ltcg_days:
+            checked.add("load after ltcg")
+    assert checked == {"slab_rate", "ltcg", "load after ltcg"}
+
+
+
+FYS = [f"{year}-{(year + 1) % 100:02}" for year in range(2000, 2027)]
+
+
+@pytest.fixture
+def fy_boundary_investment(sample_data):
+    # Sold on the last and the first day of FYs, none in FY 2025-26
+    import model.investment_file as investment_file
+    investor_name = investment_file.get_all_investor_names(USER)[0]
+    manager = investment_file.get_one(USER, investor_name)
+    isin = manager.investments[0].ISIN
+    sells = ["2024-03-31", "2024-04-01", "2025-03-31", "2026-04-01"]
+    manager.add_investment({"ISIN": isin, "Folio": "FY-TEST", "SchemeName": "FY test", "Transactions": [
+        {"date": "2023-01-10", "type": "buy", "quantity": 100.0, "price": 10.0, "tax": 0.0, "source": "test"}] + [
+        {"date": sell, "type": "sell", "quantity": -10.0, "price": 12.0, "tax": 0.0, "source": "test"}
+        for sell in sells]})
+    investor = User(USER).investors[investor_name]
+    return next(investment for investment in investor.investments if investment.folio == "FY-TEST")
+
+
+def assert_same_as_filters(investment, fy):
+    from_date, to_date = utils.get_timeframe(fy=fy)
+    assert investment.matched_txns_in_fy(fy) == [txn for txn in investment.matched_txns if txn.fy == fy]
+    assert investment.sell_txns_in_fy(fy) == [txn for txn in investment.sell_txns if txn.fy == fy]
+    assert investment.is_sold_in_fy(fy) == any(txn.fy == fy for txn in investment.sell_txns)
+    assert investment.matched_txns_between(from_date, to_date) == investment.matched_txns_in_fy(fy)
+    # Window starting and ending on a sell date (both inclusive)
+    sell_dates = sorted({txn.sell_txn.txn_date for txn in investment.matched_txns if txn.fy == fy})
+    if sell_dates:
+        from_date, to_date = sell_dates[0], sell_dates[len(sell_dates) // 2]
+        assert investment.matched_txns_between(from_date, to_date) == [
+            txn for txn in investment.matched_txns if from_date <= txn.sell_txn.txn_date <= to_date]
+
+
+def test_sell_date_index_is_same_as_fy_filters(all_investments):
+    for investment in all_investments:
+        for fy in FYS:
+            assert_same_as_filters(investment, fy)
+
+
+def test_sell_date_index_on_fy_boundaries(fy_boundary_investment):
+    investment = fy_boundary_investment
+    sold_on = lambda txns: [txn.txn_date.isoformat() for txn in txns]
+    assert sold_on(investment.sell_txns_in_fy("2023-24")) == ["2024-03-31"]
+    assert sold_on(investment.sell_txns_in_fy("2024-25")) == ["2024-04-01", "2025-03-31"]
+    assert investment.matched_txns_in_fy("2025-26") == [] and not investment.is_sold_in_fy("2025-26")
+    assert sold_on(investment.sell_txns_in_fy("2026-27")) == ["2026-04-01"]
+    for fy in ("2023-24", "2024-25", "2025-26", "2026-27"):
+        assert_same_as_filters(investment, fy)
@@ -0,0 +1,193 @@
+import json
+import os
+from dataclasses import asdict
+
+import pytest
+
+import model.investment_file as investment_file
+from model.investment_file import InvestmentFileManager
+
+USER, INVESTOR = "test_user", "Test Investor"
+
+
+def txn(date, quantity=10.0, price=100.0):
+    return {"date": date, "type": "buy", "quantity": quantity, "price": price, "tax": 0.0, "source": "test"}
+
+
+def record(isin, *txns):
+    return {"ISIN": isin, "Folio": "F1", "SchemeName": f"Scheme {isin}", "Transactions": list(txns)}
+
+
+def state(manager):
+    return [asdict(inv) for inv in manager.investments]
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    manager = InvestmentFileManager(USER, INVESTOR)
+    manager.add_investment(record("INF000000001", txn("2024-01-01")))  # Creates the JSON file (no journal yet)
+    return manager
+
+
+def reload():
+    return InvestmentFileManager(USER, INVESTOR)
+
+
+def unapplied(manager):
+    return sorted(manager.journal_path.parent.glob(manager.journal_path.name + ".unapplied-*"))
+
+
+def test_changes_are_journaled_and_replayed(manager):
+    base = manager.filepath.read_bytes()
+    manager.add_investment(record("INF000000001", txn("2024-02-01")))
+    manager.add_investment(record("INF000000002", txn("2024-02-01")))
+    manager.update_scheme_name("INF000000002", "F1", "Renamed")
+    manager.delete_investment("INF000000001", "F1")
+
+    assert manager.filepath.read_bytes() == base
+    assert len(manager.journal_path.read_text().splitlines()) == 1 + 4
+    assert state(reload()) == state(manager)
+
+
+def test_journal_is_replayed_after_json_file_is_touched_or_copied(manager):
+    manager.add_investment(record("INF000000002", txn("2024-02-01")))
+    os.utime(manager.filepath, ns=(0, 0))   # E.g. git checkout or a restored copy - same content
+    assert state(reload()) == state(manager)
+
+
+def test_journal_of_changed_json_file_is_set_aside_not_overwritten(manager, capsys):
+    manager.add_investment(record("INF000000002", txn("2024-02-01")))
+    journal = manager.journal_path.read_bytes()
+    manager.filepath.write_bytes(manager.filepath.read_bytes() + b"\n")    # Changed by hand - content differs
+
+    changed = reload()
+    assert "WARNING" in capsys.readouterr().out
+    assert not changed.journal_path.exists()
+    assert [path.read_bytes() for path in unapplied(changed)] == [journal]
+
+    changed.add_investment(record("INF000000003", txn("2024-03-01")))
+    assert [path.read_bytes() for path in unapplied(changed)] == [journal]
+    assert state(reload()) == state(changed)
+
+
+def test_stale_journal_of_another_manager_is_set_aside_on_append(manager, capsys):
+    other = reload()
+    manager.add_investment(record("INF000000002", txn("2024-02-01")))
+    manager.save()      # JSON file changed under the other manager
+    other.add_investment(record("INF000000003", txn("2024-03-01")))
+    other.add_investment(record("INF000000004", txn("2024-03-01")))
+    manager.add_investment(record("INF000000005", txn("2024-03-01")))   # Journal started on other base
+
+    assert "WARNING" in capsys.readouterr().out
+    assert len(unapplied(manager)) == 1
+    assert state(reload()) == state(manager)
+
+
+def test_torn_last_line_is_cut_off_before_appending(manager):
+    manager.add_investment(record("INF000000002", txn("2024-02-01")))
+    with open(manager.journal_path, "a", encoding="utf-8") as f:
+        f.write('{"op": "add", "ISIN": "INF0')     # Interrupted append
+    loaded = reload()
+    assert state(loaded) == state(manager)
+
+    loaded.add_investment(record("INF000000003", txn("2024-03-01")))
+    loaded.add_investment(record("INF000000003", txn("2024-04-01")))
+    assert state(reload()) == state(loaded)
+    assert len(reload().investments) == 3
+
+
+def test_damaged_journal_is_set_aside(manager, capsys):
+    manager.add_investment(record("INF000000002", txn("2024-02-01")))
+    manager.add_investment(record("INF000000003", txn("2024-02-01")))
+    lines = manager.journal_path.read_text().splitlines()
+    lines[1] = lines[1][:10]
+    manager.journal_path.write_text("\n".join(lines) + "\n")
+
+    loaded = reload()
+    assert "WARNING" in capsys.readouterr().out
+    assert len(loaded.investments) == 1
+    assert len(unapplied(loaded)) == 1
+
+
+def test_journal_is_compacted_into_json_file(manager, monkeypatch):
+    monkeypatch.setattr(investment_file, "JOURNAL_COMPACT_ENTRIES", 3)
+    for month in range(2, 6):
+        manager.add_investment(record("INF000000001", txn(f"2024-{month:02}-01")))
+
+    # 4th change is saved to the JSON file with the 3 journaled before it
+    assert not manager.journal_path.exists()
+    assert len(json.loads(manager.filepath.read_text())[0]["Transactions"]) == 5
+    manager.add_investment(record("INF000000001", txn("2024-06-01")))
+    assert len(manager.journal_path.read_text().splitlines()) == 1 + 1
+    assert state(reload()) == state(manager)
+
+
+def test_interrupted_compaction_before_json_file_is_replaced(manager, monkeypatch):
+    manager.add_investment(record("INF000000001", txn("2024-02-01"), txn("2024-02-01")), allow_same_date=True)
+    expected = state(manager)
+    with monkeypatch.context() as patch, pytest.raises(OSError):
+        patch.setattr(investment_file.Path, "replace", _fail_on_json_file(investment_file.Path.replace))
+        manager.save()
+
+    assert manager._compacted_journal_path().exists()
+    assert state(reload()) == expected
+    assert manager.journal_path.exists()
+
+
+def test_interrupted_compaction_after_json_file_is_replaced(manager):
+    manager.add_investment(record("INF000000001", txn("2024-02-01"), txn("2024-02-01")), allow_same_date=True)
+    expected = state(manager)
+    journal = manager.journal_path.read_bytes()
+    manager.save()
+    manager._compacted_journal_path().write_bytes(journal)    # Left behind - its changes are in the JSON file
+
+    loaded = reload()
+    assert state(loaded) == expected    # Same date txns are not added twice
+    assert not manager._compacted_journal_path().exists() and not unapplied(loaded)
+
+
+def test_batch_is_written_at_once(manager):
+    with manager.batch():
+        manager.add_investment(record("INF000000001", txn("2024-02-01")))
+        manager.add_investment(record("INF000000002", txn("2024-02-01")))
+        assert not manager.journal_path.exists()
+    assert len(manager.journal_path.read_text().splitlines()) == 1 + 2
+    assert state(reload()) == state(manager)
+
+
+def test_failed_batch_is_rolled_back(manager):
+    manager.add_investment(record("INF000000002", txn("2024-02-01")))
+    manager.add_investment(record("INF000000003", txn("2024-02-01")))
+    files = (manager.filepath.read_bytes(), manager.journal_path.read_bytes())
+    expected, changes = state(manager), {key: list(txns) for key, txns in manager.changes.items()}
+
+    with pytest.raises(ValueError):
+        with manager.batch():
+            manager.add_investment(record("INF000000001", txn("2024-03-01")))
+            manager.add_investment(record("INF000000004", txn("2024-03-01")))
+            manager.update_scheme_name("INF000000002", "F1", "Renamed")
+            manager.delete_investment("INF000000003", "F1")
+            manager.add_investment(record("INF000000005", txn("2024-03-01", price=0)))  # Invalid price
+
+    assert (manager.filepath.read_bytes(), manager.journal_path.read_bytes()) == files
+    assert state(manager) == expected and manager.changes == changes
+    # Index is of the restored investments
+    assert list(manager._index) == [(inv.ISIN, inv.Folio) for inv in manager.investments]
+    assert all(manager._index[(inv.ISIN, inv.Folio)] is inv for inv in manager.investments)
+    assert manager._txn_dates[("INF000000001", "F1")] == {"2024-01-01"}
+    assert manager.get_investment("INF000000004", "F1") is None
+    assert manager.get_investment("INF000000003", "F1").SchemeName == "Scheme INF000000003"
+
+    # Changes after the rollback are journaled as usual (txns of the rolled back dates are new again)
+    manager.add_investment(record("INF000000001", txn("2024-03-01")))
+    assert manager.get_investment("INF000000001", "F1").Transactions[-1].date == "2024-03-01"
+    assert state(reload()) == state(manager)
+
+
+def _fail_on_json_file(replace):
+    def fail(path, target):
+        if str(target).endswith("_investments.json"):
+            raise OSError("interrupted")
+        return replace(path, target)
+    return fail
@@ -0,0 +1,86 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+import model.nav as nav
+
+
+NAV_OPEN_HEADER = "Scheme Code;ISIN Div Payout/ ISIN Growth;ISIN Div Reinvestment;Scheme Name;Net Asset Value;Date"
+NAV_ALL_HEADER = ("Scheme Code;ISIN Div Payout/ ISIN Growth;ISIN Div Reinvestment;Scheme Name;Net Asset Value;"
+                  "Repurchase Price;Sale Price;Date")
+
+
+def test_nav_text_columns_are_found_by_header():
+    nav_open = "\n".join([
+        NAV_OPEN_HEADER, "",
+        "Open Ended Schemes(Equity Scheme - Large Cap Fund)", " ",
+        "Some Mutual Fund",
+        "100001;INF000000001;INF000000002;Fund A - Dividend;12.3456;10-Oct-2026",
+        "100002;INF000000003;-;Fund B - Growth;123.4;10-Oct-2026",
+        "12345;INF000000004;-;Fund C - 5 digit code;20.0;10-Oct-2026",
+        "ABCDEF;INF000000005;-;Fund D - not a code;30.0;10-Oct-2026",
+        "100003;INF000000006;-;Fund E - old NAV;40.0;10-Oct-2023",
+        "100004;INF000000007;-;Fund F - no NAV;N.A.;10-Oct-2026",
+    ])
+    nav_df = nav.parse_nav_text(nav_open)
+    assert nav_df["isin"].tolist() == ["INF000000001", "INF000000003"]
+    assert nav_df["isin_reinvest"].tolist() == ["INF000000002", "-"]
+    assert nav_df["nav"].tolist() == [12.3456, 123.4]
+    assert nav_df["nav_date"].tolist() == [pd.Timestamp(2026, 10, 10)] * 2
+    assert len(nav.parse_nav_text(nav_open, min_year=2023)) == 3
+
+    # NAVAll archive - Net Asset Value, not the Repurchase or Sale Price after it
+    nav_all = "\n".join([NAV_ALL_HEADER, "",
+                         "100001;INF000000001;INF000000002;Fund A - Dividend;12.3456;12.22;12.47;31-Jan-2018",
+                         "100002;INF000000003;-;Fund B - Growth;123.4;;;31-Jan-2018"])
+    nav_df = nav.parse_nav_text(nav_all, min_year=2018)
+    assert nav_df["nav"].tolist() == [12.3456, 123.4]
+    assert nav_df["nav_date"].tolist() == [pd.Timestamp(2018, 1, 31)] * 2
+
+
+def test_nav_text_rows_without_isin_are_not_saved():
+    nav_df = nav.parse_nav_text("\n".join([
+        NAV_OPEN_HEADER,
+        "100001;;INF000000002;Fund A - Dividend;12.5;10-Oct-2026",
+        "100002;;-;Fund B - Growth;20.0;10-Oct-2026",
+        "100003;INF000000003;;Fund C - Growth;30.0;10-Oct-2026",
+    ]))
+    assert len(nav_df) == 3 and nav_df["isin"].isna().tolist() == [True, True, False]
+    records = nav.records_from_df(nav_df, include_reinvest=True)
+    assert records["isin"].tolist() == [b"INF000000003"]
+    assert records["nav"].tolist() == [30.0]
+
+
+def test_rows_without_isin_are_dropped():
+    nav_df = pd.DataFrame({"isin": ["INF000000001", np.nan, None],
+                           "isin_reinvest": ["INF000000002", "INF000000003", np.nan],
+                           "nav": [10.0, 20.0, 30.0],
+                           "nav_date": ["10-Oct-2026", "10-Oct-2026", "2026-10-10"]})
+    records = nav.records_from_df(nav_df, include_reinvest=True)
+    assert records["isin"].tolist() == [b"INF000000001", b"INF000000002"]
+    assert records["nav"].tolist() == [10.0, 10.0]
+
+
+
+def test_nav_matrix_of_empty_history(tmp_path):
+    history = nav.NAVHistory(history_file=tmp_path / "nav_history.bin", archive_folder=tmp_path)
+    navs, nav_dates = history.nav_matrix(["INF000000001", "INF000000002"], [date(2024, 1, 31)], with_dates=True)
+    assert navs.shape == (2, 1) and np.isnan(navs).all()
+    assert (nav_dates == 0).all()
+    assert history.nav_as_of("INF000000001", date(2024, 1, 31)) == (None, None)
+
+
+def test_unreadable_history_file_is_set_aside(tmp_path, capsys):
+    history_file = tmp_path / "nav_history.bin"
+    history_file.write_bytes(b"not a NAV history file")
+    history = nav.NAVHistory(history_file=history_file, archive_folder=tmp_path)
+
+    assert np.isnan(history.nav_matrix(["INF000000001"], [date(2024, 1, 31)])).all()
+    assert "WARNING" in capsys.readouterr().out
+    assert [path.read_bytes() for path in tmp_path.glob("nav_history.bin.unreadable-*")] == [b"not a NAV history file"]
+
+    history.append(nav.records_from_df(pd.DataFrame({"isin": ["INF000000001"], "nav": [10.0],
+                                                     "nav_date": ["10-Jan-2024"]})))
+    reloaded = nav.NAVHistory(history_file=history_file, archive_folder=tmp_path)
+    assert reloaded.nav_as_of("INF000000001", date(2024, 1, 31)) == (10.0, date(2024, 1, 10))
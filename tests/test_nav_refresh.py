@@ -0,0 +1,109 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import model.nav as nav
+from model.nav import NAV
+
+ETAG = '"v1"'
+NAV_TEXT = ("Scheme Code;ISIN Div Payout/ ISIN Growth;ISIN Div Reinvestment;Scheme Name;Net Asset Value;Date\n"
+            "\nOpen Ended Schemes(Equity Scheme - Large Cap Fund)\n\n" +
+            "".join(f"{100001 + i};INF00000{i:04};-;Scheme {i};{10 + i}.5;10-Oct-2026\n" for i in range(200))
+            ).encode()
+
+
+class AMFIHandler(BaseHTTPRequestHandler):
+    # NAV text with an ETag - honours If-None-Match and Range/If-Range (unless can_resume is off)
+    requests = []
+    can_resume = True
+
+    def do_GET(self):
+        self.requests.append(dict(self.headers))
+        if self.headers.get("If-None-Match") == ETAG:
+            self.send_response(304)
+            self.send_header("ETag", ETAG)
+            self.end_headers()
+            return
+        body, status = NAV_TEXT, 200
+        if self.headers.get("Range"):
+            if not self.can_resume:
+                self.send_response(416)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            if self.headers.get("If-Range") == ETAG:
+                start = int(self.headers["Range"].removeprefix("bytes=").rstrip("-"))
+                body, status = NAV_TEXT[start:], 206
+        self.send_response(status)
+        self.send_header("ETag", ETAG)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def amfi(monkeypatch):
+    monkeypatch.setattr(AMFIHandler, "requests", [])
+    monkeypatch.setattr(AMFIHandler, "can_resume", True)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), AMFIHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield AMFIHandler, f"http://127.0.0.1:{server.server_port}/NAVOpen.txt"
+    server.shutdown()
+    server.server_close()
+
+
+def nav_store(url, tmp_path, **kwargs):
+    return NAV(nav_url=url, nav_csv_file=tmp_path / "nav.csv", **kwargs)
+
+
+def test_download_then_not_modified(amfi, tmp_path):
+    handler, url = amfi
+    store = nav_store(url, tmp_path).load(background=False)
+    assert len(store.nav_lookup) == 200
+    assert store.nav_and_date("INF000000007")[0] == 17.5
+
+    store = nav_store(url, tmp_path)     # Restart - served from the snapshot, AMFI asked only for changes
+    store.load(background=False)
+    store.refresh(force=True)
+    assert [request.get("If-None-Match") for request in handler.requests] == [None, ETAG]
+    assert store.version == 1 and len(store.nav_lookup) == 200
+
+
+def test_no_request_within_ttl(amfi, tmp_path):
+    handler, url = amfi
+    nav_store(url, tmp_path).load(background=False)
+    nav_store(url, tmp_path).load(background=False)
+    assert len(handler.requests) == 1
+
+    nav_store(url, tmp_path, refresh_ttl=0).load(background=False)
+    assert len(handler.requests) == 2
+
+
+def test_interrupted_download_is_resumed(amfi, tmp_path):
+    handler, url = amfi
+    store = nav_store(url, tmp_path)
+    store.download_part_file.write_bytes(NAV_TEXT[:1000])
+    store._save_refresh_state(part_validator=ETAG)
+
+    store.load(background=False)
+    assert handler.requests[0]["Range"] == "bytes=1000-"
+    assert len(store.nav_lookup) == 200
+    assert not store.download_part_file.exists()
+
+
+def test_download_is_retried_in_full_if_it_cannot_be_resumed(amfi, tmp_path):
+    handler, url = amfi
+    handler.can_resume = False
+    store = nav_store(url, tmp_path)
+    store.download_part_file.write_bytes(b"stale part")
+    store._save_refresh_state(part_validator=ETAG)
+
+    store.load(background=False)
+    assert [request.get("Range") for request in handler.requests] == ["bytes=10-", None]
+    assert len(store.nav_lookup) == 200
+    assert nav.read_nav_snapshot(store.nav_snapshot_file)[0].shape == (200,)
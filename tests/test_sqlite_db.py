@@ -0,0 +1,111 @@
+import threading
+from contextlib import closing
+
+import pytest
+
+import model.investment_file as investment_file
+import model.sqlite_db as sqlite_db
+from model.investment_file import InvestmentFileManager, SQLiteInvestmentManager
+from model.mf_master import MFSchemeMaster
+
+USER = "test_user"
+
+
+def txn(date, quantity=10.0, price=100.0):
+    return {"date": date, "type": "buy", "quantity": quantity, "price": price, "tax": 0.0, "source": "test"}
+
+
+def record(isin, *txns):
+    return {"ISIN": isin, "Folio": "F1", "SchemeName": f"Scheme {isin}", "Transactions": list(txns)}
+
+
+@pytest.fixture
+def user(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(MFSchemeMaster, "_instances", {})
+    InvestmentFileManager(USER, "Test Investor").add_investment(record("INF000000001", txn("2024-01-01")))
+    MFSchemeMaster(USER).add_scheme("INF000000001", "Scheme INF000000001", "2024-01-01")
+    sqlite_db.migrate_from_json(USER)
+    monkeypatch.setattr(MFSchemeMaster, "_instances", {})
+    return USER
+
+
+def test_investor_changes_are_written_to_database(user):
+    manager = investment_file.get_one(user, "Test Investor")
+    assert isinstance(manager, SQLiteInvestmentManager)
+    with manager.batch():
+        manager.add_investment(record("INF000000001", txn("2024-02-01")))
+        manager.add_investment(record("INF000000002", txn("2024-02-01")))
+    manager.update_scheme_name("INF000000002", "F1", "Renamed")
+
+    loaded = investment_file.get_one(user, "Test Investor")
+    assert loaded.investments == manager.investments
+    assert investment_file.get_all_investor_names(user) == ["Test Investor"]
+
+
+def test_mf_master_autosave_is_kept_when_initialized_again(user):
+    MFSchemeMaster(user).autosave = False
+    mf_master = MFSchemeMaster(user)    # E.g. by an Investor in a loader process
+    mf_master.add_scheme("INF000000002", "Scheme INF000000002", "2024-02-01")
+
+    assert mf_master.autosave is False
+    with closing(sqlite_db.connect(user)) as db:
+        assert list(sqlite_db.read_schemes(db)) == ["INF000000001"]
+
+
+def test_database_is_used_from_other_threads(user):
+    mf_master = MFSchemeMaster(user)
+    manager = investment_file.get_one(user, "Test Investor")
+    errors = []
+
+    def rerun():    # Streamlit reruns the script on another thread
+        try:
+            MFSchemeMaster(user).add_scheme("INF000000002", "Scheme INF000000002", "2024-02-01")
+            manager.add_investment(record("INF000000002", txn("2024-02-01")))
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=rerun)
+    thread.start()
+    thread.join()
+    assert errors == []
+    assert mf_master.exists("INF000000002")
+    assert len(investment_file.get_one(user, "Test Investor").investments) == 2
+
+
+@pytest.fixture
+def statements(monkeypatch):
+    # SQL run on the connections opened by sqlite_db
+    statements = []
+    sqlite3_connect = sqlite_db.sqlite3.connect
+
+    def connect(*args, **kwargs):
+        db = sqlite3_connect(*args, **kwargs)
+        db.set_trace_callback(statements.append)
+        return db
+
+    monkeypatch.setattr(sqlite_db.sqlite3, "connect", connect)
+    return statements
+
+
+def test_scheme_changes_write_only_their_row(user, statements):
+    mf_master = MFSchemeMaster(user)
+    version = sqlite_db.data_version(user)
+    mf_master.add_scheme("INF000000002", "Scheme INF000000002", "2024-02-01")
+    mf_master.update_scheme("INF000000001", exit_load_days=30, tags=["Equity"])
+    assert not any("DELETE" in statement for statement in statements)
+    assert sum(statement.startswith("INSERT INTO schemes") for statement in statements) == 2
+
+    with closing(sqlite_db.connect(user)) as db:
+        schemes = sqlite_db.read_schemes(db)
+    assert list(schemes) == ["INF000000001", "INF000000002"]
+    assert (schemes["INF000000001"]["exit_load_days"], schemes["INF000000001"]["tags"]) == (30, ["equity"])
+    assert schemes["INF000000002"]["scheme_name"] == "Scheme INF000000002"
+    assert sqlite_db.data_version(user) == version + 2
+
+
+def test_connections_do_not_create_the_schema(user, statements):
+    sqlite_db.data_version(user)
+    assert not any("CREATE" in statement or "INSERT" in statement for statement in statements)
+    with closing(sqlite_db.connect(user)) as db:
+        assert db.execute("PRAGMA journal_mode").fetchone()[0] == "wal"   # Set by the migration
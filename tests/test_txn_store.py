@@ -0,0 +1,305 @@
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import model.nav as nav
+from model.investment_file import Investment, Transaction
+from model.txn_store import TxnStore, LTCG, match_fifo
+
+FMV = 130.0
+
+
+def equity_store(transactions):
+    store = TxnStore([Investment(ISIN="INF000000001", Folio="1", SchemeName="Equity Fund",
+                                 Transactions=[Transaction(*txn, 0.0, "test") for txn in transactions])])
+    store.set_tax_flags(0, False, True, True, 365)     # Equity - STCG/LTCG after a year
+    return store
+
+
+@pytest.fixture(autouse=True)
+def fmv(monkeypatch):
+    monkeypatch.setattr(nav, "nav_on_31012018", lambda isin: FMV)
+
+
+def test_grandfathering_only_for_units_bought_by_31_jan_2018_and_sold_from_1_apr_2018():
+    store = equity_store([
+        ("2015-01-01", "buy", 10, 100.0),
+        ("2016-01-01", "buy", 10, 100.0),
+        ("2017-06-01", "sell", -10, 120.0),     # Sold before 2018 - actual gain
+        ("2019-01-01", "buy", 10, 150.0),
+        ("2019-06-01", "sell", -10, 140.0),     # Bought before 31-Jan-2018, sold after - grandfathered
+        ("2021-06-01", "sell", -10, 200.0),     # Bought after 31-Jan-2018 - actual gain
+    ])
+    taxes = store.lot_taxes()[store.lot_rows(0)]
+    assert list(store.lots["sell_date"][store.lot_rows(0)]) == [
+        date(2017, 6, 1).toordinal(), date(2019, 6, 1).toordinal(), date(2021, 6, 1).toordinal()]
+    assert all(taxes["tax_class"] == LTCG)
+
+    pre_2018_sale, grandfathered, post_2018_buy = taxes
+    assert pre_2018_sale["fmv"] == 0.0
+    assert pre_2018_sale["deemed_coa"] == 100.0
+    assert pre_2018_sale["ltcg"] == pytest.approx(200.0)
+
+    assert grandfathered["fmv"] == FMV
+    assert grandfathered["deemed_coa"] == FMV      # max(100, min(140, 130))
+    assert grandfathered["ltcg"] == pytest.approx(100.0)
+
+    assert post_2018_buy["fmv"] == 0.0
+    assert post_2018_buy["deemed_coa"] == 150.0
+    assert post_2018_buy["ltcg"] == pytest.approx(500.0)
+
+
+def test_sale_between_31_jan_and_1_apr_2018_is_not_grandfathered():
+    store = equity_store([
+        ("2016-01-01", "buy", 10, 100.0),
+        ("2018-03-15", "sell", -10, 140.0),
+    ])
+    taxes = store.lot_taxes()[store.lot_rows(0)]
+    assert taxes["deemed_coa"][0] == 100.0
+    assert taxes["ltcg"][0] == pytest.approx(400.0)
+
+
+# Realized LTCG of the sample data by FY (of sales) as in the baseline - up to FY 2015-16, before any of the
+# sample funds had an FMV in the baseline (it grandfathered units of its few FMV funds sold before 2018 too)
+BASELINE_LTCG = {"2005-06": 12083.06, "2007-08": 124357.99, "2008-09": -60398.15, "2009-10": -105242.13,
+                 "2010-11": 42548.75, "2013-14": 17830.84, "2014-15": 366877.95, "2015-16": 630948.26}
+
+
+def test_sample_data_lots_sold_before_2018_are_not_grandfathered(monkeypatch):
+    from types import SimpleNamespace
+    import model.investment_file as investment_file
+    from model.investor import Investor
+    from model.mf_master import MFSchemeMaster
+
+    monkeypatch.undo()      # Actual FMVs
+    monkeypatch.chdir(Path(__file__).resolve().parent.parent)
+    mf_master = MFSchemeMaster("Hemant")
+    mf_master.autosave = False
+    user = SimpleNamespace(user_id="Hemant", mf_master=mf_master)
+
+    ltcg_by_fy = {}
+    for name in investment_file.get_all_investor_names("Hemant"):
+        for investment in Investor(user, name).investments:
+            for txn in investment.matched_txns:
+                if txn.sell_date < nav.GRANDFATHERED_SALES_FROM:
+                    assert txn.fmv_31_01_2018 == 0.0
+                    assert txn.deemed_coa == txn.buy_txn.price
+                if txn.is_taxable_at_ltcg:
+                    ltcg_by_fy[txn.fy] = ltcg_by_fy.get(txn.fy, 0.0) + txn.ltcg
+    for fy, ltcg in BASELINE_LTCG.items():
+        assert ltcg_by_fy[fy] == pytest.approx(ltcg, abs=0.01), fy
+    assert ltcg_by_fy["2017-18"] > 15_00_000    # Was understated to about 1.4L by grandfathering
+
+
+# ---------- FIFO matching ----------
+
+def step_match(buys, sells):
+    """
+    Reference - the earlier step by step FIFO matcher of one investment. buys and sells are [(units, date)].
+    Returns (lots as (buy, sell, units), unmatched units of buys and of sells, error as (kind, sell, buy) or None).
+    """
+    unmatched_buys, unmatched_sells = [units for units, _ in buys], [units for units, _ in sells]
+    if not buys:
+        return [], unmatched_buys, unmatched_sells, ("no_buy", None, None)
+    lots = []
+    i_sell, i_buy = 0, 0
+    while i_sell < len(sells):
+        if i_buy >= len(buys):
+            return lots, unmatched_buys, unmatched_sells, ("overflow", i_sell, None)
+        if sells[i_sell][1] < buys[i_buy][1]:
+            return lots, unmatched_buys, unmatched_sells, ("order", i_sell, i_buy)
+        matched_units = min(unmatched_sells[i_sell], unmatched_buys[i_buy])
+        lots.append((i_buy, i_sell, matched_units))
+        unmatched_sells[i_sell] = round(unmatched_sells[i_sell] - matched_units, 4)
+        unmatched_buys[i_buy] = round(unmatched_buys[i_buy] - matched_units, 4)
+        if unmatched_sells[i_sell] <= 0:
+            i_sell += 1
+        if unmatched_buys[i_buy] <= 0:
+            i_buy += 1
+    return lots, unmatched_buys, unmatched_sells, None
+
+
+def vectorized_match(folios):
+    # match_fifo of all the folios ([(buys, sells)]) at once, split back into step_match results per folio
+    arrays = {}
+    for side in (0, 1):
+        txns = [(folio, units, txn_date) for folio, txns in enumerate(folios) for units, txn_date in txns[side]]
+        arrays[side] = (np.array([t[0] for t in txns], dtype=np.int64), np.array([t[1] for t in txns], dtype=float),
+                        np.array([t[2] for t in txns], dtype=np.int64))
+    buy_positions, sell_positions, units, unmatched_buys, unmatched_sells, errors = match_fifo(
+        *arrays[0], *arrays[1], len(folios))
+    buy_starts = np.searchsorted(arrays[0][0], np.arange(len(folios) + 1))
+    sell_starts = np.searchsorted(arrays[1][0], np.arange(len(folios) + 1))
+    lot_folios = arrays[0][0][buy_positions]
+    results = []
+    for folio in range(len(folios)):
+        in_folio = lot_folios == folio
+        lots = [(buy - buy_starts[folio], sell - sell_starts[folio], lot_units) for buy, sell, lot_units in
+                zip(buy_positions[in_folio].tolist(), sell_positions[in_folio].tolist(), units[in_folio].tolist())]
+        error = errors.get(folio)
+        if error is not None:
+            error = (error[0],) + tuple(None if position is None else int(position) - starts[folio]
+                                        for position, starts in zip(error[1:], (sell_starts, buy_starts)))
+        results.append((lots, unmatched_buys[buy_starts[folio]:buy_starts[folio + 1]].tolist(),
+                        unmatched_sells[sell_starts[folio]:sell_starts[folio + 1]].tolist(), error))
+    return results
+
+
+def assert_same_matching(vectorized, reference):
+    lots, unmatched_buys, unmatched_sells, error = vectorized
+    ref_lots, ref_unmatched_buys, ref_unmatched_sells, ref_error = reference
+    assert [lot[:2] for lot in lots] == [lot[:2] for lot in ref_lots]
+    assert [lot[2] for lot in lots] == pytest.approx([lot[2] for lot in ref_lots], abs=1e-9)
+    assert unmatched_buys == pytest.approx(ref_unmatched_buys, abs=1e-9)
+    assert unmatched_sells == pytest.approx(ref_unmatched_sells, abs=1e-9)
+    assert error == ref_error
+
+
+D = date(2020, 1, 1).toordinal()
+
+FOLIOS = {
+    "partial lot splits": ([(10, D), (5, D + 1)], [(3, D + 2), (9, D + 3), (2, D + 4)]),
+    "4 decimal units": ([(0.1, D), (0.2, D), (1.00004, D + 1)], [(0.3, D + 2), (0.5, D + 3)]),
+    "unsold units": ([(10.1234, D), (4.5, D + 1)], [(12.0001, D + 2)]),
+    "order": ([(10, D), (10, D + 5)], [(4, D + 1), (8, D + 2)]),
+    "overflow": ([(10, D), (2.5, D + 1)], [(6, D + 2), (7, D + 3), (1, D + 4)]),
+    "no_buy": ([], [(5, D)]),
+    "no sells": ([(5, D)], []),
+}
+
+
+@pytest.mark.parametrize("name", FOLIOS)
+def test_fifo_matching_is_same_as_step_by_step(name):
+    folio = FOLIOS[name]
+    # Matched on its own and among all the other folios
+    assert_same_matching(vectorized_match([folio])[0], step_match(*folio))
+    all_folios = list(FOLIOS.values())
+    assert_same_matching(vectorized_match(all_folios)[all_folios.index(folio)], step_match(*folio))
+
+
+def test_fifo_matching_errors_and_unmatched_sells():
+    partial, order, overflow, no_buy = vectorized_match(
+        [FOLIOS["partial lot splits"], FOLIOS["order"], FOLIOS["overflow"], FOLIOS["no_buy"]])
+    assert partial[0] == [(0, 0, 3.0), (0, 1, 7.0), (1, 1, 2.0), (1, 2, 2.0)] and partial[2:] == ([0.0, 0.0, 0.0], None)
+    assert partial[1] == [0.0, 1.0]
+    assert order[3] == ("order", 1, 1) and order[0] == [(0, 0, 4.0), (0, 1, 6.0)] and order[2] == [0.0, 2.0]
+    assert overflow[3] == ("overflow", 1, None) and overflow[2] == [0.0, 0.5, 1.0]
+    assert no_buy[0] == [] and no_buy[2] == [5.0] and no_buy[3] == ("no_buy", None, None)
+
+
+def test_fifo_matching_of_random_folios_is_same_as_step_by_step():
+    rng = np.random.default_rng(0)
+    folios = []
+    for _ in range(300):
+        buys, sells, txn_date, held = [], [], D, 0.0
+        for _ in range(rng.integers(0, 40)):
+            txn_date += int(rng.integers(0, 3))
+            units = round(float(rng.uniform(0.001, 500)), int(rng.integers(0, 5)))
+            if held > 0 and rng.random() < 0.4:
+                # Mostly at most what is held - sometimes more (overflow) or dated back (order error)
+                units = min(units, round(held, 4)) if rng.random() < 0.95 else units + 1
+                if units <= 0:      # Txns of 0 units are not matched (the step matcher made 0 unit lots of them)
+                    continue
+                sells.append((units, txn_date - (30 if rng.random() < 0.03 else 0)))
+                held -= units
+            elif units > 0:
+                buys.append((units, txn_date))
+                held += units
+        if buys and rng.random() < 0.05:
+            sells.append((round(max(held, 0) + 1, 4), txn_date + 1))  # More than held at the end (overflow)
+        folios.append((buys, sells))
+    results = vectorized_match(folios)
+    assert {result[3][0] for result in results if result[3]} == {"order", "overflow", "no_buy"}
+    for result, folio in zip(results, folios):
+        assert_same_matching(result, step_match(*folio))
+
+
+# ---------- Appended txns ----------
+
+def investment_state(store, investment):
+    # Txns, lots and errors of an investment - txn rows as positions among its txns (rows differ once appended)
+    rows = store.txn_rows(investment)
+    positions = {row: i for i, row in enumerate(rows.tolist())}
+    lots = store.lots[store.lot_rows(investment)]
+    error = store.match_errors.get(investment)
+    if error is not None:
+        error = (error[0],) + tuple(None if row is None else positions[int(row)] for row in error[1:])
+    return (store.txns[rows][["txn_date", "type", "units", "price", "tax", "amount", "cumm_balance",
+                              "unmatched_units"]].tolist(),
+            [positions[row] for row in store.date_ordered_rows(investment)],
+            [(positions[buy], positions[sell]) for buy, sell in zip(lots["buy"].tolist(), lots["sell"].tolist())],
+            lots[["buy_date", "sell_date", "units", "buy_amount", "sell_amount", "stamp_duty", "stt", "pnl",
+                  "fy"]].tolist(),
+            float(store.holdings[investment]), error,
+            None if investment not in store.balance_errors else positions[store.balance_errors[investment]])
+
+
+def fund(isin, transactions):
+    return Investment(ISIN=isin, Folio="1", SchemeName="Fund",
+                      Transactions=[Transaction(*txn, 0.5, "test") for txn in transactions])
+
+
+def appended_store(investment_recs, cut_dates):
+    # Store of the txns of each investment dated before its cut date, with the rest appended a date at a time -
+    # investments without a cut date are added (with all their txns) after the others
+    earlier = [Investment(rec.ISIN, rec.Folio, rec.SchemeName, [txn for txn in rec.Transactions if txn.date < cut])
+               for rec, cut in zip(investment_recs, cut_dates) if cut is not None]
+    store = TxnStore(earlier)
+    for investment, (rec, cut) in enumerate(zip([rec for rec, cut in zip(investment_recs, cut_dates) if cut],
+                                                [cut for cut in cut_dates if cut])):
+        for txn_date in sorted({txn.date for txn in rec.Transactions if txn.date >= cut}):
+            txn_recs = [txn for txn in rec.Transactions if txn.date == txn_date]
+            assert store.can_append(investment, txn_recs)
+            store.append_txns(investment, txn_recs)
+    for rec, cut in zip(investment_recs, cut_dates):
+        if cut is None:
+            store.add_investment(rec)
+    return store
+
+
+def test_appending_sells_to_fully_matched_investment_is_same_as_rebuild():
+    sold_out = [("2020-01-01", "buy", 10, 100.0), ("2020-02-01", "sell", -10, 110.0)]
+    zero_sell = [("2020-03-01", "sell", 0, 120.0)]
+    oversell = [("2020-03-01", "sell", -2, 120.0)]
+    for transactions in (sold_out + zero_sell, sold_out + oversell):
+        rebuilt = TxnStore([fund("INF000000001", transactions)])
+        appended = appended_store([fund("INF000000001", transactions)], ["2020-03-01"])
+        assert investment_state(appended, 0) == investment_state(rebuilt, 0)
+    # No open lots left and nothing more sold is not an error (it was marked "no_buy")
+    assert 0 not in appended_store([fund("INF000000001", sold_out + zero_sell)], ["2020-03-01"]).match_errors
+    assert TxnStore([fund("INF000000001", sold_out + oversell)]).match_errors[0][0] == "overflow"
+    assert appended_store([fund("INF000000001", sold_out + oversell)], ["2020-03-01"]).match_errors[0][0] == "overflow"
+
+
+def test_appended_txns_are_same_as_rebuild():
+    rng = np.random.default_rng(0)
+    investment_recs, cut_dates = [], []
+    for i in range(100):
+        transactions, txn_date, held = [], D, 0.0
+        for _ in range(rng.integers(1, 30)):
+            txn_date += int(rng.integers(0, 20))
+            units = round(float(rng.uniform(0.001, 500)), int(rng.integers(0, 5)))
+            if held > 0 and rng.random() < 0.4:
+                # Mostly part of what is held - sometimes all of it, or more (overflow) or nothing
+                units = [round(held, 4), round(held, 4) + 1, 0.0][int(rng.integers(0, 3))] \
+                    if rng.random() < 0.2 else min(units, round(held, 4))
+                transactions.append((date.fromordinal(txn_date).isoformat(), "sell", -units, 120.0))
+                held = round(held - units, 4)
+                if held < 0:    # Nothing can be appended after an overflow
+                    break
+            else:
+                transactions.append((date.fromordinal(txn_date).isoformat(), "buy", units, 100.0))
+                held = round(held + units, 4)
+        dates = sorted({txn[0] for txn in transactions})
+        investment_recs.append(fund(f"INF{i:09d}", transactions))
+        # Cut after the first date (an investment is loaded only if it has a buy txn), or added as a new one
+        cut_dates.append(dates[int(rng.integers(1, len(dates)))] if len(dates) > 1 and i % 10 else None)
+    appended = appended_store(investment_recs, cut_dates)
+    order = [i for i, cut in enumerate(cut_dates) if cut] + [i for i, cut in enumerate(cut_dates) if not cut]
+    rebuilt = TxnStore([investment_recs[i] for i in order])
+    assert {error for error, *_ in rebuilt.match_errors.values()} == {"overflow"}
+    assert appended.isins == rebuilt.isins
+    for investment in range(len(investment_recs)):
+        assert investment_state(appended, investment) == investment_state(rebuilt, investment)
@@ -0,0 +1,147 @@
+import json
+
+import pytest
+
+import model.investment_file as investment_file
+import model.user as user_module
+from model.investor import Investor
+from model.mf_master import MFSchemeMaster
+from model.user import User
+
+USER = "Hemant"
+
+
+def investor_state(investor):
+    store = investor.txn_store
+    return ([(investment.isin, investment.folio, investment.store_id) for investment in investor.investments],
+            store.txns.tobytes(), store.lots.tobytes(), store.lot_taxes().tobytes())
+
+
+@pytest.fixture
+def removed_schemes(sample_data):
+    # Schemes (held by more than one investor too) missing from the MF master - added by the investors loading
+    mf_master_file = sample_data / USER / "mf_master.json"
+    schemes = json.loads(mf_master_file.read_text())
+    held = {}
+    for investor_file in sorted((sample_data / USER).glob("*_investments.json")):
+        for record in json.loads(investor_file.read_text()):
+            held.setdefault(record["ISIN"], set()).add(investor_file.name)
+    shared = sorted(isin for isin, files in held.items() if len(files) > 1 and isin in schemes)
+    single = sorted(isin for isin, files in held.items() if len(files) == 1 and isin in schemes)
+    removed = shared[:2] + single[:2]
+    assert len(removed) == 4
+    mf_master_file.write_text(json.dumps({isin: scheme for isin, scheme in schemes.items() if isin not in removed}))
+    return removed
+
+
+def test_parallel_loading_gives_same_investors_as_sequential(removed_schemes, monkeypatch, capsys):
+    added = []
+    add_scheme = MFSchemeMaster.add_scheme
+
+    def counted_add_scheme(mf_master, isin, *args, **kwargs):
+        if not mf_master.exists(isin):
+            added.append(isin)
+        return add_scheme(mf_master, isin, *args, **kwargs)
+
+    monkeypatch.setattr(MFSchemeMaster, "add_scheme", counted_add_scheme)
+    monkeypatch.setattr(user_module, "PARALLEL_MIN_INVESTORS", 1)
+    monkeypatch.setattr(user_module.os, "cpu_count", lambda: 2)
+    user = User(USER)
+    assert "(parallel)" in capsys.readouterr().out
+    assert sorted(added) == sorted(removed_schemes)     # Each added once, by this process
+    saved = json.loads(user.mf_master.filepath.read_text())
+    assert all(isin in saved for isin in removed_schemes)
+
+    sequential = user.load_all_investors(parallel=False)
+    assert "(sequential)" in capsys.readouterr().out
+    assert list(sequential) == list(user.investors)
+    for name, investor in user.investors.items():
+        assert investor.user is user
+        assert investor_state(investor) == investor_state(sequential[name])
+    assert len(added) == len(removed_schemes)
+
+
+def investment_views(investor):
+    return {(investment.isin, investment.folio): (
+        investment.holding,
+        [(txn.txn_date, txn.type, txn.units, txn.unmatched_units, txn.cumm_balance) for txn in investment.txns],
+        [(matched.buy_txn.txn_date, matched.sell_txn.txn_date, matched.units, matched.pnl, matched.ltcg)
+         for matched in investment.matched_txns]) for investment in investor.investments}
+
+
+def test_appended_changes_are_same_as_reload(sample_data):
+    # Investor loaded from its file without the txns of the last dates (and without some investments), which are
+    # then added to the file - appended to the loaded investor, they give the same investments as a reload
+    investor_file = sorted((sample_data / USER).glob("*_investments.json"))[0]
+    records = json.loads(investor_file.read_text())
+    earlier = []
+    for i, record in enumerate(records):
+        dates = sorted({txn["date"] for txn in record["Transactions"]})
+        if i % 5 and len(dates) > 1:
+            cut = dates[-1 - i % min(3, len(dates) - 1)]
+            earlier.append(dict(record, Transactions=[txn for txn in record["Transactions"] if txn["date"] < cut]))
+    investor_file.write_text(json.dumps(earlier))
+
+    user = User(USER)
+    investor_files = {name: investment_file.get_one(USER, name) for name in user.investors}
+    name = next(name for name, file in investor_files.items() if file.filepath.name == investor_file.name)
+    investor_file = investor_files[name]
+    for record in records:
+        investor_file.add_investment(record)
+    assert len(investor_file.changes) > len(records) // 2
+    investor = user.investors[name]
+    assert investor.append_changes(investor_file)
+    assert investment_views(investor) == investment_views(Investor(user, name))
+
+
+def load_user(capsys):
+    # (user, whether it was built from the data files)
+    user = user_module.load_user(USER)
+    out = capsys.readouterr().out
+    assert ("from saved snapshot" in out) != ("Loaded 3 investors" in out)
+    return user, "Loaded 3 investors" in out
+
+
+def test_snapshot_gives_same_user_as_data_files(sample_data, capsys):
+    built, rebuilt = load_user(capsys)
+    assert rebuilt and user_module.snapshot_file(USER).exists()
+    loaded, rebuilt = load_user(capsys)
+    assert not rebuilt
+    assert list(loaded.investors) == list(built.investors)
+    for name, investor in loaded.investors.items():
+        assert investor.user is loaded
+        assert investor_state(investor) == investor_state(built.investors[name])
+        assert investment_views(investor) == investment_views(built.investors[name])
+
+
+def test_snapshot_is_rebuilt_when_data_files_change(sample_data, capsys, monkeypatch):
+    load_user(capsys)
+    investor_file = sorted((sample_data / USER).glob("*_investments.json"))[0]
+    records = json.loads(investor_file.read_text())
+    investor_file.write_text(json.dumps(records[1:]))
+    user, rebuilt = load_user(capsys)
+    assert rebuilt
+    assert not load_user(capsys)[1]
+
+    # Journaled change (the JSON file is unchanged)
+    name = next(name for name in user.investors
+                if investment_file.get_one(USER, name).filepath.name == investor_file.name)
+    investment_file.get_one(USER, name).add_investment(records[0])
+    user, rebuilt = load_user(capsys)
+    assert rebuilt and (records[0]["ISIN"], records[0]["Folio"]) in user.investors[name].folios
+    assert not load_user(capsys)[1]
+
+    monkeypatch.setattr(user_module, "SNAPSHOT_FORMAT_VERSION", user_module.SNAPSHOT_FORMAT_VERSION + 1)
+    assert load_user(capsys)[1]
+    assert not load_user(capsys)[1]
+
+
+def test_unreadable_snapshot_is_rebuilt(sample_data, capsys):
+    load_user(capsys)
+    snapshot = user_module.snapshot_file(USER)
+    snapshot.write_bytes(snapshot.read_bytes()[:len(snapshot.read_bytes()) // 2])
+    user = user_module.load_user(USER)
+    out = capsys.readouterr().out
+    assert f"Ignoring {snapshot} - " in out and ("UnpicklingError" in out or "EOFError" in out)
+    assert "Loaded 3 investors" in out and len(user.investors) == 3
+    assert not load_user(capsys)[1]
@@ -0,0 +1,177 @@
+import math
+from datetime import date
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from pyxirr import InvalidPaymentsError, xirr as pyxirr
+
+import model.xirr as xirr_module
+from model.xirr import XirrCache, xirr_many, coalesce_cashflows, _to_dates
+
+
+@pytest.fixture
+def solver_calls(monkeypatch):
+    # XIRR of fake investments whose cashflows do not converge (pyxirr returns None)
+    calls = []
+    cashflows = (np.array([737425, 737426, 737427]), np.array([-100.0, 300.0, -250.0]))
+    monkeypatch.setattr(xirr_module, "xirr_cache", XirrCache())
+    monkeypatch.setattr(xirr_module.nav, "nav_version", lambda: 0)
+    monkeypatch.setattr(xirr_module, "get_cashflows", lambda investment, *args: cashflows)
+
+    def pyxirr(dates, amounts):
+        calls.append(len(amounts))
+        return None
+
+    monkeypatch.setattr(xirr_module, "pyxirr", pyxirr)
+    return calls
+
+
+def test_cached_none_is_a_hit():
+    cache = XirrCache()
+    assert cache.get("key") is xirr_module._MISSING
+    cache.put("key", None)
+    assert cache.get("key") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_xirr_that_does_not_converge_is_solved_once(solver_calls):
+    investment = SimpleNamespace(txns_version=1)
+    assert xirr_module.xirr(investment) is None
+    assert xirr_module.xirr(investment) is None
+    assert len(solver_calls) == 1
+
+
+def test_batch_xirr_reuses_cached_none(solver_calls):
+    investments = [SimpleNamespace(txns_version=1), SimpleNamespace(txns_version=2)]
+    xirr_module.xirr(investments[0])
+    xirr_module.xirr(investments[1])
+
+    rates = xirr_module.batch_xirr(investments)
+    assert all(math.isnan(rate) for rate in rates)
+    assert len(solver_calls) == 2
+    assert xirr_module.xirr_cache.misses == 2
+
+
+# ---------- Batch XIRR ----------
+
+D = date(2020, 1, 1).toordinal()
+
+
+def random_series(rng, n, redeemed_share=0.2):
+    # Purchases and redemptions with the value of the holding at the end - all have an XIRR (redemptions
+    # between purchases can give a series more than one)
+    series = []
+    for _ in range(n):
+        count = int(rng.integers(1, 60))
+        ordinals = np.sort(D + rng.integers(0, 3000, count))
+        amounts = -rng.uniform(100, 10_000, count)
+        redeemed = rng.random(count) < redeemed_share
+        redeemed[0] = False     # Starts with a purchase
+        amounts[redeemed] *= -0.5
+        ordinals = np.append(ordinals, ordinals[-1] + int(rng.integers(1, 400)))
+        amounts = np.append(amounts, -amounts[amounts < 0].sum() * rng.uniform(0.5, 2.5))
+        series.append(coalesce_cashflows(ordinals, amounts))
+    return series
+
+
+def pyxirr_of(ordinals, amounts):
+    return pyxirr(_to_dates(ordinals), amounts)
+
+
+def test_xirr_many_is_same_as_pyxirr():
+    series = random_series(np.random.default_rng(0), 200)
+    rates = xirr_many(series)
+    assert rates == pytest.approx([pyxirr_of(*cashflows) for cashflows in series], rel=1e-6, abs=1e-9)
+
+
+def test_xirr_many_of_empty_or_zero_series_is_0():
+    empty = (np.empty(0, dtype=np.int64), np.empty(0))
+    zero = (np.array([D, D + 100]), np.array([0.0, 0.0]))
+    series = random_series(np.random.default_rng(1), 1)[0]
+    assert xirr_many([]).tolist() == []
+    assert xirr_many([empty, zero]).tolist() == [0.0, 0.0]
+    rates = xirr_many([empty, series, zero])
+    assert rates[[0, 2]].tolist() == [0.0, 0.0]
+    assert rates[1] == pytest.approx(pyxirr_of(*series), rel=1e-6)
+
+
+def test_xirr_many_falls_back_to_pyxirr_per_series(monkeypatch):
+    fallback = []
+
+    def counted_pyxirr(dates, amounts):
+        fallback.append(len(amounts))
+        return pyxirr(dates, amounts)
+
+    monkeypatch.setattr(xirr_module, "pyxirr", counted_pyxirr)
+    series = random_series(np.random.default_rng(2), 5, redeemed_share=0)
+    no_rate = (np.array([D, D + 1, D + 2]), np.array([-100.0, 300.0, -250.0]))   # pyxirr has no answer either
+
+    assert xirr_many(series) == pytest.approx([pyxirr_of(*cashflows) for cashflows in series], rel=1e-6)
+    assert fallback == []
+    # Newton is stopped before it converges - every series is solved on its own
+    rates = xirr_many(series + [no_rate], max_iterations=1)
+    assert fallback == [len(amounts) for _, amounts in series] + [3]
+    assert rates[:-1] == pytest.approx([pyxirr_of(*cashflows) for cashflows in series], rel=1e-9)
+    assert math.isnan(rates[-1])
+
+
+def test_xirr_many_gives_pyxirr_rate_of_series_with_more_than_one_rate():
+    # About 16.1 and -0.14 are both rates of this series - pyxirr gives -0.14 (Newton from 0.1 finds 16.1)
+    ordinals = D + np.array([0, 17, 225, 296, 388, 476, 616, 674, 713, 840, 880, 948, 1019, 1111, 1155, 1163, 1206,
+                             1251, 1294, 1446, 1453, 1674, 1771, 1951, 2050, 2229, 2395, 2705])
+    amounts = np.array([-232, 553, 2858, -2963, -2944, -7710, -9916, -5367, -126, 3027, -7583, -1895, -2505, -2163,
+                        -7863, 4659, -8045, -3900, -7833, -5503, -4156, -4618, -1424, -9721, -8253, -2164, -6485,
+                        59668], dtype=float)
+    assert pyxirr(_to_dates(ordinals), amounts, guess=0.1) == pytest.approx(16.1, abs=0.05)
+    rate = pyxirr_of(ordinals, amounts)
+    assert rate == pytest.approx(-0.14, abs=0.005)
+    assert xirr_many([(ordinals, amounts)])[0] == rate
+
+
+# ---------- XIRR at month ends ----------
+
+def cold_xirr(investments, as_on_date):
+    # pyxirr of the txns up to the date and the value then held - at the latest of the last txn price, NAV
+    # history and current NAV known on the date
+    dates, amounts = [], []
+    for investment in investments:
+        txns = [txn for txn in investment.txns if txn.txn_date <= as_on_date]
+        if not txns:
+            continue
+        dates += [txn.txn_date for txn in txns]
+        amounts += [-txn.amount if txn.type == "buy" else txn.amount for txn in txns]
+        price, price_date = txns[-1].price, txns[-1].txn_date
+        history_nav, history_date = xirr_module.nav.nav_as_of(investment.isin, as_on_date)
+        if history_date is not None and history_date > price_date:
+            price, price_date = history_nav, history_date
+        if price_date < investment.nav_date <= as_on_date:
+            price = investment.nav
+        held = round(sum(txn.units for txn in txns), 4)
+        if held > 0:
+            dates.append(as_on_date)
+            amounts.append(held * price)
+    try:
+        return pyxirr(dates, amounts)
+    except InvalidPaymentsError:     # E.g. no redemption or value yet
+        return None
+
+
+def test_xirr_series_is_same_as_cold_pyxirr_at_month_ends(sample_data):
+    from model.user import User
+    investments = [investment for investor in User("Hemant") for investment in investor.investments]
+    dates, rates, portfolio_rates = xirr_module.xirr_series(investments)
+    # Month ends of NAV history (31-Jan-2018), of txn prices only and of current NAVs
+    columns = [dates.index(date(2018, 1, 31)), 12, len(dates) // 2, len(dates) - 13, len(dates) - 1]
+    solved = 0
+    for column in columns:
+        as_on_date = dates[column]
+        for investment, rate in zip(investments, rates[:, column]):
+            expected = cold_xirr([investment], as_on_date)
+            if expected is None:
+                assert math.isnan(rate)
+            else:
+                assert rate == pytest.approx(expected, rel=1e-6, abs=1e-9), (investment.isin, as_on_date)
+                solved += 1
+        assert portfolio_rates[column] == pytest.approx(cold_xirr(investments, as_on_date), rel=1e-6)
+    assert solved > 100
@@ -1,5 +1,6 @@
 from babel.numbers import format_currency, format_decimal, format_compact_currency
 from datetime import datetime, date, timedelta
+from functools import lru_cache
 import pickle
 from pathlib import Path
 
@@ -121,6 +122,13 @@ def normalize_date(date_str):
             continue
     raise ValueError(f"Unknown date format: {date_str}")
 
+@lru_cache(maxsize=None)
+def iso_date_ordinal(date_str):
+    # Ordinal of a YYYY-MM-DD date - each date string is parsed once (txn dates repeat across txns and folios)
+    if len(date_str) == 10 and date_str[4] == date_str[7] == "-" and date_str.isascii():
+        return date.fromisoformat(date_str).toordinal()
+    return datetime.strptime(date_str, "%Y-%m-%d").toordinal()    # Also accepts unpadded month/day
+
 def is_date_in_fy(date_obj, fy_str):
     # Example fy_str: "2025-24"
     start_year = int(fy_str.split('-')[0])
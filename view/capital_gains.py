@@ -31,12 +31,12 @@ class CapitalGainsMain():
         stcg = []
         ltcg_pnl = []
         for inv in self.investments:
-            sale_value.append(sum(txn.sell_amount for txn in inv.matched_txns if txn.fy == fy))
-            asr_cg.append(sum(txn.pnl for txn in inv.matched_txns if txn.is_taxable_at_slab_rate and txn.fy == fy)
+            sale_value.append(sum(txn.sell_amount for txn in inv.matched_txns_in_fy(fy)))
+            asr_cg.append(sum(txn.pnl for txn in inv.matched_txns_in_fy(fy) if txn.is_taxable_at_slab_rate)
                             if inv.is_under_asr else 0)
-            stcg.append(sum(txn.pnl for txn in inv.matched_txns if txn.is_taxable_at_stcg and txn.fy == fy)
+            stcg.append(sum(txn.pnl for txn in inv.matched_txns_in_fy(fy) if txn.is_taxable_at_stcg)
                             if inv.is_under_stcg else 0)
-            ltcg_pnl.append(sum(txn.ltcg for txn in inv.matched_txns if txn.is_taxable_at_ltcg and txn.fy == fy)
+            ltcg_pnl.append(sum(txn.ltcg for txn in inv.matched_txns_in_fy(fy) if txn.is_taxable_at_ltcg)
                             if inv.is_under_ltcg else 0)
 
         cols = metrics_box.columns(4, gap="small", width=800)
@@ -77,12 +77,12 @@ class CGInvestments:
         ltcg = []
         tax_treatment = []
         for inv in self.investments:
-            sale_value.append(sum(txn.sell_amount for txn in inv.matched_txns if txn.fy == fy))
-            asr_cg.append(sum(txn.pnl for txn in inv.matched_txns if txn.is_taxable_at_slab_rate and txn.fy == fy)
+            sale_value.append(sum(txn.sell_amount for txn in inv.matched_txns_in_fy(fy)))
+            asr_cg.append(sum(txn.pnl for txn in inv.matched_txns_in_fy(fy) if txn.is_taxable_at_slab_rate)
                             if inv.is_under_asr else 0)
-            stcg.append(sum(txn.pnl for txn in inv.matched_txns if txn.is_taxable_at_stcg and txn.fy == fy)
+            stcg.append(sum(txn.pnl for txn in inv.matched_txns_in_fy(fy) if txn.is_taxable_at_stcg)
                             if inv.is_under_stcg else 0)
-            ltcg.append(sum(txn.ltcg for txn in inv.matched_txns if txn.is_taxable_at_ltcg and txn.fy == fy)
+            ltcg.append(sum(txn.ltcg for txn in inv.matched_txns_in_fy(fy) if txn.is_taxable_at_ltcg)
                             if inv.is_under_ltcg else 0)
             # tax_treatment.append("Equity" if inv.is_under_stcg else "Debt" if not inv.is_under_ltcg else "Other")
             tax_treatment.append(inv.tax_treatment)
@@ -168,7 +168,7 @@ class CGSellTxns:
     def txns_report(self):
         # Slab Rate (debt) PnL for selected FY
         fy = self.options.selected_fy
-        sell_txns = [txn for txn in self.investment.sell_txns if txn.fy == fy]
+        sell_txns = self.investment.sell_txns_in_fy(fy)
         asr_gain = []
         stcg = []
         ltcg = []
@@ -220,7 +220,7 @@ class CGMatchedTxns:
     def txns_report(self):
         # Sell Date | Units | Price | Sell Amount | Buy Date | Price | Buy Amount | ASR Gain | STCG | LTCG
         fy = self.options.selected_fy
-        txns = [txn for txn in self.investment.matched_txns if txn.fy == fy]
+        txns = self.investment.matched_txns_in_fy(fy)
 
         df = pd.DataFrame({
             "sell_date": [txn.sell_txn.txn_date for txn in txns],
@@ -319,8 +319,7 @@ class CGQuarterly:
             to_date = quarterly_gain[qtr]["to_date"]
             for investment in self.investments:
                 # Filter on txns for current quarter dates window
-                txns_in_quarter = [txn for txn in investment.matched_txns
-                                   if from_date <= txn.sell_txn.txn_date <= to_date]
+                txns_in_quarter = investment.matched_txns_between(from_date, to_date)
                 if not txns_in_quarter:
                     continue
 
@@ -442,11 +441,11 @@ class CGQuarterlyInvestments:
         for investment in self.investments:
             txns = []
             if self.gain_type == "ASR" and investment.is_under_asr:
-                txns = [txn for txn in investment.matched_txns if txn.fy == fy and txn.is_taxable_at_slab_rate]
+                txns = [txn for txn in investment.matched_txns_in_fy(fy) if txn.is_taxable_at_slab_rate]
             elif self.gain_type == "STCG" and investment.is_under_stcg:
-                txns = [txn for txn in investment.matched_txns if txn.fy == fy and txn.is_taxable_at_stcg]
+                txns = [txn for txn in investment.matched_txns_in_fy(fy) if txn.is_taxable_at_stcg]
             elif self.gain_type == "LTCG" and investment.is_under_ltcg:
-                txns = [txn for txn in investment.matched_txns if txn.fy == fy and txn.is_taxable_at_ltcg]
+                txns = [txn for txn in investment.matched_txns_in_fy(fy) if txn.is_taxable_at_ltcg]
 
             if not any(txns):
                 # Skip loop if investment is of not selected_gain_type or no sell transactions in FY
@@ -532,7 +531,7 @@ class CGQuarterlyTransactions:
         # Sell Date | Units | Price | Sell Amount| Buy Date | Price | Buy Amount | Gain Type | Gain ₹ | Quarter
         fy = self.options.selected_fy
 
-        txns = [txn for txn in self.investment.matched_txns if txn.fy == fy]
+        txns = self.investment.matched_txns_in_fy(fy)
 
         quarter = []
         from_date = [None] * 5
@@ -603,7 +602,7 @@ class Section112A:
         self.applicable_ltcg = None
 
     def show_report(self):
-        # A. Units purchased before 31-01-2018
+        # A. Units purchased before 31-01-2018 (and sold from 01-04-2018 - earlier sales are not grandfathered)
         # Investment | ISIN | Sale Date | Units | Sale Price | Sale Amount | Buy Date | Buy Price | Buy Amount | FMV @31.01.2018 | Deemed COA | LTCG
         # Deemed COA (cost of acquisition) = max(buy Price, min(Sale Price, FMV @31.01.2018))
         # LTCG = (Sale Price - Deemed COA) x Units
@@ -611,7 +610,7 @@ class Section112A:
         # B. Units purchased after 31-01-2018
         # Sale Consideration | Cost of acquisition | Expenses | LTCG
 
-        gf_date = datetime.strptime("2018-01-31", "%Y-%m-%d").date()
+        gf_date = nav.GRANDFATHERING_DATE
         fy = self.options.selected_fy
         # investments = self.investor.get_filtered_investments(sold_in_fy=self.options.selected_fy)
         investments = [investment for investment in self.investments if investment.is_under_ltcg]
@@ -619,16 +618,17 @@ class Section112A:
         txns = []
         for investment in investments:
             # All units eligible for LTCG that were sold in current FY but bought before GF date
-            txns += [txn for txn in investment.matched_txns
-                     if txn.fy == fy and txn.buy_date <= gf_date and txn.is_taxable_at_ltcg]
+            txns += [txn for txn in investment.matched_txns_in_fy(fy)
+                     if txn.buy_date <= gf_date and txn.sell_date >= nav.GRANDFATHERED_SALES_FROM
+                     and txn.is_taxable_at_ltcg]
 
         units = [txn.units for txn in txns]
         sale_price = [txn.sell_txn.price for txn in txns]
         buy_price = [txn.buy_txn.price for txn in txns]
         pnl = [txn.pnl for txn in txns]
 
-        fmv_31_01_2018 = [nav.nav_on_31012018(txn.sell_txn.investment.isin) for txn in txns]
-        deemed_coa = [max(cp, min(sp, fmv)) for cp, sp, fmv in zip(buy_price, sale_price, fmv_31_01_2018)]
+        fmv_31_01_2018 = [txn.fmv_31_01_2018 for txn in txns]
+        deemed_coa = [txn.deemed_coa for txn in txns]
         # ltcg = [(sp - coa)* u for sp, coa, u in zip(sale_price, deemed_coa, units)]
 
         df1 = pd.DataFrame({
@@ -730,7 +730,7 @@ class Section112A:
         ltcg = []
         tax_treatment = []
         for investment in investments:
-            txns = [txn for txn in investment.matched_txns if txn.fy == fy and txn.buy_date > gf_date and txn.is_taxable_at_ltcg]
+            txns = [txn for txn in investment.matched_txns_in_fy(fy) if txn.buy_date > gf_date and txn.is_taxable_at_ltcg]
             if txns:
                 index.append(f"{investment.scheme_name} /{investment.folio}")
                 sale_amount.append(sum([txn.sell_amount for txn in txns]))
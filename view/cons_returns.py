@@ -2,7 +2,7 @@ import streamlit as st
 import pandas as pd
 
 import utils.utils as utils
-from model.xirr import xirr
+from model.xirr import xirr, batch_xirr, xirr_series
 import view.options as user_options
 
 class Returns:
@@ -32,13 +32,13 @@ class Returns:
         self.df1 = pd.DataFrame({})
         values = [((i.nav * i.holding) if i.nav is not None else 0) for i in self.investments]
         realized_returns = [i.get_realized_pnl() for i in self.investments]
-        realized_xirr = [i.realized_xirr() for i in self.investments]
+        realized_xirr = batch_xirr(self.investments, realized=True)
         unrealized_returns = [i.get_unrealized_pnl() for i in self.investments]
-        unrealized_xirr = [i.unrealized_xirr() for i in self.investments]
+        unrealized_xirr = batch_xirr(self.investments, unrealized=True)
         # investor_name = [i.investor.name.split()[0] for i in self.investments]
         taxes = [i.total_taxes_paid for i in self.investments]
         total_returns = [r+u for r, u, t in zip(realized_returns, unrealized_returns, taxes)]
-        total_irr = [i.total_xirr() for i in self.investments]
+        total_irr = batch_xirr(self.investments)
 
         self.df1 = pd.DataFrame({
             # "name": investor_name,
@@ -157,6 +157,28 @@ class Returns:
 
         return self
 
+    def show_xirr_chart(self):
+        # Month end XIRR of the investments in the table (and of the selected investment, if any) - solved only
+        # when the chart is turned on
+        if len(self.investments) == 0 or not st.toggle("XIRR at month ends", key="show_xirr_chart_flag"):
+            return self
+        dates, rates, portfolio_rates = xirr_series(self.investments)
+        chart_df = pd.DataFrame({"Portfolio": portfolio_rates * 100}, index=pd.to_datetime(dates))
+        series_start = [min(i.txns[0].txn_date for i in self.investments)]
+        if len(self.selected_rows) > 0:
+            investment = self.investments[self.selected_rows[0]]
+            chart_df[investment.scheme_short_name] = rates[self.selected_rows[0]] * 100
+            series_start.append(investment.txns[0].txn_date)
+        # XIRR of less than a year of history is mostly noise (annualized) - not shown
+        for column, start_date in zip(chart_df.columns, series_start):
+            chart_df.loc[chart_df.index < pd.Timestamp(start_date) + pd.Timedelta(days=365), column] = None
+
+        st.line_chart(chart_df, x_label="Month end", y_label="XIRR %")
+        st.caption("Holdings are valued at the latest NAV known at each month end. NAV history has only "
+                   "31-Jan-2018 and the NAVs downloaded since the app was deployed - at most other month ends "
+                   "the price of the last transaction before it is used, so the XIRR there is approximate.")
+        return self
+
     def prepare_report2(self):
         # Realized Returns Txn Level Report (Matched units of matched Txns)
         investment = self.investments[self.selected_rows[0]]
@@ -284,6 +306,7 @@ report = Returns()
     .prepare_df1()
     .format_df1()
     .show_df1()
+    .show_xirr_chart()
  )
 if len(report.selected_rows) > 0:
     (report
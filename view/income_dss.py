@@ -72,33 +72,27 @@ class RedemptionsDSS:
         sequence = [i+1 for i in range(len(self.investments))]
         investment_column = [f"{investment.scheme_name} /{investment.folio}" for investment in self.investments]
         investment_tax_type_column = [investment.tax_treatment for investment in self.investments]
-        sold_value_fy = [sum([txn.sell_amount for txn in investment.matched_txns
-                             if txn.fy == fy]) for investment in self.investments]
-        sold_for_asr = [sum([txn.sell_amount for txn in investment.matched_txns
-                             if txn.fy == fy and
-                             (txn.is_taxable_at_slab_rate if self.tax_type == "ASR" else txn.is_taxable_at_stcg)])
+        sold_value_fy = [sum([txn.sell_amount for txn in investment.matched_txns_in_fy(fy)])
+                         for investment in self.investments]
+        sold_for_asr = [sum([txn.sell_amount for txn in investment.matched_txns_in_fy(fy)
+                             if (txn.is_taxable_at_slab_rate if self.tax_type == "ASR" else txn.is_taxable_at_stcg)])
                             for investment in self.investments]
-        real_asr = [sum([txn.pnl for txn in investment.matched_txns
-                             if txn.fy == fy and
-                             (txn.is_taxable_at_slab_rate if self.tax_type=="ASR" else txn.is_taxable_at_stcg)])
+        real_asr = [sum([txn.pnl for txn in investment.matched_txns_in_fy(fy)
+                             if (txn.is_taxable_at_slab_rate if self.tax_type=="ASR" else txn.is_taxable_at_stcg)])
                              for investment in self.investments]
-        sold_for_ltcg = [sum([txn.sell_amount for txn in investment.matched_txns
-                            if txn.fy == fy and txn.is_taxable_at_ltcg]) for investment in self.investments]
-        real_ltcg = [sum([txn.pnl for txn in investment.matched_txns
-                            if txn.fy == fy and txn.is_taxable_at_ltcg]) for investment in self.investments]
+        sold_for_ltcg = [sum([txn.sell_amount for txn in investment.matched_txns_in_fy(fy)
+                            if txn.is_taxable_at_ltcg]) for investment in self.investments]
+        real_ltcg = [sum([txn.pnl for txn in investment.matched_txns_in_fy(fy)
+                            if txn.is_taxable_at_ltcg]) for investment in self.investments]
         current_value = [investment.value for investment in self.investments]
-        asr_sellable_value = [sum([txn.unsold_value for txn in investment.buy_txns
-                             if txn.load_free_from_date < as_on_date < txn.ltcg_from_date]) for investment in self.investments]
-        asr_sellable_units = [sum([txn.unsold_units for txn in investment.buy_txns
-                             if txn.load_free_from_date < as_on_date < txn.ltcg_from_date]) for investment in self.investments]
-        asr_unreal_gain = [sum([txn.unrealized_pnl for txn in investment.buy_txns
-                             if txn.load_free_from_date < as_on_date < txn.ltcg_from_date]) for investment in self.investments]
-        ltcg_sellable_value = [sum([txn.unsold_value for txn in investment.buy_txns
-                             if as_on_date >= txn.ltcg_from_date]) for investment in self.investments]
-        ltcg_sellable_units = [sum([txn.unsold_units for txn in investment.buy_txns
-                             if as_on_date >= txn.ltcg_from_date]) for investment in self.investments]
-        ltcg_unreal_gain = [sum([txn.unrealized_pnl for txn in investment.buy_txns
-                             if as_on_date >= txn.ltcg_from_date]) for investment in self.investments]
+        # Units sellable for the tax type and for LTCG as on the slider date, from each investment's timeline
+        redeemable = [investment.redeemable_on(as_on_date) for investment in self.investments]
+        asr_sellable_units  = [asr[0] for asr, _ in redeemable]
+        asr_sellable_value  = [asr[1] for asr, _ in redeemable]
+        asr_unreal_gain     = [asr[2] for asr, _ in redeemable]
+        ltcg_sellable_units = [ltcg[0] for _, ltcg in redeemable]
+        ltcg_sellable_value = [ltcg[1] for _, ltcg in redeemable]
+        ltcg_unreal_gain    = [ltcg[2] for _, ltcg in redeemable]
 
         # if st.session_state["pin-metrics"]:
         #     with metrics_box.container(horizontal=True, vertical_alignment="center",):
@@ -228,7 +222,7 @@ class DssTxns:
         # Realized Gains
         # Sold Units (matched Txns) during the Financial Year
         # Sale Date | Sale Value | Sale Price | Units | Buy Date | Buy Value | Buy Price | ASR/STCG Gain | LTCG | CAGR $
-        txns = [txn for txn in self.investment.matched_txns if txn.fy == self.fy]
+        txns = self.investment.matched_txns_in_fy(self.fy)
         df1 = pd.DataFrame({
             "sequence": [i + 1 for i in range(len(txns))],
             "sale_date": [txn.sell_date for txn in txns],
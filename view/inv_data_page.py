@@ -175,7 +175,8 @@ def cas_pdf_uploading():
         submit = st.form_submit_button("Upload")
     if submit and cas_pdf_file is not None:
         with st.spinner('Parsing CAS pdf File...'):
-            status = cas_json.pdf2json(st.session_state.user.user_id, cas_pdf_file, pw)
+            investor_file = cas_json.pdf2json(st.session_state.user.user_id, cas_pdf_file, pw)
+            st.session_state.user.refresh_investor(investor_file)
         st.toast(f"CAS PDF File {cas_pdf_file.name} Uploaded and Parsed Successfully", icon=":material/thumb_up:",
                  duration="long")
         st.balloons()
@@ -256,7 +257,7 @@ def manual_entry(investor_files):
         })
         investor_file.save()
         st.success("Submitted Investment/Transaction")
-        del st.session_state.user
+        st.session_state.user.refresh_investor(investor_file)
 
     # if isinstance(selected_investment, Investment):
     if not is_new_investment:
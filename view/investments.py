@@ -3,7 +3,7 @@ import pandas as pd
 
 import utils.utils as utils
 import view.options as user_options
-from model.xirr import xirr
+from model.xirr import xirr, batch_xirr
 
 class Investments:
     TABLE_VIEW_TYPES = ["Holdings", "Returns", f"FY {utils.get_fy()}"]
@@ -172,12 +172,12 @@ class Investments:
     def show_returns_df(self, investments, taxation_column=False):
         values = [i.value for i in investments]
         realized_returns = [i.get_realized_pnl() for i in investments]
-        realized_xirr = [i.realized_xirr() for i in investments]
+        realized_xirr = batch_xirr(investments, realized=True)
         unrealized_returns = [i.get_unrealized_pnl() for i in investments]
-        unrealized_xirr = [i.unrealized_xirr() for i in investments]
+        unrealized_xirr = batch_xirr(investments, unrealized=True)
         taxes = [i.total_taxes_paid for i in investments]
         total_returns = [r+u for r, u, t in zip(realized_returns, unrealized_returns, taxes)]
-        total_irr = [i.total_xirr() for i in investments]
+        total_irr = batch_xirr(investments)
         df = pd.DataFrame({
             # "name": investor_name,
             "values": values,